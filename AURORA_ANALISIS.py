@@ -0,0 +1,263 @@
+import os
+import sys
+import csv
+import json
+import logging
+import argparse
+import datetime
+
+# ===============================================================================
+# ANALÍTICA DE LOS REGISTROS DE BOTONES
+# ===============================================================================
+# Recorre fila por fila todos los logs/botones_events_*.csv con memoria
+# constante y acumula los totales en un índice incremental, que recuerda hasta
+# qué byte se leyó cada archivo: cada corrida solo lee las filas nuevas.
+#
+#   python AURORA_ANALISIS.py
+#   python AURORA_ANALISIS.py --json > analisis.json
+#   python AURORA_ANALISIS.py --reconstruir
+#
+# AURORA_SOFTWARE.py usa la popularidad de este índice para decidir qué capas
+# precargar al arrancar.
+
+VERSION_INDICE = 3
+NOMBRE_INDICE = "analisis_indice.json"
+PREFIJO_EVENTOS = "botones_events_"
+# archivo_capa falta en los registros anteriores a que se agregara
+COLUMNAS_EVENTOS = ['timestamp', 'jugador', 'boton', 'accion', 'nombre_capa', 'archivo_capa']
+# Límites (segundos) de los tramos del histograma de permanencia
+LIMITES_PERMANENCIA_S = [5, 15, 30, 60, 120, 300, 600, 1800]
+# Dentro de la app los avisos van al registro aurora_*.log; main() los manda a stderr
+logger = logging.getLogger(__name__)
+
+def indice_vacio():
+    return {
+        "version": VERSION_INDICE,
+        "archivos": {},
+        "totales": {
+            "filas": 0,
+            "filas_invalidas": 0,
+            "activaciones": {},
+            "permanencia": {},
+            "jugadores": {},
+            "reinicios": {"total": 0, "por_dia": {}, "por_hora": {}},
+            "concurrencia": {},
+            "capas_reinicio": [],
+            # capa -> instante de activación aún sin desactivar; es común a todos
+            # los archivos porque la app rota el CSV a medianoche y por tamaño
+            "activas": {},
+        },
+    }
+
+def leer_indice(ruta_indice):
+    try:
+        with open(ruta_indice, encoding='utf-8') as archivo:
+            indice = json.load(archivo)
+        if indice.get("version") == VERSION_INDICE:
+            return indice
+    except (OSError, ValueError):
+        pass
+    return indice_vacio()
+
+def guardar_indice(indice, ruta_indice):
+    # Reemplazo atómico: la app y la corrida nocturna pueden coincidir
+    temporal = f"{ruta_indice}.{os.getpid()}.tmp"
+    with open(temporal, 'w', encoding='utf-8') as archivo:
+        json.dump(indice, archivo, ensure_ascii=False)
+    os.replace(temporal, ruta_indice)
+
+# ===============================================================================
+# ACUMULACIÓN FILA POR FILA
+# ===============================================================================
+def clave_capa(nombre, archivo=''):
+    # Dos capas pueden compartir nombre con archivos distintos: la clave sigue a
+    # AURORA_CAPAS.identidad_capa. Las filas sin archivo quedan por nombre
+    return f"{nombre} ({archivo})" if archivo else nombre
+
+def activaciones_capa(activaciones, nombre, archivo=''):
+    # Suma también lo registrado solo por nombre, antes de la columna archivo_capa
+    total = activaciones.get(clave_capa(nombre, archivo), 0)
+    if archivo:
+        total += activaciones.get(nombre, 0)
+    return total
+
+def sumar(diccionario, clave, cantidad=1):
+    diccionario[clave] = diccionario.get(clave, 0) + cantidad
+
+def registrar_permanencia(totales, capa, segundos):
+    datos = totales["permanencia"].setdefault(
+        capa, {"n": 0, "total_s": 0.0, "max_s": 0.0, "histograma": [0] * (len(LIMITES_PERMANENCIA_S) + 1)})
+    datos["n"] += 1
+    datos["total_s"] += segundos
+    datos["max_s"] = max(datos["max_s"], segundos)
+    tramo = next((i for i, limite in enumerate(LIMITES_PERMANENCIA_S) if segundos < limite), len(LIMITES_PERMANENCIA_S))
+    datos["histograma"][tramo] += 1
+
+def procesar_fila(fila, totales):
+    instante = datetime.datetime.fromisoformat(fila['timestamp'])
+    jugador, accion = fila['jugador'], fila['accion']
+    capa = clave_capa(fila['nombre_capa'], fila.get('archivo_capa', ''))
+    activas = totales["activas"]
+    totales["filas"] += 1
+    actividad = totales["jugadores"].setdefault(jugador, {})
+    sumar(actividad, accion)
+
+    if accion == 'reinicio':
+        reinicios = totales["reinicios"]
+        reinicios["total"] += 1
+        sumar(reinicios["por_dia"], instante.strftime('%Y-%m-%d'))
+        sumar(reinicios["por_hora"], f"{instante.hour:02d}")
+        if capa not in totales["capas_reinicio"]:
+            totales["capas_reinicio"].append(capa)
+        return
+    if accion == 'activar':
+        sumar(totales["activaciones"], capa)
+        activas[capa] = fila['timestamp']
+    elif accion == 'desactivar':
+        inicio = activas.pop(capa, None)
+        if inicio is not None:
+            registrar_permanencia(totales, capa, (instante - datetime.datetime.fromisoformat(inicio)).total_seconds())
+    else:
+        return
+
+    # Capas encendidas a la vez (sin contar la pantalla de reinicio), por hora del día
+    encendidas = sum(1 for nombre in activas if nombre not in totales["capas_reinicio"])
+    hora = totales["concurrencia"].setdefault(f"{instante.hour:02d}", {"muestras": 0, "suma": 0, "maximo": 0})
+    hora["muestras"] += 1
+    hora["suma"] += encendidas
+    hora["maximo"] = max(hora["maximo"], encendidas)
+
+def procesar_archivo(ruta, estado, totales):
+    # Lee desde el último byte procesado; una última línea incompleta (la app
+    # sigue escribiendo) queda para la próxima corrida. Devuelve filas leídas
+    filas = 0
+    with open(ruta, 'rb') as archivo:
+        archivo.seek(estado["offset"])
+        for linea in archivo:
+            if not linea.endswith(b'\n'):
+                break
+            estado["offset"] += len(linea)
+            try:
+                valores = next(csv.reader([linea.decode('utf-8')]))
+            except (UnicodeDecodeError, csv.Error, StopIteration):
+                totales["filas_invalidas"] += 1
+                continue
+            if not estado["columnas"]:
+                estado["columnas"] = valores
+                continue
+            fila = dict(zip(estado["columnas"], valores))
+            try:
+                procesar_fila(fila, totales)
+                filas += 1
+            except (KeyError, ValueError):
+                totales["filas_invalidas"] += 1
+    return filas
+
+def actualizar_indice(directorio='logs', ruta_indice=None, reconstruir=False):
+    # Procesa las filas nuevas de todos los CSV y guarda el índice actualizado
+    ruta_indice = ruta_indice or os.path.join(directorio, NOMBRE_INDICE)
+    indice = indice_vacio() if reconstruir else leer_indice(ruta_indice)
+    try:
+        nombres = sorted(n for n in os.listdir(directorio) if n.startswith(PREFIJO_EVENTOS) and n.endswith('.csv'))
+    except OSError:
+        return indice
+    nuevas = 0
+    for nombre in nombres:
+        ruta = os.path.join(directorio, nombre)
+        estado = indice["archivos"].setdefault(nombre, {"offset": 0, "columnas": []})
+        try:
+            if os.path.getsize(ruta) < estado["offset"]:
+                # Archivo reemplazado: sus filas ya sumadas no se pueden descontar
+                logger.warning(f"{nombre} es más corto que lo ya procesado; se vuelve a leer desde el inicio")
+                estado.update(offset=0, columnas=[])
+            if os.path.getsize(ruta) > estado["offset"]:
+                nuevas += procesar_archivo(ruta, estado, indice["totales"])
+        except OSError as e:
+            logger.error(f"Error al leer {ruta}: {e}")
+    if nuevas or reconstruir or not os.path.exists(ruta_indice):
+        try:
+            guardar_indice(indice, ruta_indice)
+        except OSError as e:
+            logger.error(f"Error al guardar índice {ruta_indice}: {e}")
+    indice["filas_nuevas"] = nuevas
+    return indice
+
+def popularidad_capas(directorio='logs'):
+    # Activaciones históricas por clave_capa
+    return dict(actualizar_indice(directorio)["totales"]["activaciones"])
+
+# ===============================================================================
+# REPORTE
+# ===============================================================================
+def resumen(indice, top):
+    totales = indice["totales"]
+    permanencia = {
+        capa: {
+            "sesiones": datos["n"],
+            "promedio_s": round(datos["total_s"] / datos["n"], 1) if datos["n"] else 0,
+            "maximo_s": round(datos["max_s"], 1),
+            "histograma": dict(zip([f"<{limite}s" for limite in LIMITES_PERMANENCIA_S]
+                                   + [f">={LIMITES_PERMANENCIA_S[-1]}s"], datos["histograma"])),
+        }
+        for capa, datos in totales["permanencia"].items()
+    }
+    dias = len(totales["reinicios"]["por_dia"]) or 1
+    return {
+        "archivos": len(indice["archivos"]),
+        "filas": totales["filas"],
+        "filas_nuevas": indice.get("filas_nuevas", 0),
+        "filas_invalidas": totales["filas_invalidas"],
+        "popularidad": sorted(totales["activaciones"].items(), key=lambda par: -par[1])[:top],
+        "permanencia": dict(sorted(permanencia.items(), key=lambda par: -par[1]["sesiones"])),
+        "jugadores": dict(sorted(totales["jugadores"].items())),
+        "reinicios": {
+            "total": totales["reinicios"]["total"],
+            "promedio_por_dia": round(totales["reinicios"]["total"] / dias, 1),
+            "por_hora": dict(sorted(totales["reinicios"]["por_hora"].items())),
+        },
+        "concurrencia_por_hora": {
+            hora: {"promedio": round(datos["suma"] / datos["muestras"], 2), "maximo": datos["maximo"]}
+            for hora, datos in sorted(totales["concurrencia"].items()) if datos["muestras"]
+        },
+    }
+
+def imprimir_resumen(datos):
+    print(f"Archivos: {datos['archivos']}  filas: {datos['filas']} "
+          f"(nuevas: {datos['filas_nuevas']}, inválidas: {datos['filas_invalidas']})")
+    print("\nCapas más activadas:")
+    for capa, cantidad in datos["popularidad"]:
+        print(f"  {cantidad:8d}  {capa}")
+    print("\nPermanencia por capa (sesiones, promedio, máximo):")
+    for capa, permanencia in datos["permanencia"].items():
+        print(f"  {permanencia['sesiones']:8d}  {permanencia['promedio_s']:8.1f} s  {permanencia['maximo_s']:8.1f} s  {capa}")
+    print("\nActividad por jugador:")
+    for jugador, acciones in datos["jugadores"].items():
+        print(f"  Jugador {jugador}: " + ", ".join(f"{accion} {cantidad}" for accion, cantidad in sorted(acciones.items())))
+    reinicios = datos["reinicios"]
+    print(f"\nReinicios: {reinicios['total']} ({reinicios['promedio_por_dia']} por día)")
+    for hora, cantidad in reinicios["por_hora"].items():
+        print(f"  {hora}:00  {cantidad}")
+    print("\nCapas encendidas a la vez por hora (promedio, máximo):")
+    for hora, concurrencia in datos["concurrencia_por_hora"].items():
+        print(f"  {hora}:00  {concurrencia['promedio']:6.2f}  {concurrencia['maximo']:3d}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analítica de los registros de botones de Aurora Australis")
+    parser.add_argument('--logs', default='logs', help="Directorio con los botones_events_*.csv")
+    parser.add_argument('--indice', help=f"Archivo del índice incremental (por omisión <logs>/{NOMBRE_INDICE})")
+    parser.add_argument('--reconstruir', action='store_true', help="Descartar el índice y releer todo")
+    parser.add_argument('--top', type=int, default=30, help="Capas a mostrar en la popularidad")
+    parser.add_argument('--json', action='store_true', help="Salida en JSON")
+    argumentos = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s: %(message)s', stream=sys.stderr)
+
+    indice = actualizar_indice(argumentos.logs, argumentos.indice, argumentos.reconstruir)
+    datos = resumen(indice, argumentos.top)
+    if argumentos.json:
+        print(json.dumps(datos, indent=2, ensure_ascii=False))
+    else:
+        imprimir_resumen(datos)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
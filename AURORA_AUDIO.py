@@ -0,0 +1,154 @@
+import os
+import sys
+import json
+import mmap
+import time
+import struct
+import hashlib
+import argparse
+import threading
+import pygame
+
+# ===============================================================================
+# DECODIFICACIÓN Y CACHÉ EN DISCO DE AUDIO (PCM)
+# ===============================================================================
+# Decodificar un MP3 con pygame.mixer.Sound toma cientos de ms y el PCM ocupa
+# ~10 MB por minuto. Este módulo guarda el PCM ya en el formato del mezclador
+# para que las siguientes ejecuciones lo mapeen a memoria sin decodificar.
+# AURORA_SOFTWARE.py lo usa desde su hilo de audio; también se ejecuta como
+# herramienta para dejar la caché lista en la instalación:
+#
+#   python AURORA_AUDIO.py construir --sonidos C:\SONIDOS "C:\VOZ EN OFF AURORA"
+#
+# El formato del mezclador es la tupla (frecuencia, formato, canales) de
+# pygame.mixer.get_init(); una entrada solo vale para ese mismo formato.
+
+VERSION_PCM = 1
+MAGIA_PCM = b"AURORAP\n"
+ALINEACION_DATOS = 64
+EXTENSIONES_AUDIO = ('.mp3', '.wav', '.ogg')
+
+def bytes_por_segundo(formato_mezclador):
+    frecuencia, formato, canales = formato_mezclador
+    return frecuencia * canales * ((abs(formato) & 0xff) // 8)
+
+def ruta_entrada_pcm(directorio_cache, ruta, formato_mezclador):
+    clave = f"{os.path.normcase(os.path.abspath(ruta))}|{formato_mezclador}|v{VERSION_PCM}"
+    nombre = os.path.splitext(os.path.basename(ruta))[0]
+    resumen = hashlib.sha1(clave.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(directorio_cache, f"{nombre}_{resumen}.pcm")
+
+def escribir_pcm(directorio_cache, ruta, formato_mezclador, pcm, estado):
+    # estado es el os.stat del origen tomado antes de decodificar: si el clip
+    # cambió mientras tanto, el PCM puede ser del anterior y no se guarda
+    actual = os.stat(ruta)
+    if (actual.st_size, actual.st_mtime_ns) != (estado.st_size, estado.st_mtime_ns):
+        return None
+    encabezado = json.dumps({
+        'version': VERSION_PCM,
+        'fuente': os.path.abspath(ruta),
+        'tamano_fuente': estado.st_size,
+        'mtime_ns': estado.st_mtime_ns,
+        'mezclador': list(formato_mezclador),
+        'largo': len(pcm),
+    }).encode('utf-8')
+    inicio_datos = len(MAGIA_PCM) + 4 + len(encabezado)
+
+    os.makedirs(directorio_cache, exist_ok=True)
+    destino = ruta_entrada_pcm(directorio_cache, ruta, formato_mezclador)
+    # Temporal propio del hilo: la app puede decodificar el mismo clip en dos hilos
+    temporal = f"{destino}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporal, 'wb') as archivo:
+        archivo.write(MAGIA_PCM)
+        archivo.write(struct.pack('<I', len(encabezado)))
+        archivo.write(encabezado)
+        archivo.write(b'\0' * (-inicio_datos % ALINEACION_DATOS))
+        archivo.write(pcm)
+    # Reemplazo atómico para que un lector nunca vea una entrada a medio escribir
+    os.replace(temporal, destino)
+    return destino
+
+def leer_pcm(directorio_cache, ruta, formato_mezclador):
+    # Devuelve una vista de memoria sobre el PCM mapeado, o None si la entrada
+    # no existe o ya no corresponde al archivo de origen
+    destino = ruta_entrada_pcm(directorio_cache, ruta, formato_mezclador)
+    try:
+        estado = os.stat(ruta)
+        with open(destino, 'rb') as archivo:
+            if archivo.read(len(MAGIA_PCM)) != MAGIA_PCM:
+                return None
+            (largo,) = struct.unpack('<I', archivo.read(4))
+            encabezado = json.loads(archivo.read(largo).decode('utf-8'))
+            inicio_datos = archivo.tell()
+            inicio_datos += -inicio_datos % ALINEACION_DATOS
+            if (encabezado.get('version') != VERSION_PCM
+                    or encabezado['tamano_fuente'] != estado.st_size
+                    or encabezado['mtime_ns'] != estado.st_mtime_ns
+                    or tuple(encabezado['mezclador']) != tuple(formato_mezclador)
+                    or os.fstat(archivo.fileno()).st_size != inicio_datos + encabezado['largo']):
+                return None
+            if encabezado['largo'] == 0:
+                return memoryview(b'')
+            mapa = mmap.mmap(archivo.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError, KeyError):
+        return None
+    return memoryview(mapa)[inicio_datos:inicio_datos + encabezado['largo']]
+
+def obtener_pcm(ruta, formato_mezclador, directorio_cache=None):
+    # Devuelve (pcm, segundos, desde_cache); requiere pygame.mixer iniciado con
+    # formato_mezclador. Si no hay entrada válida decodifica y la deja escrita
+    inicio = time.perf_counter()
+    if directorio_cache:
+        pcm = leer_pcm(directorio_cache, ruta, formato_mezclador)
+        if pcm is not None:
+            return pcm, time.perf_counter() - inicio, True
+    estado = os.stat(ruta) if directorio_cache else None
+    pcm = pygame.mixer.Sound(ruta).get_raw()
+    if directorio_cache:
+        try:
+            escribir_pcm(directorio_cache, ruta, formato_mezclador, pcm, estado)
+        except OSError:
+            # En Windows una entrada mapeada por otro proceso no se puede reemplazar
+            pass
+    return pcm, time.perf_counter() - inicio, False
+
+# ===============================================================================
+# HERRAMIENTA DE LÍNEA DE COMANDOS
+# ===============================================================================
+def construir_cache(argumentos):
+    # Mismo formato que usa la aplicación con pygame.mixer.init() por omisión
+    os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+    pygame.mixer.init()
+    formato_mezclador = pygame.mixer.get_init()
+    errores = 0
+    for directorio in argumentos.sonidos:
+        try:
+            nombres = sorted(n for n in os.listdir(directorio) if n.lower().endswith(EXTENSIONES_AUDIO))
+        except OSError as e:
+            print(f"{directorio}: ERROR {e}")
+            errores += 1
+            continue
+        for nombre in nombres:
+            try:
+                pcm, segundos, desde_cache = obtener_pcm(os.path.join(directorio, nombre), formato_mezclador,
+                                                         argumentos.cache)
+                estado = "vigente" if desde_cache else "construida"
+                print(f"{nombre}: {estado} ({len(pcm) / bytes_por_segundo(formato_mezclador):.0f} s de audio, "
+                      f"{len(pcm) / 1048576:.1f} MB) {segundos:.2f} s")
+            except Exception as e:
+                errores += 1
+                print(f"{nombre}: ERROR {e}")
+    pygame.mixer.quit()
+    return 1 if errores else 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Caché de audio decodificado de Aurora Australis")
+    subcomandos = parser.add_subparsers(dest='comando', required=True)
+    construir = subcomandos.add_parser('construir', help="Decodificar y guardar el PCM de todos los sonidos")
+    construir.add_argument('--sonidos', nargs='+', default=[r"C:\SONIDOS", r"C:\VOZ EN OFF AURORA"])
+    construir.add_argument('--cache', default=os.path.join('cache', 'audio'))
+    argumentos = parser.parse_args(argv)
+    return construir_cache(argumentos)
+
+if __name__ == '__main__':
+    sys.exit(main())
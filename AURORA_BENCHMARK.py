@@ -0,0 +1,399 @@
+import os
+import sys
+import csv
+import json
+import time
+import random
+import argparse
+import datetime
+import platform
+import threading
+import subprocess
+from PIL import Image, ImageDraw
+import AURORA_CAPAS
+import AURORA_MEMORIA
+
+# ===============================================================================
+# BENCHMARK SIN MONITORES NI JOYSTICKS
+# ===============================================================================
+# Lanza AURORA_SOFTWARE.py con los drivers "dummy" de SDL, imágenes de prueba a
+# resolución real y pulsaciones JOYBUTTONDOWN sintéticas, y reporta en JSON los
+# FPS, los percentiles del tiempo de frame y la memoria pico de cada escenario:
+#
+#   python AURORA_BENCHMARK.py --salida resultados.json
+#   python AURORA_BENCHMARK.py --escenarios capas_gif tormenta_toggles --duracion 20
+#   python AURORA_BENCHMARK.py --comparar version_anterior.json
+#   python AURORA_BENCHMARK.py --repetir logs\botones_events_20250301_090000.csv --factor 20
+#
+# La aplicación entra en modo benchmark cuando la variable de entorno
+# AURORA_BENCHMARK apunta a un guion JSON generado por este script; en ese modo
+# importa este módulo para inyectar los eventos y medir los frames.
+
+ANCHO_CAPA = 3840
+ALTO_CAPA = 1080
+FRAMES_GIF_PRUEBA = 8
+
+ESCENARIOS = {
+    "todas_las_capas": "Activa una a una todas las capas y las mantiene encendidas",
+    "capas_gif": "Activa juntas todas las capas animadas (GIF)",
+    "tormenta_toggles": "Pulsaciones aleatorias cada 40 ms durante todo el escenario",
+    "reinicios": "Enciende varias capas y pulsa el botón de reinicio, una y otra vez",
+}
+
+# Métricas que empeoran al subir (las demás empeoran al bajar)
+METRICAS_MENOR_ES_MEJOR = ("frame_ms_p50", "frame_ms_p95", "frame_ms_p99", "memoria_pico_mb", "arranque_s")
+METRICAS_MAYOR_ES_MEJOR = ("fps", "fps_maximo")
+
+# ===============================================================================
+# CONFIGURACIÓN DE CAPAS Y ESCENARIOS
+# ===============================================================================
+def leer_capas(ruta_app):
+    # Las capas de la aplicación se leen de su capas.json, sin ejecutarla
+    ruta = os.path.join(os.path.dirname(os.path.abspath(ruta_app)), AURORA_CAPAS.NOMBRE_CONFIGURACION)
+    return AURORA_CAPAS.cargar_configuracion(ruta)['capas']
+
+def construir_guion(escenario, acciones, duracion_s, semilla=2025):
+    # Lista de eventos [ms, jugador, boton] según el escenario
+    azar = random.Random(semilla)
+    capas = [(a['jugador'], a['boton']) for a in acciones if not a.get('es_reinicio')]
+    reinicio = next(((a['jugador'], a['boton']) for a in acciones if a.get('es_reinicio')), None)
+    duracion_ms = int(duracion_s * 1000)
+    eventos = []
+
+    if escenario == "todas_las_capas":
+        # Claves sin repetir: dos capas en el mismo botón se encienden juntas
+        for indice, clave in enumerate(dict.fromkeys(capas)):
+            eventos.append([500 + indice * 150, *clave])
+    elif escenario == "capas_gif":
+        gifs = [(a['jugador'], a['boton']) for a in acciones
+                if a.get('archivo', '').lower().endswith('.gif') and not a.get('es_reinicio')]
+        for indice, clave in enumerate(dict.fromkeys(gifs)):
+            eventos.append([500 + indice * 50, *clave])
+    elif escenario == "tormenta_toggles":
+        for instante in range(500, duracion_ms, 40):
+            eventos.append([instante, *azar.choice(capas)])
+    elif escenario == "reinicios":
+        instante = 500
+        while instante < duracion_ms:
+            for clave in azar.sample(capas, 4):
+                eventos.append([instante, *clave])
+                instante += 100
+            instante += 600
+            if reinicio:
+                eventos.append([instante, *reinicio])
+            instante += 800
+    else:
+        raise ValueError(f"Escenario desconocido: {escenario}")
+    return [evento for evento in eventos if evento[0] < duracion_ms]
+
+# ===============================================================================
+# REPETICIÓN DE SESIONES REGISTRADAS
+# ===============================================================================
+def leer_pulsaciones_registradas(rutas, acciones):
+    # Reconstruye las pulsaciones (instante, jugador, boton) desde los CSV de
+    # logs/botones_events_*.csv. Una pulsación deja una fila por cada capa que
+    # cambió, así que solo se cuenta la fila de la primera capa del botón (o la
+    # fila "reinicio" del botón de reinicio)
+    primera_capa = {}
+    for accion in acciones:
+        primera_capa.setdefault((accion['jugador'], accion['boton']), accion)
+    pulsaciones = []
+    for ruta in rutas:
+        with open(ruta, newline='', encoding='utf-8') as archivo:
+            for fila in csv.DictReader(archivo):
+                try:
+                    clave = (int(fila['jugador']), int(fila['boton']))
+                    instante = datetime.datetime.strptime(fila['timestamp'], '%Y-%m-%d %H:%M:%S.%f')
+                except (KeyError, TypeError, ValueError):
+                    continue
+                capa = primera_capa.get(clave)
+                if capa is None:
+                    continue
+                if capa.get('es_reinicio'):
+                    es_pulsacion = fila['accion'] == 'reinicio'
+                else:
+                    es_pulsacion = (fila['accion'] in ('activar', 'desactivar') and fila['nombre_capa'] == capa['nombre']
+                                    and fila.get('archivo_capa', capa.get('archivo', '')) == capa.get('archivo', ''))
+                if es_pulsacion:
+                    pulsaciones.append((instante, *clave))
+    pulsaciones.sort()
+    return pulsaciones
+
+def guion_repeticion(pulsaciones, factor, pausa_maxima_s):
+    # Eventos [ms, jugador, boton, tramo] con el tiempo comprimido por el factor;
+    # el tramo es la hora original para ubicar en el registro dónde se puso lento
+    eventos = []
+    transcurrido = 0.0
+    anterior = None
+    for instante, jugador, boton in pulsaciones:
+        if anterior is not None:
+            pausa = (instante - anterior).total_seconds()
+            transcurrido += min(pausa, pausa_maxima_s) if pausa_maxima_s else pausa
+        anterior = instante
+        eventos.append([500 + int(transcurrido * 1000 / factor), jugador, boton, instante.strftime('%Y-%m-%d %H:00')])
+    return eventos
+
+# ===============================================================================
+# IMÁGENES DE PRUEBA
+# ===============================================================================
+def generar_capa(ruta, azar, ancho, alto):
+    # Capa transparente con manchas de color, como una capa temática del mapa
+    imagen = Image.new("RGBA", (ancho, alto), (0, 0, 0, 0))
+    dibujo = ImageDraw.Draw(imagen)
+    for _ in range(40):
+        x, y = azar.randrange(ancho), azar.randrange(alto)
+        radio = azar.randrange(20, 220)
+        color = (azar.randrange(256), azar.randrange(256), azar.randrange(256), 255)
+        dibujo.ellipse((x - radio, y - radio // 2, x + radio, y + radio // 2), fill=color)
+    for _ in range(30):
+        puntos = [(azar.randrange(ancho), azar.randrange(alto)) for _ in range(4)]
+        dibujo.line(puntos, fill=(255, 255, 255, 255), width=2)
+    imagen.save(ruta)
+
+def generar_gif(ruta, azar, ancho, alto):
+    # Animación con paleta común y un objeto que se desplaza en cada frame
+    fondo = [(azar.randrange(ancho), azar.randrange(alto), azar.randrange(20, 120)) for _ in range(30)]
+    frames = []
+    for indice in range(FRAMES_GIF_PRUEBA):
+        frame = Image.new("P", (ancho, alto), 0)
+        frame.putpalette([0, 0, 0] + [azar.randrange(256) for _ in range(255 * 3)])
+        dibujo = ImageDraw.Draw(frame)
+        for x, y, radio in fondo:
+            dibujo.ellipse((x - radio, y - radio, x + radio, y + radio), fill=1 + (x % 200))
+        x = indice * ancho // FRAMES_GIF_PRUEBA
+        dibujo.rectangle((x, alto // 3, x + 300, alto // 3 + 200), fill=250)
+        frames.append(frame)
+    frames[0].save(ruta, save_all=True, append_images=frames[1:], duration=100, loop=0, transparency=0)
+
+def generar_activos(directorio, archivos, ancho=ANCHO_CAPA, alto=ALTO_CAPA):
+    # Crea las imágenes que falten; las existentes se reutilizan entre corridas
+    os.makedirs(directorio, exist_ok=True)
+    for nombre in sorted(set(archivos)):
+        ruta = os.path.join(directorio, nombre)
+        if os.path.exists(ruta):
+            continue
+        azar = random.Random(nombre)
+        if nombre == "BASE.png":
+            Image.linear_gradient("L").resize((ancho, alto)).convert("RGB").save(ruta)
+        elif nombre == "SPLASH.png":
+            Image.new("RGB", (ancho // 2, alto // 2), (10, 20, 40)).save(ruta)
+        elif nombre.lower().endswith(".gif"):
+            generar_gif(ruta, azar, ancho, alto)
+        else:
+            generar_capa(ruta, azar, ancho, alto)
+        print(f"Imagen de prueba generada: {nombre}", file=sys.stderr)
+
+# ===============================================================================
+# MEDICIÓN DENTRO DE LA APLICACIÓN
+# ===============================================================================
+def memoria_pico_bytes():
+    # Máximo de memoria residente del proceso actual
+    return AURORA_MEMORIA.memoria_proceso()[1] or 0
+
+def percentil(valores, porcentaje):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    posicion = (len(ordenados) - 1) * porcentaje / 100
+    inferior = int(posicion)
+    superior = min(inferior + 1, len(ordenados) - 1)
+    return ordenados[inferior] + (ordenados[superior] - ordenados[inferior]) * (posicion - inferior)
+
+def percentiles_frame(tiempos):
+    return {
+        "frame_ms_p50": round(percentil(tiempos, 50), 3),
+        "frame_ms_p95": round(percentil(tiempos, 95), 3),
+        "frame_ms_p99": round(percentil(tiempos, 99), 3),
+        "frame_ms_max": round(max(tiempos), 3) if tiempos else 0,
+    }
+
+class SesionBenchmark:
+    # Usada por AURORA_SOFTWARE.py en modo benchmark
+    def __init__(self, ruta_guion):
+        self.inicio_proceso = time.perf_counter()
+        with open(ruta_guion, encoding='utf-8') as archivo:
+            self.guion = json.load(archivo)
+        self.tiempos_frame = []
+        self.tiempos_por_tramo = {}
+        self.tramo = None
+        self.inicio_bucle = None
+        self.inicio_frame = None
+
+    @property
+    def fps_objetivo(self):
+        return self.guion.get('fps_objetivo', 0)
+
+    def iniciar(self, pulsar, terminar):
+        # Las pulsaciones se envían desde un hilo para despertar al planificador
+        # aunque esté bloqueado esperando eventos
+        self.inicio_bucle = time.perf_counter()
+
+        def reproducir():
+            for evento in self.guion['eventos']:
+                instante_ms, jugador, boton = evento[:3]
+                espera = self.inicio_bucle + instante_ms / 1000 - time.perf_counter()
+                if espera > 0:
+                    time.sleep(espera)
+                if len(evento) > 3:
+                    self.tramo = evento[3]
+                pulsar(jugador, boton)
+            espera = self.inicio_bucle + self.guion['duracion_s'] - time.perf_counter()
+            if espera > 0:
+                time.sleep(espera)
+            terminar()
+
+        threading.Thread(target=reproducir, daemon=True).start()
+
+    def comenzar_frame(self):
+        self.inicio_frame = time.perf_counter()
+
+    def terminar_frame(self, presentado):
+        # Las vueltas del bucle que no dibujaron nada no cuentan como frame
+        if self.inicio_frame is not None and presentado:
+            duracion_ms = (time.perf_counter() - self.inicio_frame) * 1000
+            self.tiempos_frame.append(duracion_ms)
+            if self.tramo is not None:
+                self.tiempos_por_tramo.setdefault(self.tramo, []).append(duracion_ms)
+        self.inicio_frame = None
+
+    def resultados(self):
+        duracion = time.perf_counter() - self.inicio_bucle if self.inicio_bucle else 0
+        tiempos = self.tiempos_frame
+        media = sum(tiempos) / len(tiempos) if tiempos else 0
+        resultados = {
+            "escenario": self.guion['escenario'],
+            "duracion_s": round(duracion, 2),
+            "frames": len(tiempos),
+            "fps": round(len(tiempos) / duracion, 2) if duracion else 0,
+            "fps_maximo": round(1000 / media, 2) if media else 0,
+            **percentiles_frame(tiempos),
+            "arranque_s": round(self.inicio_bucle - self.inicio_proceso, 2) if self.inicio_bucle else None,
+            "memoria_pico_mb": round(memoria_pico_bytes() / 1048576, 1),
+        }
+        if self.tiempos_por_tramo:
+            resultados["por_tramo"] = {
+                tramo: {"frames": len(valores), **percentiles_frame(valores)}
+                for tramo, valores in sorted(self.tiempos_por_tramo.items())
+            }
+        return resultados
+
+    def guardar(self):
+        with open(self.guion['salida'], 'w', encoding='utf-8') as archivo:
+            json.dump(self.resultados(), archivo, indent=2)
+
+# ===============================================================================
+# EJECUCIÓN DE ESCENARIOS
+# ===============================================================================
+def ejecutar_escenario(escenario, eventos, duracion_s, argumentos):
+    directorio = os.path.abspath(argumentos.trabajo)
+    ruta_guion = os.path.join(directorio, f"guion_{escenario}.json")
+    ruta_resultado = os.path.join(directorio, f"resultado_{escenario}.json")
+    if os.path.exists(ruta_resultado):
+        os.remove(ruta_resultado)
+    with open(ruta_guion, 'w', encoding='utf-8') as archivo:
+        json.dump({
+            "escenario": escenario,
+            "duracion_s": duracion_s,
+            "fps_objetivo": argumentos.fps,
+            "activos": os.path.join(directorio, "activos"),
+            "salida": ruta_resultado,
+            "eventos": eventos,
+        }, archivo)
+
+    entorno = dict(os.environ, AURORA_BENCHMARK=ruta_guion, SDL_VIDEODRIVER='dummy', SDL_AUDIODRIVER='dummy')
+    # El directorio de trabajo conserva logs y caché de imágenes entre escenarios
+    proceso = subprocess.run(
+        [sys.executable, os.path.abspath(argumentos.app)], cwd=directorio, env=entorno,
+        stdout=subprocess.DEVNULL if not argumentos.detalle else None,
+        timeout=duracion_s + 600
+    )
+    if proceso.returncode != 0 or not os.path.exists(ruta_resultado):
+        return {"escenario": escenario, "error": f"código de salida {proceso.returncode}"}
+    with open(ruta_resultado, encoding='utf-8') as archivo:
+        return json.load(archivo)
+
+def comparar_resultados(actual, anterior, tolerancia):
+    # Lista de textos con las métricas que empeoraron más que la tolerancia
+    regresiones = []
+    for escenario, metricas in actual['escenarios'].items():
+        previas = anterior.get('escenarios', {}).get(escenario)
+        if not previas or 'error' in metricas or 'error' in previas:
+            continue
+        for metrica in METRICAS_MENOR_ES_MEJOR + METRICAS_MAYOR_ES_MEJOR:
+            nuevo, viejo = metricas.get(metrica), previas.get(metrica)
+            if not nuevo or not viejo:
+                continue
+            cambio = (nuevo - viejo) / viejo
+            if metrica in METRICAS_MAYOR_ES_MEJOR:
+                cambio = -cambio
+            if cambio > tolerancia:
+                regresiones.append(f"{escenario}.{metrica}: {viejo} -> {nuevo} ({cambio:+.0%})")
+    return regresiones
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark sin monitores de Aurora Australis")
+    parser.add_argument('--app', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "AURORA_SOFTWARE.py"))
+    parser.add_argument('--escenarios', nargs='+', default=list(ESCENARIOS), choices=list(ESCENARIOS))
+    parser.add_argument('--duracion', type=float, default=15, help="Segundos por escenario")
+    parser.add_argument('--fps', type=int, default=0, help="Límite de FPS durante los fades (0 = sin límite)")
+    parser.add_argument('--trabajo', default='benchmark', help="Directorio de imágenes de prueba, logs y caché")
+    parser.add_argument('--salida', help="Archivo JSON de resultados (además de la salida estándar)")
+    parser.add_argument('--comparar', help="JSON de una corrida anterior para detectar regresiones")
+    parser.add_argument('--tolerancia', type=float, default=0.10, help="Empeoramiento aceptado al comparar")
+    parser.add_argument('--detalle', action='store_true', help="Mostrar el log de la aplicación")
+    parser.add_argument('--repetir', nargs='+', metavar='CSV',
+                        help="Repetir sesiones registradas en logs/botones_events_*.csv en vez de los escenarios")
+    parser.add_argument('--factor', type=float, default=1.0, help="Aceleración de la repetición (1 = tiempo real)")
+    parser.add_argument('--pausa-maxima', type=float, default=60,
+                        help="Segundos máximos entre pulsaciones repetidas, antes de acelerar (0 = sin límite)")
+    argumentos = parser.parse_args(argv)
+
+    try:
+        acciones = leer_capas(argumentos.app)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    archivos = [a['archivo'] for a in acciones if a.get('archivo')] + ["BASE.png", "SPLASH.png"]
+    generar_activos(os.path.join(argumentos.trabajo, "activos"), archivos)
+
+    resultados = {
+        "fecha": time.strftime('%Y-%m-%d %H:%M:%S'),
+        "plataforma": platform.platform(),
+        "python": platform.python_version(),
+        "resolucion_capas": f"{ANCHO_CAPA}x{ALTO_CAPA}",
+        "escenarios": {},
+    }
+    if argumentos.repetir:
+        pulsaciones = leer_pulsaciones_registradas(argumentos.repetir, acciones)
+        eventos = guion_repeticion(pulsaciones, argumentos.factor, argumentos.pausa_maxima)
+        duracion = (eventos[-1][0] / 1000 if eventos else 0) + 3
+        print(f"Repitiendo {len(pulsaciones)} pulsaciones en {duracion:.0f} s (factor {argumentos.factor:g})",
+              file=sys.stderr)
+        resultado = ejecutar_escenario("repeticion", eventos, duracion, argumentos)
+        resultado["archivos"] = [os.path.basename(ruta) for ruta in argumentos.repetir]
+        resultado["factor"] = argumentos.factor
+        resultados['escenarios']["repeticion"] = resultado
+    else:
+        for escenario in argumentos.escenarios:
+            print(f"Ejecutando escenario {escenario}: {ESCENARIOS[escenario]}", file=sys.stderr)
+            eventos = construir_guion(escenario, acciones, argumentos.duracion)
+            resultados['escenarios'][escenario] = ejecutar_escenario(escenario, eventos, argumentos.duracion, argumentos)
+
+    texto = json.dumps(resultados, indent=2, ensure_ascii=False)
+    print(texto)
+    if argumentos.salida:
+        with open(argumentos.salida, 'w', encoding='utf-8') as archivo:
+            archivo.write(texto)
+
+    codigo = 1 if any('error' in r for r in resultados['escenarios'].values()) else 0
+    if argumentos.comparar:
+        with open(argumentos.comparar, encoding='utf-8') as archivo:
+            regresiones = comparar_resultados(resultados, json.load(archivo), argumentos.tolerancia)
+        for regresion in regresiones:
+            print(f"REGRESIÓN {regresion}", file=sys.stderr)
+        if regresiones:
+            codigo = 1
+    return codigo
+
+if __name__ == '__main__':
+    sys.exit(main())
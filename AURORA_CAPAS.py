@@ -0,0 +1,153 @@
+import os
+import re
+import sys
+import json
+import argparse
+
+# ===============================================================================
+# CONFIGURACIÓN EXTERNA DE CAPAS, BOTONES Y LEYENDAS
+# ===============================================================================
+# Lee y valida capas.json. AURORA_SOFTWARE.py la carga al arrancar y la vuelve a
+# cargar en caliente cuando el archivo cambia; también se puede revisar antes de
+# copiarla al kiosco:
+#
+#   python AURORA_CAPAS.py capas.json
+#
+# Estructura:
+#   {"capas": [{"nombre", "jugador", "boton", "archivo", "color", "max_alpha",
+#               "titulo_leyenda", "leyenda": [{"nombre", "color", "simbolo"}],
+#               "leyenda_compartida", "es_reinicio"}, ...],
+#    "leyendas_compartidas": {grupo: {"titulo", "elementos": [...]}}}
+#
+# Una leyenda compartida con "titulo": null usa como título los títulos de sus
+# capas activas unidos con " & ". Cada capa se identifica por (nombre, archivo).
+
+NOMBRE_CONFIGURACION = "capas.json"
+
+CAMPOS_CAPA = {
+    'nombre': str, 'jugador': int, 'boton': int, 'archivo': str, 'color': str,
+    'max_alpha': int, 'titulo_leyenda': str, 'leyenda': list, 'leyenda_compartida': str,
+    'es_reinicio': bool,
+}
+CAMPOS_OBLIGATORIOS = ('nombre', 'jugador', 'boton')
+CAMPOS_ELEMENTO = {'nombre': str, 'color': str, 'simbolo': str}
+PATRON_COLOR = re.compile(r'^#[0-9a-fA-F]{6}$')
+
+def identidad_capa(config):
+    return (config['nombre'], config.get('archivo', ''))
+
+def validar_elementos(elementos, donde, errores):
+    if not isinstance(elementos, list):
+        errores.append(f"{donde}: debe ser una lista")
+        return
+    for indice, elemento in enumerate(elementos):
+        lugar = f"{donde}[{indice}]"
+        if not isinstance(elemento, dict):
+            errores.append(f"{lugar}: debe ser un objeto")
+            continue
+        for campo, valor in elemento.items():
+            tipo = CAMPOS_ELEMENTO.get(campo)
+            if tipo is None:
+                errores.append(f"{lugar}: campo desconocido '{campo}'")
+            elif not isinstance(valor, tipo):
+                errores.append(f"{lugar}.{campo}: se esperaba {tipo.__name__}")
+        if not isinstance(elemento.get('nombre'), str):
+            errores.append(f"{lugar}: falta 'nombre'")
+        if not PATRON_COLOR.match(str(elemento.get('color', ''))):
+            errores.append(f"{lugar}.color: se esperaba un color #rrggbb")
+
+def validar_configuracion(datos):
+    # Devuelve la lista de errores (vacía si la configuración es válida)
+    errores = []
+    if not isinstance(datos, dict):
+        return ["la configuración debe ser un objeto JSON"]
+    for campo in datos:
+        if campo not in ('capas', 'leyendas_compartidas'):
+            errores.append(f"campo desconocido '{campo}'")
+
+    compartidas = datos.get('leyendas_compartidas', {})
+    if not isinstance(compartidas, dict):
+        errores.append("leyendas_compartidas: debe ser un objeto")
+        compartidas = {}
+    for grupo, compartida in compartidas.items():
+        donde = f"leyendas_compartidas.{grupo}"
+        if not isinstance(compartida, dict):
+            errores.append(f"{donde}: debe ser un objeto")
+            continue
+        if set(compartida) - {'titulo', 'elementos'}:
+            errores.append(f"{donde}: campos desconocidos {sorted(set(compartida) - {'titulo', 'elementos'})}")
+        if compartida.get('titulo') is not None and not isinstance(compartida['titulo'], str):
+            errores.append(f"{donde}.titulo: se esperaba texto o null")
+        validar_elementos(compartida.get('elementos', []), f"{donde}.elementos", errores)
+
+    capas = datos.get('capas')
+    if not isinstance(capas, list) or not capas:
+        errores.append("capas: debe ser una lista no vacía")
+        return errores
+    identidades = set()
+    reinicios = 0
+    for indice, capa in enumerate(capas):
+        if not isinstance(capa, dict):
+            errores.append(f"capas[{indice}]: debe ser un objeto")
+            continue
+        donde = f"capas[{indice}] ({capa.get('nombre', '?')})"
+        errores_previos = len(errores)
+        for campo in CAMPOS_OBLIGATORIOS:
+            if campo not in capa:
+                errores.append(f"{donde}: falta '{campo}'")
+        for campo, valor in capa.items():
+            tipo = CAMPOS_CAPA.get(campo)
+            if tipo is None:
+                errores.append(f"{donde}: campo desconocido '{campo}'")
+            elif not isinstance(valor, tipo) or (tipo is int and isinstance(valor, bool)):
+                errores.append(f"{donde}.{campo}: se esperaba {tipo.__name__}")
+        if len(errores) > errores_previos:
+            continue
+        if capa['jugador'] < 1 or capa['boton'] < 0:
+            errores.append(f"{donde}: jugador debe ser >= 1 y boton >= 0")
+        if 'color' in capa and not PATRON_COLOR.match(capa['color']):
+            errores.append(f"{donde}.color: se esperaba un color #rrggbb")
+        if not 0 <= capa.get('max_alpha', 255) <= 255:
+            errores.append(f"{donde}.max_alpha: debe estar entre 0 y 255")
+        if 'leyenda' in capa:
+            validar_elementos(capa['leyenda'], f"{donde}.leyenda", errores)
+        if 'leyenda_compartida' in capa and capa['leyenda_compartida'] not in compartidas:
+            errores.append(f"{donde}: leyenda_compartida '{capa['leyenda_compartida']}' no está definida")
+        if identidad_capa(capa) in identidades:
+            errores.append(f"{donde}: capa repetida (mismo nombre y archivo)")
+        identidades.add(identidad_capa(capa))
+        reinicios += 1 if capa.get('es_reinicio') else 0
+    if reinicios > 1:
+        errores.append("solo puede haber una capa con es_reinicio")
+    return errores
+
+def cargar_configuracion(ruta):
+    # Devuelve la configuración validada o lanza ValueError con todos los errores
+    try:
+        with open(ruta, encoding='utf-8') as archivo:
+            datos = json.load(archivo)
+    except (OSError, ValueError) as e:
+        raise ValueError(f"No se pudo leer {ruta}: {e}")
+    errores = validar_configuracion(datos)
+    if errores:
+        raise ValueError(f"Configuración inválida en {ruta}:\n  " + "\n  ".join(errores))
+    datos.setdefault('leyendas_compartidas', {})
+    return datos
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Validar la configuración de capas de Aurora Australis")
+    parser.add_argument('configuracion', nargs='?',
+                        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), NOMBRE_CONFIGURACION))
+    argumentos = parser.parse_args(argv)
+    try:
+        datos = cargar_configuracion(argumentos.configuracion)
+    except ValueError as e:
+        print(e)
+        return 1
+    botones = {(capa['jugador'], capa['boton']) for capa in datos['capas']}
+    print(f"{argumentos.configuracion}: OK ({len(datos['capas'])} capas en {len(botones)} botones, "
+          f"{len(datos['leyendas_compartidas'])} leyendas compartidas)")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,430 @@
+import os
+import sys
+import json
+import mmap
+import time
+import zlib
+import struct
+import hashlib
+import argparse
+import threading
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageChops, ImageSequence, GifImagePlugin
+
+# ===============================================================================
+# DECODIFICACIÓN Y CACHÉ EN DISCO DE IMÁGENES ESCALADAS
+# ===============================================================================
+# Este módulo no usa pygame ni abre ventanas: lo importa AURORA_SOFTWARE.py para
+# decodificar fuera del hilo principal y también se ejecuta como herramienta:
+#
+#   python AURORA_CARGA.py construir --imagenes C:\IMAGENES
+#   python AURORA_CARGA.py validar --completo
+#
+# Cada entrada de caché guarda todos los datos de un archivo ya escalados a la
+# resolución final y en el orden de bytes de la pantalla, de modo que al arrancar
+# se mapean a memoria y se entregan a pygame.image.frombuffer sin pasar por PIL.
+#
+# Los datos decodificados son un diccionario:
+#   {'tipo': 'imagen', 'frames': [bytes], 'alfa': 'opaco', 'binario' o 'variable',
+#    'clave': color (r, g, b) que reemplaza a los píxeles transparentes si es binario,
+#    'teselas': [(x, y, w, h)] de las teselas con algún píxel visible, o None si es opaco}
+#   {'tipo': 'animacion', 'modo': 'P' o formato, 'paleta', 'transparente',
+#    'duraciones': [ms], 'base': bytes del frame 0,
+#    'rects': [(x, y, w, h) o None], 'parches': [bytes]}
+# En una animación, rects[i]/parches[i] llevan del frame i-1 al frame i
+# (rects[0] cierra el ciclo desde el último frame).
+
+VERSION_CACHE = 4
+MAGIA_CACHE = b"AURORAC\n"
+ALINEACION_DATOS = 64
+EXTENSIONES_IMAGEN = ('.png', '.gif')
+TAM_TESELA = 128
+
+# Colores candidatos para colorkey; se usa el primero que no aparezca en la imagen
+CLAVES_COLOR = [(255, 0, 255), (0, 255, 1), (1, 254, 3), (254, 1, 253)]
+
+class EstrategiaPaletaGif:
+    # Mantiene los frames de un GIF en modo paleta mientras compartan la paleta
+    # global. LOADING_STRATEGY es global de PIL: se cambia solo mientras haya
+    # alguna animación decodificándose y luego se restaura el valor anterior;
+    # los hilos de carga que coinciden comparten el mismo valor
+    def __init__(self):
+        self.candado = threading.Lock()
+        self.usos = 0
+        self.anterior = None
+
+    def __enter__(self):
+        if not hasattr(GifImagePlugin, 'LoadingStrategy'):
+            return self
+        with self.candado:
+            if self.usos == 0:
+                self.anterior = GifImagePlugin.LOADING_STRATEGY
+                GifImagePlugin.LOADING_STRATEGY = GifImagePlugin.LoadingStrategy.RGB_AFTER_DIFFERENT_PALETTE_ONLY
+            self.usos += 1
+        return self
+
+    def __exit__(self, *excepcion):
+        if not hasattr(GifImagePlugin, 'LoadingStrategy'):
+            return
+        with self.candado:
+            self.usos -= 1
+            if self.usos == 0:
+                GifImagePlugin.LOADING_STRATEGY = self.anterior
+
+estrategia_paleta_gif = EstrategiaPaletaGif()
+
+def rect_diferencia(anterior, actual, bytes_por_pixel):
+    # Rectángulo que contiene todos los píxeles distintos entre dos frames
+    ancho, alto = actual.size
+    diferencia = ImageChops.difference(
+        Image.frombytes('L', (ancho * bytes_por_pixel, alto), anterior.tobytes()),
+        Image.frombytes('L', (ancho * bytes_por_pixel, alto), actual.tobytes())
+    )
+    limites = diferencia.getbbox()
+    if limites is None:
+        return None
+    x0, y0, x1, y1 = limites
+    x0 //= bytes_por_pixel
+    x1 = -(-x1 // bytes_por_pixel)
+    return (x0, y0, x1 - x0, y1 - y0)
+
+def decodificar_animacion(imagen, ancho, alto, formato):
+    frames = []
+    duraciones = []
+    with estrategia_paleta_gif:
+        for frame in ImageSequence.Iterator(imagen):
+            duraciones.append(int(frame.info.get('duration', 0) or 0))
+            frames.append(frame.copy())
+    if len(frames) < 2:
+        return None
+
+    # Con paleta única se guardan índices de 8 bits; si no, píxeles de 32 bits
+    transparencias = {frame.info.get('transparency') for frame in frames}
+    paletizada = (all(frame.mode == 'P' for frame in frames)
+                  and len({bytes(frame.getpalette() or []) for frame in frames}) == 1
+                  and len(transparencias) == 1)
+    if paletizada:
+        transparente = transparencias.pop()
+        paleta = frames[0].getpalette()
+        paleta = [tuple(paleta[i:i + 3]) for i in range(0, len(paleta), 3)]
+        modo, bytes_por_pixel = 'P', 1
+    else:
+        transparente, paleta = None, None
+        frames = [frame.convert("RGBA") for frame in frames]
+        modo, bytes_por_pixel = formato, 4
+    frames = [frame.resize((ancho, alto), Image.NEAREST) if frame.size != (ancho, alto) else frame
+              for frame in frames]
+
+    def a_bytes(superficie):
+        return superficie.tobytes() if modo == 'P' else superficie.tobytes("raw", formato)
+
+    rects = []
+    parches = []
+    for indice, frame in enumerate(frames):
+        rect = rect_diferencia(frames[indice - 1], frame, bytes_por_pixel)
+        rects.append(rect)
+        if rect is None:
+            parches.append(b'')
+        else:
+            x, y, w, h = rect
+            parches.append(a_bytes(frame.crop((x, y, x + w, y + h))))
+    return {
+        'tipo': 'animacion', 'modo': modo, 'paleta': paleta, 'transparente': transparente,
+        'duraciones': duraciones, 'base': a_bytes(frames[0]), 'rects': rects, 'parches': parches,
+    }
+
+def analizar_alfa(imagen):
+    # Clasifica el canal alfa con su histograma (calculado en C por PIL)
+    histograma = imagen.getchannel('A').histogram()
+    if not any(histograma[:255]):
+        return 'opaco'
+    if not any(histograma[1:255]):
+        return 'binario'
+    return 'variable'
+
+def elegir_clave_color(imagen):
+    # Primer candidato que ningún píxel opaco usa, o None
+    rojo, verde, azul, alfa = imagen.split()
+    opacos = alfa.point(lambda valor: 255 if valor else 0, '1')
+    for clave in CLAVES_COLOR:
+        coincidencias = opacos
+        for canal, valor in zip((rojo, verde, azul), clave):
+            coincidencias = ImageChops.logical_and(
+                coincidencias, canal.point(lambda v, valor=valor: 255 if v == valor else 0, '1'))
+        if coincidencias.getbbox() is None:
+            return clave
+    return None
+
+def teselas_no_vacias(imagen, tam=TAM_TESELA):
+    # Una sola pasada en C: el alfa binarizado se promedia por bloques de tam x tam
+    # con reduce(), y un promedio mayor que cero marca una tesela con algo visible
+    ancho, alto = imagen.size
+    columnas, filas = -(-ancho // tam), -(-alto // tam)
+    visibles = imagen.getchannel('A').point(lambda valor: 255 if valor else 0).convert('F')
+    promedios = array('f', visibles.crop((0, 0, columnas * tam, filas * tam)).reduce(tam).tobytes())
+    teselas = []
+    for indice, promedio in enumerate(promedios):
+        if promedio > 0:
+            x, y = (indice % columnas) * tam, (indice // columnas) * tam
+            teselas.append((x, y, min(tam, ancho - x), min(tam, alto - y)))
+    return teselas
+
+def preparar_imagen(imagen, formato):
+    # Elige la representación más barata de dibujar según el canal alfa
+    alfa = analizar_alfa(imagen)
+    clave = None
+    teselas = None if alfa == 'opaco' else teselas_no_vacias(imagen)
+    if alfa == 'binario':
+        clave = elegir_clave_color(imagen)
+        if clave is None:
+            alfa = 'variable'
+        else:
+            fondo = Image.new("RGBA", imagen.size, clave + (255,))
+            imagen = Image.composite(imagen, fondo, imagen.getchannel('A'))
+    return {'tipo': 'imagen', 'frames': [imagen.tobytes("raw", formato)], 'alfa': alfa, 'clave': clave,
+            'teselas': teselas}
+
+def decodificar_imagen(ruta, ancho, alto, formato="RGBA"):
+    # Trabajo exclusivo de PIL, seguro fuera del hilo principal:
+    # devuelve los datos ya escalados y el tiempo empleado
+    inicio = time.perf_counter()
+    imagen = Image.open(ruta)
+    if ruta.lower().endswith('.gif'):
+        datos = decodificar_animacion(imagen, ancho, alto, formato)
+        if datos is not None:
+            return datos, time.perf_counter() - inicio
+        imagen.seek(0)
+    imagen = imagen.convert("RGBA")
+    if imagen.size != (ancho, alto):
+        imagen = imagen.resize((ancho, alto), Image.NEAREST)
+    return preparar_imagen(imagen, formato), time.perf_counter() - inicio
+
+def bloques_de_datos(datos):
+    # Separa los datos en bloques binarios y metadatos serializables
+    if datos['tipo'] == 'imagen':
+        return datos['frames'], {'alfa': datos['alfa'], 'clave': datos['clave'], 'teselas': datos['teselas']}
+    metadatos = {clave: datos[clave] for clave in ('modo', 'paleta', 'transparente', 'duraciones', 'rects')}
+    return [datos['base']] + datos['parches'], metadatos
+
+def datos_desde_bloques(tipo, metadatos, bloques):
+    if tipo == 'imagen':
+        clave = metadatos['clave']
+        teselas = metadatos['teselas']
+        return {'tipo': 'imagen', 'frames': bloques, 'alfa': metadatos['alfa'],
+                'clave': tuple(clave) if clave else None,
+                'teselas': [tuple(rect) for rect in teselas] if teselas is not None else None}
+    datos = dict(metadatos, tipo='animacion', base=bloques[0], parches=bloques[1:])
+    datos['rects'] = [tuple(rect) if rect else None for rect in datos['rects']]
+    if datos['paleta'] is not None:
+        datos['paleta'] = [tuple(color) for color in datos['paleta']]
+    return datos
+
+def ruta_entrada_cache(directorio_cache, ruta, ancho, alto, formato):
+    clave = f"{os.path.normcase(os.path.abspath(ruta))}|{ancho}x{alto}|{formato}|v{VERSION_CACHE}"
+    nombre = os.path.splitext(os.path.basename(ruta))[0]
+    resumen = hashlib.sha1(clave.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(directorio_cache, f"{nombre}_{ancho}x{alto}_{resumen}.cache")
+
+def leer_encabezado(archivo):
+    if archivo.read(len(MAGIA_CACHE)) != MAGIA_CACHE:
+        raise ValueError("firma de caché inválida")
+    (largo,) = struct.unpack('<I', archivo.read(4))
+    encabezado = json.loads(archivo.read(largo).decode('utf-8'))
+    if encabezado.get('version') != VERSION_CACHE:
+        raise ValueError(f"versión de caché {encabezado.get('version')} no soportada")
+    return encabezado
+
+def escribir_cache(directorio_cache, ruta, ancho, alto, formato, datos, estado):
+    # estado es el os.stat del origen tomado antes de decodificar: si el archivo
+    # cambió mientras tanto, los datos pueden ser del anterior y no se guardan
+    actual = os.stat(ruta)
+    if (actual.st_size, actual.st_mtime_ns) != (estado.st_size, estado.st_mtime_ns):
+        return None
+    bloques, metadatos = bloques_de_datos(datos)
+    encabezado = {
+        'version': VERSION_CACHE,
+        'fuente': os.path.abspath(ruta),
+        'tamano_fuente': estado.st_size,
+        'mtime_ns': estado.st_mtime_ns,
+        'ancho': ancho,
+        'alto': alto,
+        'formato': formato,
+        'tipo': datos['tipo'],
+        'metadatos': metadatos,
+        'largos': [len(bloque) for bloque in bloques],
+        'crc32': [zlib.crc32(bloque) for bloque in bloques],
+    }
+    datos_encabezado = json.dumps(encabezado).encode('utf-8')
+    inicio_datos = len(MAGIA_CACHE) + 4 + len(datos_encabezado)
+    relleno = -inicio_datos % ALINEACION_DATOS
+
+    os.makedirs(directorio_cache, exist_ok=True)
+    destino = ruta_entrada_cache(directorio_cache, ruta, ancho, alto, formato)
+    # Temporal propio del hilo: los pools de carga y de recarga y la herramienta
+    # construir pueden escribir la misma entrada a la vez
+    temporal = f"{destino}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporal, 'wb') as archivo:
+        archivo.write(MAGIA_CACHE)
+        archivo.write(struct.pack('<I', len(datos_encabezado)))
+        archivo.write(datos_encabezado)
+        archivo.write(b'\0' * relleno)
+        for bloque in bloques:
+            archivo.write(bloque)
+    # Reemplazo atómico para que un lector nunca vea una entrada a medio escribir
+    os.replace(temporal, destino)
+    return destino
+
+def leer_cache(directorio_cache, ruta, ancho, alto, formato):
+    # Devuelve los datos con vistas de memoria sobre el archivo mapeado, o None
+    # si la entrada no existe o ya no corresponde al archivo de origen
+    destino = ruta_entrada_cache(directorio_cache, ruta, ancho, alto, formato)
+    try:
+        estado = os.stat(ruta)
+        with open(destino, 'rb') as archivo:
+            encabezado = leer_encabezado(archivo)
+            inicio_datos = archivo.tell()
+            if (encabezado['tamano_fuente'] != estado.st_size
+                    or encabezado['mtime_ns'] != estado.st_mtime_ns
+                    or (encabezado['ancho'], encabezado['alto']) != (ancho, alto)
+                    or encabezado['formato'] != formato):
+                return None
+            inicio_datos += -inicio_datos % ALINEACION_DATOS
+            if os.fstat(archivo.fileno()).st_size != inicio_datos + sum(encabezado['largos']):
+                return None
+            # ACCESS_COPY: las páginas se comparten con la caché del sistema y
+            # cualquier escritura sobre la superficie nunca llega al archivo
+            mapa = mmap.mmap(archivo.fileno(), 0, access=mmap.ACCESS_COPY)
+    except (OSError, ValueError, KeyError):
+        return None
+    vista = memoryview(mapa)
+    bloques = []
+    posicion = inicio_datos
+    for largo in encabezado['largos']:
+        bloques.append(vista[posicion:posicion + largo])
+        posicion += largo
+    return datos_desde_bloques(encabezado['tipo'], encabezado['metadatos'], bloques)
+
+def obtener_frames(ruta, ancho, alto, formato="RGBA", directorio_cache=None):
+    # Devuelve (datos, segundos, desde_cache); si no hay entrada válida
+    # decodifica con PIL y deja la entrada escrita para el próximo arranque
+    inicio = time.perf_counter()
+    if directorio_cache:
+        datos = leer_cache(directorio_cache, ruta, ancho, alto, formato)
+        if datos is not None:
+            return datos, time.perf_counter() - inicio, True
+    estado = os.stat(ruta) if directorio_cache else None
+    datos, segundos = decodificar_imagen(ruta, ancho, alto, formato)
+    if directorio_cache:
+        try:
+            escribir_cache(directorio_cache, ruta, ancho, alto, formato, datos, estado)
+        except OSError:
+            # En Windows una entrada mapeada por otro proceso no se puede reemplazar
+            pass
+    return datos, segundos, False
+
+def validar_entrada(ruta_entrada, completo=False):
+    # Devuelve (valida, motivo)
+    try:
+        with open(ruta_entrada, 'rb') as archivo:
+            encabezado = leer_encabezado(archivo)
+            inicio_datos = archivo.tell()
+            inicio_datos += -inicio_datos % ALINEACION_DATOS
+            if os.fstat(archivo.fileno()).st_size != inicio_datos + sum(encabezado['largos']):
+                return False, "tamaño de archivo incorrecto"
+            try:
+                estado = os.stat(encabezado['fuente'])
+            except OSError:
+                return False, "archivo de origen inexistente"
+            if (estado.st_size, estado.st_mtime_ns) != (encabezado['tamano_fuente'], encabezado['mtime_ns']):
+                return False, "archivo de origen modificado"
+            if completo:
+                archivo.seek(inicio_datos)
+                for indice, (largo, crc) in enumerate(zip(encabezado['largos'], encabezado['crc32'])):
+                    if zlib.crc32(archivo.read(largo)) != crc:
+                        return False, f"bloque {indice} corrupto"
+    except (OSError, ValueError, KeyError) as e:
+        return False, str(e)
+    return True, "ok"
+
+# ===============================================================================
+# HERRAMIENTA DE LÍNEA DE COMANDOS
+# ===============================================================================
+def construir_cache(argumentos):
+    rutas = sorted(
+        os.path.join(argumentos.imagenes, nombre) for nombre in os.listdir(argumentos.imagenes)
+        if nombre.lower().endswith(EXTENSIONES_IMAGEN)
+    )
+
+    def construir(ruta):
+        if leer_cache(argumentos.cache, ruta, argumentos.ancho, argumentos.alto, argumentos.formato) is not None:
+            return ruta, "vigente", 0.0
+        inicio = time.perf_counter()
+        estado = os.stat(ruta)
+        datos, _ = decodificar_imagen(ruta, argumentos.ancho, argumentos.alto, argumentos.formato)
+        if escribir_cache(argumentos.cache, ruta, argumentos.ancho, argumentos.alto, argumentos.formato,
+                          datos, estado) is None:
+            return ruta, "modificada durante la decodificación; se omite", time.perf_counter() - inicio
+        if datos['tipo'] == 'animacion':
+            descripcion = f"animación de {len(datos['rects'])} frames en modo {datos['modo']}"
+        elif datos['teselas'] is not None:
+            descripcion = f"imagen con alfa {datos['alfa']}, {len(datos['teselas'])} teselas no vacías"
+        else:
+            descripcion = f"imagen con alfa {datos['alfa']}"
+        return ruta, f"construida ({descripcion})", time.perf_counter() - inicio
+
+    errores = 0
+    with ThreadPoolExecutor(max_workers=argumentos.hilos) as pool:
+        futuros = [pool.submit(construir, ruta) for ruta in rutas]
+        for ruta, futuro in zip(rutas, futuros):
+            try:
+                _, estado, segundos = futuro.result()
+                print(f"{os.path.basename(ruta)}: {estado} {segundos:.2f} s")
+            except Exception as e:
+                errores += 1
+                print(f"{os.path.basename(ruta)}: ERROR {e}")
+    return 1 if errores else 0
+
+def validar_cache(argumentos):
+    if not os.path.isdir(argumentos.cache):
+        print(f"No existe el directorio de caché {argumentos.cache}")
+        return 1
+    invalidas = 0
+    for nombre in sorted(os.listdir(argumentos.cache)):
+        if not nombre.endswith('.cache'):
+            continue
+        ruta_entrada = os.path.join(argumentos.cache, nombre)
+        valida, motivo = validar_entrada(ruta_entrada, argumentos.completo)
+        print(f"{nombre}: {'OK' if valida else 'INVÁLIDA'} ({motivo})")
+        if not valida:
+            invalidas += 1
+            if argumentos.eliminar:
+                os.remove(ruta_entrada)
+    return 1 if invalidas else 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Caché de imágenes escaladas de Aurora Australis")
+    subcomandos = parser.add_subparsers(dest='comando', required=True)
+
+    construir = subcomandos.add_parser('construir', help="Precalcular la caché de todas las imágenes")
+    construir.add_argument('--imagenes', default=r"C:\IMAGENES")
+    construir.add_argument('--ancho', type=int, default=3840)
+    construir.add_argument('--alto', type=int, default=1080)
+    construir.add_argument('--formato', default="BGRA", choices=["BGRA", "RGBA"],
+                           help="Orden de bytes de la pantalla (BGRA en Windows)")
+    construir.add_argument('--hilos', type=int, default=max(1, (os.cpu_count() or 2) - 1))
+
+    validar = subcomandos.add_parser('validar', help="Verificar las entradas de la caché")
+    validar.add_argument('--completo', action='store_true', help="Verificar también el CRC de cada frame")
+    validar.add_argument('--eliminar', action='store_true', help="Borrar las entradas inválidas")
+
+    for subparser in (construir, validar):
+        subparser.add_argument('--cache', default='cache')
+
+    argumentos = parser.parse_args(argv)
+    if argumentos.comando == 'construir':
+        return construir_cache(argumentos)
+    return validar_cache(argumentos)
+
+if __name__ == '__main__':
+    sys.exit(main())
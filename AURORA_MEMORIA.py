@@ -0,0 +1,62 @@
+import os
+import sys
+import argparse
+
+# ===============================================================================
+# MEMORIA DEL PROCESO SIN DEPENDENCIAS EXTERNAS
+# ===============================================================================
+# AURORA_SOFTWARE.py la usa para el informe de memoria y las métricas, y
+# AURORA_BENCHMARK.py para el pico de cada escenario. Para ver los valores del
+# propio intérprete:
+#
+#   python AURORA_MEMORIA.py
+
+if sys.platform == 'win32':
+    import ctypes
+    from ctypes import wintypes
+
+    class ContadoresMemoriaProceso(ctypes.Structure):
+        # PROCESS_MEMORY_COUNTERS de psapi.h
+        _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD)] + [
+            (campo, ctypes.c_size_t) for campo in (
+                'PeakWorkingSetSize', 'WorkingSetSize', 'QuotaPeakPagedPoolUsage', 'QuotaPagedPoolUsage',
+                'QuotaPeakNonPagedPoolUsage', 'QuotaNonPagedPoolUsage', 'PagefileUsage', 'PeakPagefileUsage')]
+
+    ctypes.windll.kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+    ctypes.windll.psapi.GetProcessMemoryInfo.argtypes = [wintypes.HANDLE, ctypes.c_void_p, wintypes.DWORD]
+    ctypes.windll.psapi.GetProcessMemoryInfo.restype = wintypes.BOOL
+
+def memoria_proceso():
+    # (residente, pico) en bytes del proceso actual; None en lo que no se pueda leer
+    if sys.platform == 'win32':
+        contadores = ContadoresMemoriaProceso()
+        contadores.cb = ctypes.sizeof(contadores)
+        if not ctypes.windll.psapi.GetProcessMemoryInfo(
+                ctypes.windll.kernel32.GetCurrentProcess(), ctypes.byref(contadores), contadores.cb):
+            return None, None
+        return contadores.WorkingSetSize, contadores.PeakWorkingSetSize
+    residente = None
+    try:
+        with open('/proc/self/statm') as archivo:
+            residente = int(archivo.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reporta KB; macOS, bytes
+        pico = pico if sys.platform == 'darwin' else pico * 1024
+    except (ImportError, OSError):
+        pico = None
+    return residente, pico
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Memoria residente y pico del proceso actual")
+    parser.parse_args(argv)
+    residente, pico = memoria_proceso()
+    for nombre, valor in (("Residente", residente), ("Pico", pico)):
+        print(f"{nombre}: {valor / 1048576:.1f} MB" if valor is not None else f"{nombre}: no disponible")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,208 @@
+import re
+import sys
+import math
+import argparse
+import threading
+import urllib.request
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# ===============================================================================
+# ENDPOINT LOCAL DE MÉTRICAS EN FORMATO DE TEXTO DE PROMETHEUS
+# ===============================================================================
+# AURORA_SOFTWARE.py lo levanta en un hilo propio cuando tiene puerto_metricas;
+# cada pedido arma el texto con la función que entrega la aplicación, de modo
+# que el bucle de render nunca espera al servidor. Para revisarlo sin Prometheus:
+#
+#   python AURORA_METRICAS.py leer --url http://127.0.0.1:9108/metrics
+#
+# Una familia de métricas es (nombre, tipo, ayuda, muestras), con muestras
+# [(sufijo, {etiqueta: valor}, número)]; los histogramas usan los sufijos
+# _bucket (con etiqueta le), _sum y _count.
+
+TIPO_CONTENIDO = "text/plain; version=0.0.4; charset=utf-8"
+TIPOS_METRICA = ('counter', 'gauge', 'histogram')
+PATRON_MUESTRA = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})? (\S+)$')
+PATRON_ETIQUETA = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"(?:,|$)')
+
+def escapar_etiqueta(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def formatear_numero(valor):
+    if isinstance(valor, float):
+        if math.isinf(valor):
+            return '+Inf' if valor > 0 else '-Inf'
+        if math.isnan(valor):
+            return 'NaN'
+        return repr(valor)
+    return str(valor)
+
+def formatear_familias(familias):
+    lineas = []
+    for nombre, tipo, ayuda, muestras in familias:
+        ayuda = ayuda.replace('\\', '\\\\').replace('\n', '\\n')
+        lineas.append(f"# HELP {nombre} {ayuda}")
+        lineas.append(f"# TYPE {nombre} {tipo}")
+        for sufijo, etiquetas, valor in muestras:
+            texto = ",".join(f'{clave}="{escapar_etiqueta(v)}"' for clave, v in etiquetas.items())
+            lineas.append(f"{nombre}{sufijo}{{{texto}}} {formatear_numero(valor)}" if texto
+                          else f"{nombre}{sufijo} {formatear_numero(valor)}")
+    return "\n".join(lineas) + "\n"
+
+def muestras_histograma(limites, cuentas, suma):
+    # cuentas[i] son las observaciones hasta limites[i]; la última cuenta es la de +Inf
+    muestras = []
+    acumulado = 0
+    for limite, cuenta in zip(list(limites) + [math.inf], cuentas):
+        acumulado += cuenta
+        muestras.append(('_bucket', {'le': formatear_numero(float(limite))}, acumulado))
+    muestras.append(('_sum', {}, suma))
+    muestras.append(('_count', {}, acumulado))
+    return muestras
+
+class ServidorMetricas:
+    # Atiende GET /metrics en hilos propios; generar() se llama en esos hilos
+    def __init__(self, direccion, puerto, generar):
+        class Manejador(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                try:
+                    cuerpo = formatear_familias(generar()).encode('utf-8')
+                except Exception as e:
+                    self.send_error(500, str(e))
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', TIPO_CONTENIDO)
+                self.send_header('Content-Length', str(len(cuerpo)))
+                self.end_headers()
+                self.wfile.write(cuerpo)
+
+            def log_message(self, formato, *argumentos):
+                # Los pedidos periódicos del scraper no van al registro
+                pass
+
+        self.servidor = ThreadingHTTPServer((direccion, puerto), Manejador)
+        self.servidor.daemon_threads = True
+        self.hilo = threading.Thread(target=self.servidor.serve_forever, name="ServidorMetricas", daemon=True)
+        self.hilo.start()
+
+    @property
+    def direccion(self):
+        return self.servidor.server_address
+
+    def cerrar(self):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+
+def validar_exposicion(texto):
+    # Revisión del formato de texto sin dependencias: devuelve (muestras, errores)
+    # con muestras {(nombre, etiquetas ordenadas): valor}
+    tipos = {}
+    muestras = {}
+    errores = []
+    for numero, linea in enumerate(texto.splitlines(), 1):
+        if not linea or linea.startswith('# HELP '):
+            continue
+        if linea.startswith('# TYPE '):
+            partes = linea.split()
+            if len(partes) != 4 or partes[3] not in TIPOS_METRICA:
+                errores.append(f"línea {numero}: TYPE inválido")
+            elif partes[2] in tipos:
+                errores.append(f"línea {numero}: familia {partes[2]} declarada dos veces")
+            else:
+                tipos[partes[2]] = partes[3]
+            continue
+        if linea.startswith('#'):
+            continue
+        coincidencia = PATRON_MUESTRA.match(linea)
+        if not coincidencia:
+            errores.append(f"línea {numero}: muestra mal formada")
+            continue
+        nombre, texto_etiquetas, texto_valor = coincidencia.groups()
+        etiquetas = {}
+        if texto_etiquetas:
+            posicion = 0
+            for etiqueta in PATRON_ETIQUETA.finditer(texto_etiquetas):
+                if etiqueta.start() != posicion:
+                    break
+                etiquetas[etiqueta.group(1)] = etiqueta.group(2)
+                posicion = etiqueta.end()
+            if posicion != len(texto_etiquetas):
+                errores.append(f"línea {numero}: etiquetas mal formadas")
+                continue
+        try:
+            valor = float(texto_valor)
+        except ValueError:
+            errores.append(f"línea {numero}: valor '{texto_valor}' no numérico")
+            continue
+        familia = nombre
+        if nombre not in tipos:
+            familia = re.sub(r'_(bucket|sum|count)$', '', nombre)
+            if tipos.get(familia) != 'histogram':
+                errores.append(f"línea {numero}: {nombre} sin TYPE declarado")
+                continue
+        if familia == nombre and tipos[familia] == 'histogram':
+            errores.append(f"línea {numero}: histograma {nombre} sin sufijo")
+        muestras[(nombre, tuple(sorted(etiquetas.items())))] = valor
+
+    # Cubetas acumulativas, terminadas en +Inf e iguales a _count
+    for familia, tipo in tipos.items():
+        if tipo != 'histogram':
+            continue
+        series = {}
+        for (nombre, etiquetas), valor in muestras.items():
+            if nombre == f"{familia}_bucket":
+                limite = dict(etiquetas).get('le')
+                try:
+                    limite = float(limite)
+                except (TypeError, ValueError):
+                    errores.append(f"{familia}: cubeta sin etiqueta le numérica")
+                    continue
+                resto = tuple(par for par in etiquetas if par[0] != 'le')
+                series.setdefault(resto, []).append((limite, valor))
+        for resto, cubetas in series.items():
+            cubetas.sort()
+            if any(b[1] < a[1] for a, b in zip(cubetas, cubetas[1:])):
+                errores.append(f"{familia}: cubetas no acumulativas")
+            if not math.isinf(cubetas[-1][0]):
+                errores.append(f"{familia}: falta la cubeta +Inf")
+            elif muestras.get((f"{familia}_count", resto)) != cubetas[-1][1]:
+                errores.append(f"{familia}: _count no coincide con la cubeta +Inf")
+    return muestras, errores
+
+# ===============================================================================
+# HERRAMIENTA DE LÍNEA DE COMANDOS
+# ===============================================================================
+def leer_metricas(argumentos):
+    try:
+        with urllib.request.urlopen(argumentos.url, timeout=argumentos.espera) as respuesta:
+            tipo = respuesta.headers.get('Content-Type', '')
+            texto = respuesta.read().decode('utf-8')
+    except OSError as e:
+        print(f"{argumentos.url}: ERROR {e}")
+        return 1
+    muestras, errores = validar_exposicion(texto)
+    if argumentos.mostrar:
+        sys.stdout.write(texto)
+    if not tipo.startswith('text/plain'):
+        errores.append(f"Content-Type inesperado: {tipo}")
+    for error in errores:
+        print(f"ERROR {error}")
+    nombres = {nombre for nombre, _ in muestras}
+    print(f"{argumentos.url}: {'OK' if not errores else 'INVÁLIDO'} "
+          f"({len(muestras)} muestras de {len(nombres)} métricas)")
+    return 1 if errores else 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Leer y validar las métricas de Aurora Australis")
+    subcomandos = parser.add_subparsers(dest='comando', required=True)
+    leer = subcomandos.add_parser('leer', help="Pedir /metrics una vez y revisar el formato")
+    leer.add_argument('--url', default="http://127.0.0.1:9108/metrics")
+    leer.add_argument('--espera', type=float, default=5.0, help="Segundos máximos de espera")
+    leer.add_argument('--mostrar', action='store_true', help="Imprimir el texto recibido")
+    argumentos = parser.parse_args(argv)
+    return leer_metricas(argumentos)
+
+if __name__ == '__main__':
+    sys.exit(main())
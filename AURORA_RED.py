@@ -0,0 +1,183 @@
+import sys
+import json
+import time
+import socket
+import argparse
+import threading
+from collections import OrderedDict
+
+# ===============================================================================
+# ENTRADA DE BOTONES POR RED LOCAL (UDP)
+# ===============================================================================
+# AURORA_SOFTWARE.py recibe aquí las pulsaciones de tabletas de guías y de
+# técnicos, y las trata igual que las de los joysticks. También es el cliente
+# de prueba para medir la latencia desde otra máquina o desde el mismo kiosco:
+#
+#   python AURORA_RED.py enviar --jugador 1 --boton 8
+#   python AURORA_RED.py enviar --host 192.168.1.20 --jugador 2 --boton 3 --repeticiones 50
+#
+# Cada datagrama es un objeto JSON:
+#   {"jugador": int, "boton": int, "secuencia": int, "enviado": segundos epoch,
+#    "clave": texto (solo si la aplicación exige clave_entrada_red)}
+# Una vez aplicada la pulsación, la aplicación responde al mismo origen con
+#   {"secuencia", "resultado": "aplicado" o "sin asignar",
+#    "espera_ms": desde que llegó el datagrama hasta que se aplicó}
+# Los datagramas inválidos o con clave incorrecta se descartan sin respuesta,
+# igual que las secuencias repetidas o atrasadas de un mismo origen.
+
+PUERTO_POR_OMISION = 9109
+TAMANO_MAXIMO_DATAGRAMA = 2048
+# Orígenes cuya última secuencia se recuerda; pasado el olvido se acepta
+# cualquier secuencia, como la de un cliente que se reinició
+MAXIMO_ORIGENES = 256
+OLVIDO_ORIGEN_S = 600
+
+def codificar(datos):
+    return json.dumps(datos, separators=(',', ':')).encode('utf-8')
+
+def decodificar_pulsacion(datagrama, clave=None):
+    # Devuelve el mensaje validado o lanza ValueError con el motivo
+    try:
+        mensaje = json.loads(datagrama.decode('utf-8'))
+    except (UnicodeDecodeError, ValueError):
+        raise ValueError("no es JSON")
+    if not isinstance(mensaje, dict):
+        raise ValueError("se esperaba un objeto")
+    for campo in ('jugador', 'boton', 'secuencia'):
+        valor = mensaje.get(campo)
+        if not isinstance(valor, int) or isinstance(valor, bool) or valor < 0:
+            raise ValueError(f"'{campo}' debe ser un entero no negativo")
+    enviado = mensaje.get('enviado')
+    if enviado is not None and (not isinstance(enviado, (int, float)) or isinstance(enviado, bool)):
+        raise ValueError("'enviado' debe ser un número")
+    if clave is not None and mensaje.get('clave') != clave:
+        raise ValueError("clave incorrecta")
+    return mensaje
+
+class ServidorEntradaRed:
+    # Un hilo bloqueado en recvfrom; al_recibir(mensaje, origen, recibido) corre
+    # en ese hilo y debe limitarse a encolar la acción
+    def __init__(self, direccion, puerto, al_recibir, clave=None, al_rechazar=None):
+        self.al_recibir = al_recibir
+        self.al_rechazar = al_rechazar
+        self.clave = clave
+        # origen -> (última secuencia aceptada, cuándo), del más antiguo al más reciente
+        self.secuencias = OrderedDict()
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind((direccion, puerto))
+        self.activo = True
+        self.hilo = threading.Thread(target=self.ejecutar, name="EntradaRed", daemon=True)
+        self.hilo.start()
+
+    @property
+    def direccion(self):
+        return self.socket.getsockname()
+
+    def ejecutar(self):
+        while self.activo:
+            try:
+                datagrama, origen = self.socket.recvfrom(TAMANO_MAXIMO_DATAGRAMA)
+            except OSError:
+                # Socket cerrado al terminar, o error transitorio de la red
+                continue
+            recibido = time.time()
+            try:
+                mensaje = decodificar_pulsacion(datagrama, self.clave)
+            except ValueError as e:
+                # Sin respuesta: no confirma a un tercero que hay algo escuchando
+                if self.al_rechazar:
+                    self.al_rechazar(origen, str(e))
+                continue
+            if not self.aceptar_secuencia(origen, mensaje['secuencia'], recibido):
+                continue
+            self.al_recibir(mensaje, origen, recibido)
+
+    def aceptar_secuencia(self, origen, secuencia, recibido):
+        while self.secuencias:
+            _, (_, cuando) = next(iter(self.secuencias.items()))
+            if recibido - cuando < OLVIDO_ORIGEN_S:
+                break
+            self.secuencias.popitem(last=False)
+        anterior = self.secuencias.get(origen)
+        if anterior is not None and secuencia <= anterior[0]:
+            return False
+        self.secuencias[origen] = (secuencia, recibido)
+        self.secuencias.move_to_end(origen)
+        if len(self.secuencias) > MAXIMO_ORIGENES:
+            self.secuencias.popitem(last=False)
+        return True
+
+    def responder(self, origen, datos):
+        # Seguro desde cualquier hilo: un sendto por respuesta
+        try:
+            self.socket.sendto(codificar(datos), origen)
+        except OSError:
+            pass
+
+    def cerrar(self):
+        self.activo = False
+        self.socket.close()
+
+# ===============================================================================
+# CLIENTE DE PRUEBA
+# ===============================================================================
+def percentil(valores, fraccion):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(fraccion * len(ordenados)))]
+
+def enviar_pulsaciones(argumentos):
+    cliente = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    cliente.settimeout(argumentos.espera)
+    destino = (argumentos.host, argumentos.puerto)
+    # Secuencia inicial distinta en cada ejecución, por si el puerto local se repite
+    secuencia = int(time.time() * 1000)
+    ida_y_vuelta = []
+    perdidas = 0
+    for indice in range(argumentos.repeticiones):
+        secuencia += 1
+        mensaje = {'jugador': argumentos.jugador, 'boton': argumentos.boton,
+                   'secuencia': secuencia, 'enviado': time.time()}
+        if argumentos.clave is not None:
+            mensaje['clave'] = argumentos.clave
+        inicio = time.perf_counter()
+        cliente.sendto(codificar(mensaje), destino)
+        try:
+            while True:
+                respuesta = json.loads(cliente.recv(TAMANO_MAXIMO_DATAGRAMA).decode('utf-8'))
+                if respuesta.get('secuencia', secuencia) == secuencia:
+                    break
+        except (socket.timeout, ValueError, OSError) as e:
+            perdidas += 1
+            # También es lo que ve un cliente con la clave incorrecta
+            print(f"#{indice + 1}: sin respuesta ({e})")
+            continue
+        milisegundos = (time.perf_counter() - inicio) * 1000
+        ida_y_vuelta.append(milisegundos)
+        espera = f", {respuesta['espera_ms']:.1f} ms en cola" if 'espera_ms' in respuesta else ""
+        print(f"#{indice + 1}: {respuesta.get('resultado')} en {milisegundos:.1f} ms{espera}")
+        if indice + 1 < argumentos.repeticiones:
+            time.sleep(argumentos.intervalo)
+    cliente.close()
+    if ida_y_vuelta:
+        print(f"Ida y vuelta: mediana {percentil(ida_y_vuelta, 0.5):.1f} ms, "
+              f"p95 {percentil(ida_y_vuelta, 0.95):.1f} ms, máx {max(ida_y_vuelta):.1f} ms "
+              f"({len(ida_y_vuelta)} respuestas, {perdidas} perdidas)")
+    return 1 if perdidas else 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cliente de prueba de la entrada por red de Aurora Australis")
+    subcomandos = parser.add_subparsers(dest='comando', required=True)
+    enviar = subcomandos.add_parser('enviar', help="Enviar pulsaciones y medir la latencia de ida y vuelta")
+    enviar.add_argument('--host', default='127.0.0.1')
+    enviar.add_argument('--puerto', type=int, default=PUERTO_POR_OMISION)
+    enviar.add_argument('--jugador', type=int, required=True)
+    enviar.add_argument('--boton', type=int, required=True)
+    enviar.add_argument('--clave', default=None)
+    enviar.add_argument('--repeticiones', type=int, default=1)
+    enviar.add_argument('--intervalo', type=float, default=1.0, help="Segundos entre pulsaciones")
+    enviar.add_argument('--espera', type=float, default=2.0, help="Segundos máximos por respuesta")
+    argumentos = parser.parse_args(argv)
+    return enviar_pulsaciones(argumentos)
+
+if __name__ == '__main__':
+    sys.exit(main())
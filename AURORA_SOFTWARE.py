@@ -2,50 +2,216 @@ import math
 import pygame
 import os
 import sys
-from PIL import Image, ImageSequence
 import logging
 import datetime
 import csv
+import time
+import queue
+import atexit
+import bisect
+import threading
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+import AURORA_CARGA
+import AURORA_ANALISIS
+import AURORA_CAPAS
+import AURORA_AUDIO
+import AURORA_METRICAS
+import AURORA_RED
+import AURORA_MEMORIA
 
 # ===============================================================================
-# CONFIGURACIÓN DE LOGGING CSV
+# REGISTRO EN SEGUNDO PLANO (CSV DE EVENTOS Y LOG DE LA APLICACIÓN)
 # ===============================================================================
-# Crear directorio de logs si no existe
-if not os.path.exists('logs'):
-    os.makedirs('logs')
+# El bucle principal solo encola líneas; un hilo las escribe por lotes en
+# archivos que mantiene abiertos y que rota por tamaño o al cambiar el día
+directorio_logs = 'logs'
+lote_registro_lineas = 200
+intervalo_vaciado_registro_s = 1.0
+max_bytes_archivo_registro = 50 * 1024 * 1024
 
-# Crear archivo CSV para eventos de botones
-csv_filename = f"logs/botones_events_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+# Crear directorio de logs si no existe
+if not os.path.exists(directorio_logs):
+    os.makedirs(directorio_logs)
+
+class ArchivoRotativo:
+    # Archivo logs/<prefijo>_<fecha>.<extension> que se reemplaza por uno nuevo
+    # al superar max_bytes o al cambiar el día
+    def __init__(self, prefijo, extension, encabezado=None, eco_consola=False, max_bytes=max_bytes_archivo_registro):
+        self.prefijo = prefijo
+        self.extension = extension
+        self.encabezado = encabezado
+        self.eco_consola = eco_consola
+        self.max_bytes = max_bytes
+        self.archivo = None
+        self.escritor_csv = None
+        self.dia = None
+        self.bytes_escritos = 0
+
+    def abrir(self):
+        self.cerrar()
+        ahora = datetime.datetime.now()
+        ruta = os.path.join(directorio_logs, f"{self.prefijo}_{ahora.strftime('%Y%m%d_%H%M%S')}.{self.extension}")
+        sufijo = 1
+        while os.path.exists(ruta):
+            ruta = os.path.join(directorio_logs, f"{self.prefijo}_{ahora.strftime('%Y%m%d_%H%M%S')}_{sufijo}.{self.extension}")
+            sufijo += 1
+        self.archivo = open(ruta, 'a', newline='', encoding='utf-8')
+        self.escritor_csv = csv.writer(self.archivo)
+        self.dia = ahora.date()
+        self.bytes_escritos = 0
+        if self.encabezado:
+            self.escritor_csv.writerow(self.encabezado)
+
+    def escribir(self, contenido):
+        if (self.archivo is None or self.bytes_escritos >= self.max_bytes
+                or datetime.date.today() != self.dia):
+            self.abrir()
+        if isinstance(contenido, str):
+            self.archivo.write(contenido + '\n')
+            if self.eco_consola:
+                sys.stdout.write(contenido + '\n')
+        else:
+            self.escritor_csv.writerow(contenido)
+        # Posición en bytes del archivo: cuenta las comillas y separadores del CSV
+        # y los caracteres de más de un byte en UTF-8
+        self.bytes_escritos = self.archivo.tell()
 
-# Escribir encabezados en el CSV
-with open(csv_filename, 'w', newline='', encoding='utf-8') as csvfile:
-    csv_writer = csv.writer(csvfile)
-    csv_writer.writerow(['timestamp', 'jugador', 'boton', 'accion', 'nombre_capa'])
+    def vaciar(self):
+        if self.archivo:
+            self.archivo.flush()
+        if self.eco_consola:
+            sys.stdout.flush()
 
-# Función para registrar eventos en CSV
-def log_evento_csv(jugador, boton, accion, nombre_capa):
+    def cerrar(self):
+        if self.archivo:
+            self.archivo.close()
+            self.archivo = None
+
+class EscritorRegistros:
+    def __init__(self, lote_maximo, intervalo_vaciado):
+        self.lote_maximo = lote_maximo
+        self.intervalo_vaciado = intervalo_vaciado
+        self.cola = queue.SimpleQueue()
+        self.destinos = {}
+        self.hilo = threading.Thread(target=self.ejecutar, name="EscritorRegistros", daemon=True)
+        self.hilo.start()
+
+    def registrar_destino(self, nombre, archivo_rotativo):
+        self.destinos[nombre] = archivo_rotativo
+
+    def escribir(self, destino, contenido):
+        # contenido: texto (una línea) o lista (una fila CSV)
+        self.cola.put((destino, contenido))
+
+    def ejecutar(self):
+        pendientes = []
+        limite = None
+        activo = True
+        while activo:
+            try:
+                espera = None if limite is None else max(0.0, limite - time.monotonic())
+                elemento = self.cola.get(timeout=espera)
+                if elemento is None:
+                    activo = False
+                else:
+                    if limite is None:
+                        limite = time.monotonic() + self.intervalo_vaciado
+                    pendientes.append(elemento)
+            except queue.Empty:
+                pass
+            if pendientes and (not activo or len(pendientes) >= self.lote_maximo or time.monotonic() >= limite):
+                self.vaciar(pendientes)
+                pendientes = []
+                limite = None
+        for destino in self.destinos.values():
+            destino.cerrar()
+
+    def vaciar(self, pendientes):
+        usados = set()
+        for destino, contenido in pendientes:
+            try:
+                self.destinos[destino].escribir(contenido)
+                usados.add(destino)
+            except Exception as e:
+                # El logger escribe a través de este hilo: informar por stderr
+                sys.stderr.write(f"Error al escribir registro {destino}: {e}\n")
+        for destino in usados:
+            try:
+                self.destinos[destino].vaciar()
+            except Exception as e:
+                sys.stderr.write(f"Error al vaciar registro {destino}: {e}\n")
+
+    def cerrar(self):
+        # Escribe todo lo encolado y espera al hilo
+        if self.hilo.is_alive():
+            self.cola.put(None)
+            self.hilo.join(timeout=10)
+
+class ManejadorRegistroEnCola(logging.Handler):
+    # Formatea en el hilo que registra y delega la escritura al EscritorRegistros
+    def __init__(self, escritor, destino):
+        super().__init__()
+        self.escritor = escritor
+        self.destino = destino
+
+    def emit(self, record):
+        try:
+            self.escritor.escribir(self.destino, self.format(record))
+        except Exception:
+            self.handleError(record)
+
+escritor_registros = EscritorRegistros(lote_registro_lineas, intervalo_vaciado_registro_s)
+escritor_registros.registrar_destino('eventos', ArchivoRotativo(
+    'botones_events', 'csv', encabezado=['timestamp', 'jugador', 'boton', 'accion', 'nombre_capa', 'archivo_capa']))
+escritor_registros.registrar_destino('aurora', ArchivoRotativo('aurora', 'log', eco_consola=True))
+# Vaciar lo pendiente aunque la aplicación termine por una excepción
+atexit.register(escritor_registros.cerrar)
+
+# Función para registrar eventos en CSV; el archivo distingue capas que
+# comparten nombre
+def log_evento_csv(jugador, boton, accion, capa):
     timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')
-    with open(csv_filename, 'a', newline='', encoding='utf-8') as csvfile:
-        csv_writer = csv.writer(csvfile)
-        csv_writer.writerow([timestamp, jugador, boton, accion, nombre_capa])
+    escritor_registros.escribir('eventos', [timestamp, jugador, boton, accion, capa.nombre, capa.archivo])
 
 # Configurar logger minimalista
+manejador_registro = ManejadorRegistroEnCola(escritor_registros, 'aurora')
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(message)s',
-    handlers=[
-        logging.FileHandler(f"logs/aurora_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.log"),
-        logging.StreamHandler(sys.stdout)
-    ]
+    handlers=[manejador_registro]
 )
 logger = logging.getLogger('AuroraLogger')
 
+# Fases del arranque, cada una con su duración y el tiempo desde el inicio
+inicio_arranque = time.perf_counter()
+fases_arranque = []
+
+def registrar_fase_arranque(nombre):
+    transcurrido = time.perf_counter() - inicio_arranque
+    duracion = transcurrido - (fases_arranque[-1][1] if fases_arranque else 0.0)
+    fases_arranque.append((nombre, transcurrido))
+    logger.info(f"Arranque: {nombre} en {duracion * 1000:.0f} ms ({transcurrido * 1000:.0f} ms desde el inicio)")
+
+# ===============================================================================
+# MODO BENCHMARK (LANZADO POR AURORA_BENCHMARK.py)
+# ===============================================================================
+# Sin monitores ni joysticks: imágenes de prueba y pulsaciones sintéticas
+sesion_benchmark = None
+ruta_imagenes_benchmark = None
+if os.environ.get('AURORA_BENCHMARK'):
+    import AURORA_BENCHMARK
+    sesion_benchmark = AURORA_BENCHMARK.SesionBenchmark(os.environ['AURORA_BENCHMARK'])
+    ruta_imagenes_benchmark = sesion_benchmark.guion['activos']
+    logger.info(f"Modo benchmark: escenario {sesion_benchmark.guion['escenario']}")
+
 # ===============================================================================
 # CONFIGURACIÓN INICIAL DE POSICIÓN DE VENTANA
 # ===============================================================================
 # Establecer posición de la ventana antes de inicializar Pygame
 os.environ['SDL_VIDEO_WINDOW_POS'] = "0,0"
-os.environ['SDL_VIDEODRIVER'] = 'windib'
+os.environ['SDL_VIDEODRIVER'] = 'dummy' if sesion_benchmark else 'windib'
 
 # Inicializar Pygame
 pygame.init()
@@ -64,6 +230,9 @@ for i in range(pygame.joystick.get_count()):
     joysticks.append(joystick)
     logger.info(f"Joystick {i}: {joystick.get_name()}")
 
+# instance_id -> jugador (1, 2, 3), para no recorrer la lista en cada evento
+jugador_por_instancia = {joystick.get_instance_id(): i + 1 for i, joystick in enumerate(joysticks)}
+
 # ===============================================================================
 # CONFIGURACIÓN DE VENTANA CON TRES MONITORES (5760x1080)
 # ===============================================================================
@@ -78,13 +247,17 @@ logger.info(f"Joysticks detectados: {pygame.joystick.get_count()}")
 # Crear ventana sin bordes del tamaño de los tres monitores
 screen = pygame.display.set_mode((screen_width, screen_height), pygame.NOFRAME)
 pygame.display.set_caption("Proyecto Aurora Australis")
+registrar_fase_arranque("pygame, joysticks y ventana")
 
 # ===============================================================================
 # PANTALLA DE CARGA (SPLASH SCREEN)
 # ===============================================================================
 def mostrar_splash():
     try:
-        splash = pygame.image.load(r"C:\IMAGENES\SPLASH.png")
+        if ruta_imagenes_benchmark:
+            splash = pygame.image.load(os.path.join(ruta_imagenes_benchmark, "SPLASH.png"))
+        else:
+            splash = pygame.image.load(r"C:\IMAGENES\SPLASH.png")
         splash = pygame.transform.scale(splash, (screen_width, screen_height))
         screen.blit(splash, (0, 0))
         pygame.display.flip()
@@ -95,6 +268,7 @@ def mostrar_splash():
 
 # Mostrar splash screen al inicio
 splash_visible = mostrar_splash()
+registrar_fase_arranque("pantalla de carga")
 
 # ===============================================================================
 # CONFIGURACIÓN DE SONIDOS
@@ -132,32 +306,253 @@ teclas_sonidos = {
     pygame.K_y: "Productivo.mp3"
 }
 
+# ===============================================================================
+# AUDIO DECODIFICADO BAJO DEMANDA
+# ===============================================================================
+# Presupuesto para clips decodificados en memoria (el PCM ocupa ~10 MB por minuto)
+presupuesto_audio_mb = 64
+# Los clips más largos no se cargan enteros: se reproducen por fragmentos
+# leídos del PCM mapeado desde la caché en disco
+duracion_minima_streaming_s = 45
+segundos_fragmento_streaming = 2
+ruta_cache_audio = os.path.join('cache', 'audio')
+
+# Eventos del hilo de audio (clip listo) y de los canales en streaming (fragmento terminado)
+evento_audio_decodificado = pygame.event.custom_type()
+evento_fragmento_terminado = pygame.event.custom_type()
+
+class ClipAudio:
+    # Ocupa el lugar de pygame.mixer.Sound en capas y teclas, con el mismo
+    # play()/stop(); el audio se decodifica recién cuando hace falta
+    def __init__(self, gestor, ruta):
+        self.gestor = gestor
+        self.ruta = ruta
+        self.nombre = os.path.basename(ruta)
+        # Se pidió reproducir mientras el audio todavía se decodificaba
+        self.esperando = False
+        # Reproducción por fragmentos en curso: [pcm, posición, canal]
+        self.stream = None
+
+    def preparar(self):
+        self.gestor.preparar(self.ruta)
+
+    def play(self):
+        self.gestor.reproducir(self)
+
+    def stop(self):
+        self.gestor.detener(self)
+
+class GestorAudio:
+    def __init__(self, presupuesto_bytes, directorio_cache):
+        self.presupuesto_bytes = presupuesto_bytes
+        self.directorio_cache = directorio_cache
+        self.formato = pygame.mixer.get_init()
+        self.bytes_por_segundo = AURORA_AUDIO.bytes_por_segundo(self.formato)
+        self.umbral_streaming = duracion_minima_streaming_s * self.bytes_por_segundo
+        self.bytes_fragmento = segundos_fragmento_streaming * self.bytes_por_segundo
+        # Un hilo para lo que se va a reproducir y otro para calentar la caché,
+        # así un clip pedido nunca espera detrás del calentamiento
+        self.pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="DecodificarAudio")
+        self.pool_fondo = ThreadPoolExecutor(max_workers=1, thread_name_prefix="CalentarAudio")
+        # ruta -> (pygame.mixer.Sound, bytes), del usado hace más tiempo al más reciente
+        self.sonidos = OrderedDict()
+        self.bytes_usados = 0
+        # ruta -> PCM mapeado de los clips que se reproducen por fragmentos
+        self.fuentes_stream = {}
+        # ruta -> futuro del último pedido de decodificación
+        self.pedidos = {}
+        self.clips = {}
+        self.en_stream = set()
+        # Rutas que no existen o no se pudieron decodificar: no se reintentan
+        # hasta que el vigilante avise que el archivo apareció o cambió
+        self.fallidos = set()
+
+    def clip(self, ruta):
+        # Un único ClipAudio por archivo
+        if ruta not in self.clips:
+            self.clips[ruta] = ClipAudio(self, ruta)
+        return self.clips[ruta]
+
+    def decodificar(self, ruta):
+        # En el hilo de audio: PCM desde la caché o decodificando el archivo
+        pcm, segundos, desde_cache = AURORA_AUDIO.obtener_pcm(ruta, self.formato, self.directorio_cache)
+        if len(pcm) < self.umbral_streaming:
+            return pygame.mixer.Sound(buffer=pcm), segundos, desde_cache
+        if not desde_cache:
+            # Recién escrito: usar el archivo mapeado en vez de retener el PCM decodificado
+            pcm = AURORA_AUDIO.leer_pcm(self.directorio_cache, ruta, self.formato) or pcm
+        return pcm, segundos, desde_cache
+
+    def preparar(self, ruta):
+        # Decodificar en segundo plano si el clip no está listo
+        if ruta in self.sonidos or ruta in self.fuentes_stream or ruta in self.pedidos or ruta in self.fallidos:
+            return
+        futuro = self.pool.submit(self.decodificar, ruta)
+        self.pedidos[ruta] = futuro
+        futuro.add_done_callback(lambda terminado: pygame.event.post(pygame.event.Event(
+            evento_audio_decodificado, ruta=ruta, futuro=terminado)))
+
+    def calentar(self, rutas):
+        # Deja el PCM de todos los clips en la caché en disco sin retenerlo en memoria
+        for ruta in rutas:
+            self.pool_fondo.submit(self.calentar_clip, ruta)
+
+    def calentar_clip(self, ruta):
+        try:
+            _, segundos, desde_cache = AURORA_AUDIO.obtener_pcm(ruta, self.formato, self.directorio_cache)
+            if not desde_cache:
+                logger.info(f"Sonido decodificado a la caché: {os.path.basename(ruta)} ({segundos * 1000:.0f} ms)")
+        except Exception as e:
+            logger.error(f"Error al cargar sonido {os.path.basename(ruta)}: {e}")
+
+    def aplicar(self, evento):
+        # En el bucle principal: guardar el clip decodificado y reproducir lo que esperaba
+        if self.pedidos.get(evento.ruta) is not evento.futuro:
+            return
+        del self.pedidos[evento.ruta]
+        clip = self.clips.get(evento.ruta)
+        try:
+            datos, segundos, desde_cache = evento.futuro.result()
+        except Exception as e:
+            logger.error(f"Error al cargar sonido {os.path.basename(evento.ruta)}: {e}")
+            self.fallidos.add(evento.ruta)
+            if clip is not None:
+                clip.esperando = False
+            return
+        origen = "caché" if desde_cache else "decodificación"
+        if isinstance(datos, pygame.mixer.Sound):
+            tam = int(datos.get_length() * self.bytes_por_segundo)
+            self.sonidos[evento.ruta] = (datos, tam)
+            self.bytes_usados += tam
+            logger.info(f"Sonido cargado: {os.path.basename(evento.ruta)} ({tam / 1048576:.1f} MB; "
+                        f"{origen} {segundos * 1000:.0f} ms)")
+            self.expulsar_sobrantes()
+        else:
+            self.fuentes_stream[evento.ruta] = datos
+            logger.info(f"Sonido listo para streaming: {os.path.basename(evento.ruta)} "
+                        f"({len(datos) / self.bytes_por_segundo:.0f} s; {origen} {segundos * 1000:.0f} ms)")
+        if clip is not None and clip.esperando:
+            clip.esperando = False
+            self.reproducir(clip)
+
+    def expulsar_sobrantes(self):
+        for ruta in list(self.sonidos):
+            if self.bytes_usados <= self.presupuesto_bytes:
+                break
+            sonido, tam = self.sonidos[ruta]
+            # Nunca se expulsa un clip que está sonando
+            if sonido.get_num_channels() > 0:
+                continue
+            del self.sonidos[ruta]
+            self.bytes_usados -= tam
+            logger.info(f"Sonido expulsado de memoria: {os.path.basename(ruta)}")
+
+    def reproducir(self, clip):
+        entrada = self.sonidos.get(clip.ruta)
+        if entrada is not None:
+            self.sonidos.move_to_end(clip.ruta)
+            entrada[0].play()
+            return
+        pcm = self.fuentes_stream.get(clip.ruta)
+        if pcm is not None:
+            self.iniciar_stream(clip, pcm)
+            return
+        if clip.ruta in self.fallidos:
+            return
+        # Todavía no decodificado: suena apenas esté listo
+        clip.esperando = True
+        self.preparar(clip.ruta)
+
+    def detener(self, clip):
+        clip.esperando = False
+        entrada = self.sonidos.get(clip.ruta)
+        if entrada is not None:
+            entrada[0].stop()
+        if clip.stream is not None:
+            canal = clip.stream[2]
+            clip.stream = None
+            self.en_stream.discard(clip)
+            canal.set_endevent()
+            canal.stop()
+
+    def iniciar_stream(self, clip, pcm):
+        self.detener(clip)
+        canal = pygame.mixer.find_channel()
+        if canal is None:
+            logger.warning(f"Sin canales libres para reproducir {clip.nombre}")
+            return
+        clip.stream = [pcm, 0, canal]
+        self.en_stream.add(clip)
+        canal.set_endevent(evento_fragmento_terminado)
+        canal.play(self.siguiente_fragmento(clip))
+        fragmento = self.siguiente_fragmento(clip)
+        if fragmento is not None:
+            canal.queue(fragmento)
+
+    def siguiente_fragmento(self, clip):
+        pcm, posicion, _ = clip.stream
+        if posicion >= len(pcm):
+            return None
+        clip.stream[1] = posicion + self.bytes_fragmento
+        return pygame.mixer.Sound(buffer=pcm[posicion:posicion + self.bytes_fragmento])
+
+    def alimentar_streams(self):
+        # Terminó un fragmento en algún canal: encolar el siguiente donde haga falta
+        for clip in list(self.en_stream):
+            canal = clip.stream[2]
+            if canal.get_queue() is not None:
+                continue
+            fragmento = self.siguiente_fragmento(clip)
+            if fragmento is not None:
+                canal.queue(fragmento)
+            elif not canal.get_busy():
+                canal.set_endevent()
+                clip.stream = None
+                self.en_stream.discard(clip)
+
+    def archivo_modificado(self, ruta):
+        # El archivo cambió en disco: descartar lo ya decodificado y, si estaba
+        # sonando, volver a reproducirlo con la versión nueva
+        clip = self.clips.get(ruta)
+        if clip is None:
+            return
+        self.fallidos.discard(ruta)
+        entrada = self.sonidos.get(ruta)
+        sonando = clip.esperando or clip.stream is not None or (entrada is not None and entrada[0].get_num_channels() > 0)
+        self.detener(clip)
+        if entrada is not None:
+            del self.sonidos[ruta]
+            self.bytes_usados -= entrada[1]
+        self.fuentes_stream.pop(ruta, None)
+        # Un pedido en curso traería la versión anterior
+        self.pedidos.pop(ruta, None)
+        logger.info(f"Sonido modificado en disco: {clip.nombre}")
+        if sonando:
+            self.reproducir(clip)
+
 # Inicializar mixer de pygame
 pygame.mixer.init()
-sonidos_cargados = {}
+gestor_audio = GestorAudio(presupuesto_audio_mb * 1024 * 1024, ruta_cache_audio)
 
-# Cargar todos los sonidos de capas al inicio
+# Los sonidos de capas y teclas se registran sin decodificar; un archivo que
+# falta se registra igual, marcado como fallido, por si aparece más tarde
+# (recarga en caliente)
+sonidos_cargados = {}
 for archivo_capa, archivo_sonido in mapeo_sonidos.items():
     ruta_sonido = os.path.join(ruta_sonidos, archivo_sonido)
-    try:
-        sonido = pygame.mixer.Sound(ruta_sonido)
-        sonidos_cargados[archivo_capa] = sonido
-        logger.info(f"Sonido cargado: {archivo_sonido}")
-    except Exception as e:
-        logger.error(f"Error al cargar sonido {archivo_sonido}: {e}")
-        sonidos_cargados[archivo_capa] = None
+    if not os.path.exists(ruta_sonido):
+        logger.error(f"Error al cargar sonido {archivo_sonido}: no existe {ruta_sonido}")
+        gestor_audio.fallidos.add(ruta_sonido)
+    sonidos_cargados[archivo_capa] = gestor_audio.clip(ruta_sonido)
 
-# Cargar sonidos de teclas
 sonidos_teclas = {}
 for tecla, archivo_sonido in teclas_sonidos.items():
     ruta_sonido = os.path.join(ruta_voz_off, archivo_sonido)
-    try:
-        sonido = pygame.mixer.Sound(ruta_sonido)
-        sonidos_teclas[tecla] = sonido
-        logger.info(f"Sonido de tecla cargado: {archivo_sonido}")
-    except Exception as e:
-        logger.error(f"Error al cargar sonido de tecla {archivo_sonido}: {e}")
-        sonidos_teclas[tecla] = None
+    if not os.path.exists(ruta_sonido):
+        logger.error(f"Error al cargar sonido de tecla {archivo_sonido}: no existe {ruta_sonido}")
+        gestor_audio.fallidos.add(ruta_sonido)
+    sonidos_teclas[tecla] = gestor_audio.clip(ruta_sonido)
+registrar_fase_arranque("sonidos registrados")
 
 # ===============================================================================
 # FUNCIONES DE SÍMBOLOS PERSONALIZADOS
@@ -314,42 +709,259 @@ def dibujar_circulo_doble_borde(surface, color, rect):
     # Círculo interior más pequeño (5px) con grosor 3px
     pygame.draw.circle(surface, color, centro, 5, 3)
 
+# ===============================================================================
+# REGISTRO DE SÍMBOLOS DE LEYENDA
+# ===============================================================================
+# Cada tipo de símbolo se resuelve por tabla: nombre -> función(surface, color, rect, centro).
+# Para agregar un símbolo nuevo basta con registrarlo aquí o con registrar_simbolo().
+def simbolo_circulo(radio, grosor=1):
+    def dibujar(surface, color, rect, centro):
+        pygame.draw.circle(surface, color, centro, radio, grosor)
+    return dibujar
+
+def simbolo_circulo_doble_punteado(surface, color, rect, centro):
+    dibujar_circulo_punteado(surface, color, centro, 15, 2)
+    pygame.draw.circle(surface, color, centro, 6)
+
+def simbolo_cuadrado_relleno(surface, color, rect, centro):
+    pygame.draw.rect(surface, color, rect)
+
+def simbolo_desde_rect(funcion):
+    def dibujar(surface, color, rect, centro):
+        funcion(surface, color, rect)
+    return dibujar
+
+simbolos_leyenda = {
+    "circulo_5": simbolo_circulo(5),
+    "circulo_15": simbolo_circulo(15),
+    "circulo_20": simbolo_circulo(20),
+    "circulo_20_relleno": simbolo_circulo(20, 0),
+    "circulo_fijo_15_borde": simbolo_circulo(15, 2),
+    "circulo_doble_punteado": simbolo_circulo_doble_punteado,
+    "diagonal_x": simbolo_desde_rect(dibujar_simbolo_diagonal),
+    "diamond_red_dot": simbolo_desde_rect(dibujar_simbolo_diamante),
+    "linea_solida": simbolo_desde_rect(dibujar_linea_solida),
+    "linea_punteada": simbolo_desde_rect(dibujar_linea_punteada),
+    "punto_circulo": simbolo_desde_rect(dibujar_punto_circulo),
+    "limite_predial": simbolo_desde_rect(dibujar_limite_predial),
+    "incendio": simbolo_desde_rect(dibujar_simbolo_incendios),
+    "cuadrado_relleno": simbolo_cuadrado_relleno,
+    "triangulo_8": simbolo_desde_rect(dibujar_triangulo),
+    "cruz": simbolo_desde_rect(dibujar_cruz),
+    "cruz_con_circulo": simbolo_desde_rect(dibujar_cruz_con_circulo),
+    "circulo_doble": simbolo_desde_rect(dibujar_circulo_doble),
+    "linea_2px": simbolo_desde_rect(dibujar_linea_2px),
+    "circulo_doble_relleno": simbolo_desde_rect(dibujar_circulo_doble_relleno),
+    # Nuevo símbolo para patrimonio geológico
+    "circulo_doble_borde": simbolo_desde_rect(dibujar_circulo_doble_borde),
+}
+
+# resolver_simbolo corre también en el hilo de leyendas, que agrega los genéricos
+candado_simbolos = threading.Lock()
+
+def registrar_simbolo(nombre, funcion):
+    with candado_simbolos:
+        simbolos_leyenda[nombre] = funcion
+
+def resolver_simbolo(nombre):
+    with candado_simbolos:
+        if nombre in simbolos_leyenda:
+            return simbolos_leyenda[nombre]
+    funcion = simbolo_cuadrado_relleno
+    # Símbolos genéricos "circulo_N" y "circulo_N_relleno"
+    if nombre and nombre.startswith("circulo_"):
+        try:
+            radio = int(nombre.split("_")[1])
+            funcion = simbolo_circulo(radio, 0 if "_relleno" in nombre else 1)
+        except ValueError:
+            pass
+    if nombre:
+        with candado_simbolos:
+            funcion = simbolos_leyenda.setdefault(nombre, funcion)
+    return funcion
+
 # ===============================================================================
 # FUNCIONES DE CARGA DE IMÁGENES
 # ===============================================================================
-def cargar_gif(ruta, ancho, alto):
-    try:
-        gif = Image.open(ruta)
-        frames = []
-        for frame in ImageSequence.Iterator(gif):
-            frame = frame.convert("RGBA")
-            pygame_frame = pygame.image.fromstring(
-                frame.tobytes(), frame.size, frame.mode
-            ).convert_alpha()
-            frames.append(pygame.transform.scale(pygame_frame, (ancho, alto)))
-        logger.info(f"GIF cargado: {ruta} ({len(frames)} frames)")
-        return frames
-    except Exception as e:
-        logger.error(f"Error al cargar GIF {ruta}: {e}")
-        return [pygame.Surface((ancho, alto))]
+# Hilos para decodificar en paralelo; PIL libera el GIL al decodificar, convertir y escalar
+hilos_carga = max(1, (os.cpu_count() or 2) - 1)
+
+# Caché en disco de imágenes ya escaladas (None para desactivarla).
+# Se precalcula con: python AURORA_CARGA.py construir --imagenes C:\IMAGENES
+ruta_cache_imagenes = 'cache'
+
+def formato_pixeles_pantalla():
+    # Orden de bytes de las superficies con alfa de la pantalla actual
+    mascaras = tuple(pygame.Surface((1, 1), pygame.SRCALPHA).convert_alpha().get_masks())
+    if mascaras == (0xff0000, 0xff00, 0xff, 0xff000000):
+        return "BGRA", True
+    if mascaras == (0xff, 0xff00, 0xff0000, 0xff000000):
+        return "RGBA", True
+    return "RGBA", False
+
+formato_pixeles, formato_pixeles_nativo = formato_pixeles_pantalla()
+
+# Las capas con alfa se guardan como teselas de AURORA_CARGA.TAM_TESELA px sin las
+# completamente transparentes, salvo que las no vacías cubran más de esta fracción
+fraccion_maxima_teselas = 0.75
+
+def obtener_datos_imagen(ruta, ancho, alto):
+    return AURORA_CARGA.obtener_frames(ruta, ancho, alto, formato_pixeles, ruta_cache_imagenes)
+
+class AnimacionCompacta:
+    # Un único lienzo editable al que, en cada avance, solo se le copia el
+    # rectángulo que cambió respecto del frame anterior
+    def __init__(self, datos, ancho, alto, desde_cache):
+        self.duraciones = datos['duraciones']
+        paletizada = datos['modo'] == 'P'
+
+        def superficie(buffer, tam):
+            if paletizada:
+                nueva = pygame.image.frombuffer(buffer, tam, 'P')
+                nueva.set_palette(datos['paleta'])
+                return nueva
+            nueva = pygame.image.frombuffer(buffer, tam, formato_pixeles)
+            return nueva if (desde_cache and formato_pixeles_nativo) else nueva.convert_alpha()
+
+        # El lienzo siempre es una copia propia porque se modifica al avanzar
+        if paletizada:
+            self.lienzo = superficie(datos['base'], (ancho, alto)).copy()
+            if datos['transparente'] is not None:
+                self.lienzo.set_colorkey(datos['transparente'])
+        else:
+            self.lienzo = pygame.image.frombuffer(datos['base'], (ancho, alto), formato_pixeles).convert_alpha()
 
-def cargar_imagen_escalada(ruta, ancho, alto):
+        self.parches = []
+        self.rect_contenido = self.lienzo.get_bounding_rect()
+        for rect, buffer in zip(datos['rects'], datos['parches']):
+            if rect is None:
+                self.parches.append(None)
+                continue
+            rect = pygame.Rect(rect)
+            self.parches.append((rect, superficie(buffer, rect.size)))
+            self.rect_contenido.union_ip(rect)
+        self.indice = 0
+
+    def __len__(self):
+        return len(self.parches)
+
+    def duracion(self, indice, por_defecto):
+        # Igual que los navegadores, duraciones de 10 ms o menos usan el valor por defecto
+        duracion = self.duraciones[indice] if indice < len(self.duraciones) else 0
+        return duracion if duracion > 10 else por_defecto
+
+    def avanzar(self):
+        # Devuelve el rectángulo del lienzo que cambió, o None
+        self.indice = (self.indice + 1) % len(self.parches)
+        parche = self.parches[self.indice]
+        if parche is None:
+            return None
+        rect, superficie = parche
+        if self.lienzo.get_bitsize() != 8:
+            # Reemplazar en vez de mezclar: los píxeles del GIF son opacos o transparentes
+            self.lienzo.fill((0, 0, 0, 0), rect)
+        self.lienzo.blit(superficie, rect)
+        return rect
+
+    def bytes_en_memoria(self):
+        superficies = [self.lienzo] + [parche[1] for parche in self.parches if parche]
+        return sum(s.get_pitch() * s.get_height() for s in superficies)
+
+class ImagenTeselada:
+    # Solo las teselas con algún píxel visible, como pares (superficie, posición)
+    # listos para pantalla.blits; el frame completo no se conserva
+    def __init__(self, frame, rects, clave=None):
+        self.teselas = []
+        self.rect_contenido = None
+        for rect in rects:
+            rect = pygame.Rect(rect)
+            tesela = frame.subsurface(rect).copy()
+            if clave is not None:
+                tesela.set_colorkey(clave, pygame.RLEACCEL)
+            self.teselas.append((tesela, rect.topleft))
+            limites = tesela.get_bounding_rect().move(rect.topleft)
+            self.rect_contenido = limites if self.rect_contenido is None else self.rect_contenido.union(limites)
+
+    def __len__(self):
+        return len(self.teselas)
+
+    def superficies(self):
+        return [tesela for tesela, _ in self.teselas]
+
+def cargar_imagen_escalada(ruta, ancho, alto, futuro=None):
+    # Si se entrega un futuro, la decodificación ya corre en el pool de carga.
+    # Devuelve una lista de frames, una ImagenTeselada para capas dispersas o
+    # una AnimacionCompacta para GIF animados
     try:
-        if ruta.lower().endswith('.gif'):
-            return cargar_gif(ruta, ancho, alto)
+        if futuro is not None:
+            datos, segundos_lectura, desde_cache = futuro.result()
         else:
-            imagen = pygame.image.load(ruta).convert_alpha()
-            logger.info(f"Imagen cargada: {ruta}")
-            return [pygame.transform.scale(imagen, (ancho, alto))]
+            datos, segundos_lectura, desde_cache = obtener_datos_imagen(ruta, ancho, alto)
+        inicio = time.perf_counter()
+        origen = "caché" if desde_cache else "decodificación"
+        if datos['tipo'] == 'animacion':
+            animacion = AnimacionCompacta(datos, ancho, alto, desde_cache)
+            tiempos = (f"{origen} {segundos_lectura * 1000:.0f} ms, "
+                       f"conversión {(time.perf_counter() - inicio) * 1000:.0f} ms")
+            logger.info(f"GIF cargado: {ruta} ({len(animacion)} frames en modo {datos['modo']}, "
+                        f"{animacion.bytes_en_memoria() / 1048576:.1f} MB; {tiempos})")
+            return animacion
+
+        frames = []
+        for buffer in datos['frames']:
+            frame = pygame.image.frombuffer(buffer, (ancho, alto), formato_pixeles)
+            if datos['alfa'] == 'opaco':
+                # Sin alfa por píxel: los fades usan el blit con alfa de superficie
+                frame = frame.convert()
+            elif datos['alfa'] == 'binario':
+                # Los píxeles transparentes ya traen el color clave; RLE salta esas rachas
+                frame = frame.convert()
+                frame.set_colorkey(datos['clave'], pygame.RLEACCEL)
+            elif not (desde_cache and formato_pixeles_nativo):
+                # Los frames mapeados desde la caché ya están en el formato de la
+                # pantalla y se usan sin copiar
+                frame = frame.convert_alpha()
+            frames.append(frame)
+
+        teselas = datos.get('teselas')
+        area_teselas = sum(w * h for _, _, w, h in teselas) if teselas else 0
+        if len(frames) == 1 and 0 < area_teselas <= fraccion_maxima_teselas * ancho * alto:
+            # Capa dispersa: se copian solo las teselas visibles y el frame completo se suelta
+            imagen = ImagenTeselada(frames[0], teselas, datos['clave'] if datos['alfa'] == 'binario' else None)
+            tiempos = (f"{origen} {segundos_lectura * 1000:.0f} ms, "
+                       f"conversión {(time.perf_counter() - inicio) * 1000:.0f} ms")
+            logger.info(f"Imagen cargada: {ruta} (alfa {datos['alfa']}, {len(imagen)} teselas en el "
+                        f"{area_teselas * 100 / (ancho * alto):.0f}% del área; {tiempos})")
+            return imagen
+        tiempos = (f"{origen} {segundos_lectura * 1000:.0f} ms, "
+                   f"conversión {(time.perf_counter() - inicio) * 1000:.0f} ms")
+        logger.info(f"Imagen cargada: {ruta} (alfa {datos['alfa']}; {tiempos})")
+        return frames
     except Exception as e:
         logger.error(f"Error al cargar {ruta}: {e}")
         return [pygame.Surface((ancho, alto))]
 
+def calcular_rect_contenido(frames):
+    # Unión de las zonas no transparentes de todos los frames
+    rect = None
+    for frame in frames:
+        limites = frame.get_bounding_rect()
+        rect = limites if rect is None else rect.union(limites)
+    return rect
+
 # ===============================================================================
 # CLASE DE IMAGEN CON FADE Y SONIDO
 # ===============================================================================
+# Tiempo de un fade completo (alfa de 0 a 255) medido en tiempo real, igual en
+# un kiosco lento que en uno rápido
+duracion_fade_ms = 550
+
 class ImagenConFade:
     def __init__(self, config):
+        self.config = config
+        self.identidad = AURORA_CAPAS.identidad_capa(config)
+        self.jugador = config['jugador']
+        self.boton = config['boton']
         self.nombre = config['nombre']
         self.archivo = config.get('archivo', '')
         self.es_reinicio = config.get('es_reinicio', False)
@@ -361,13 +973,23 @@ class ImagenConFade:
 
         # Atributos de animación
         self.frames = []
+        # Pares (superficie, posición) si la capa está teselada; frames son sus superficies
+        self.teselas = None
         self.frame_actual = 0
         self.alpha = 0
-        self.velocidad_fade = 15
+        self.duracion_fade_ms = duracion_fade_ms
+        # Instante (ms, con fracción) desde el que se cuenta el avance del fade en curso
+        self.marca_fade = None
         self.activa = False
+        # Activada antes de tener sus frames: espera al cargador de capas
+        self.cargando = False
         self.orden = 0
         self.ultimo_update = pygame.time.get_ticks()
+        # Duración por defecto de un frame cuando el GIF no la indica
         self.intervalo_animacion = 100
+        self.animacion = None
+        # Región que cambió la animación desde el último frame presentado
+        self.rect_animacion = None
         
         # Atributos de sonido
         self.sonido = None
@@ -378,16 +1000,89 @@ class ImagenConFade:
             self.sonido = sonidos_cargados[self.archivo]
             logger.info(f"Sonido asignado a capa '{self.nombre}'")
         
-        if self.archivo:
-            ruta_completa = os.path.join(ruta_imagenes, self.archivo)
-            self.frames = cargar_imagen_escalada(ruta_completa, 3840, 1080)
+        # Los frames se cargan bajo demanda a través de gestor_capas
+        self.ruta_completa = os.path.join(ruta_imagenes, self.archivo) if self.archivo else None
+        # Región de pantalla que puede cambiar al dibujar esta capa
+        self.rect_contenido = None
+
+    def cargar_frames(self, frames=None):
+        if self.ruta_completa and not self.frames:
+            if frames is None:
+                frames = cargar_imagen_escalada(self.ruta_completa, 3840, 1080)
+            if isinstance(frames, AnimacionCompacta):
+                # Las animaciones se dibujan siempre desde su lienzo
+                self.animacion = frames
+                self.frames = [frames.lienzo]
+                self.rect_contenido = frames.rect_contenido
+                self.ultimo_update = pygame.time.get_ticks()
+            elif isinstance(frames, ImagenTeselada):
+                self.teselas = frames.teselas
+                self.frames = frames.superficies()
+                self.rect_contenido = frames.rect_contenido
+            else:
+                self.frames = frames
+                self.rect_contenido = calcular_rect_contenido(self.frames)
+            self.frame_actual = 0
 
-    def actualizar_animacion(self):
-        if self.frames:
-            ahora = pygame.time.get_ticks()
-            if ahora - self.ultimo_update > self.intervalo_animacion:
-                self.frame_actual = (self.frame_actual + 1) % len(self.frames)
-                self.ultimo_update = ahora
+    def liberar_frames(self):
+        self.frames = []
+        self.teselas = None
+        self.animacion = None
+        self.frame_actual = 0
+        self.rect_contenido = None
+
+    def reemplazar_frames(self, frames):
+        # Archivo modificado en disco: frames nuevos sin tocar el fade ni el orden
+        self.liberar_frames()
+        self.cargar_frames(frames)
+        self.ultimo_update = pygame.time.get_ticks()
+
+    def adoptar_estado(self, anterior):
+        # Recarga de configuración: la capa recreada conserva los frames ya
+        # cargados y su estado en pantalla
+        for atributo in ('frames', 'teselas', 'animacion', 'frame_actual', 'rect_contenido',
+                         'rect_animacion', 'activa', 'cargando', 'orden', 'ultimo_update', 'marca_fade',
+                         'sonido_reproduciendose'):
+            setattr(self, atributo, getattr(anterior, atributo))
+        self.alpha = min(anterior.alpha, self.max_alpha)
+
+    def bytes_en_memoria(self):
+        if self.animacion:
+            return self.animacion.bytes_en_memoria()
+        return sum(frame.get_pitch() * frame.get_height() for frame in self.frames)
+
+    def duracion_frame_actual(self):
+        return self.animacion.duracion(self.frame_actual, self.intervalo_animacion)
+
+    def actualizar_animacion(self, ahora, intervalo_minimo=0):
+        # Avanza según el reloj: si el bucle se atrasó, o el gobernador de calidad
+        # pide redibujar menos seguido, los frames intermedios se aplican al
+        # lienzo sin llegar a presentarse
+        if not self.animacion or ahora < self.proximo_frame_ms(intervalo_minimo):
+            return
+        avanzados = 0
+        while ahora - self.ultimo_update >= self.duracion_frame_actual() and avanzados < len(self.animacion):
+            self.ultimo_update += self.duracion_frame_actual()
+            rect = self.animacion.avanzar()
+            self.frame_actual = self.animacion.indice
+            avanzados += 1
+            if rect is not None:
+                self.rect_animacion = rect if self.rect_animacion is None else self.rect_animacion.union(rect)
+        if avanzados == len(self.animacion):
+            # Más de un ciclo de atraso (capa oculta o recién cargada): retomar desde ahora
+            self.ultimo_update = ahora
+
+    def en_transicion(self):
+        if self.activa:
+            return self.alpha < self.max_alpha
+        return self.alpha > 0
+
+    def es_animada(self):
+        return self.animacion is not None
+
+    def proximo_frame_ms(self, intervalo_minimo=0):
+        # Instante (en ticks) en que actualizar_animacion avanzará de frame
+        return self.ultimo_update + max(self.duracion_frame_actual(), intervalo_minimo)
 
     def reproducir_sonido(self):
         if self.sonido and not self.sonido_reproduciendose:
@@ -401,135 +1096,356 @@ class ImagenConFade:
             self.sonido_reproduciendose = False
             logger.info(f"Deteniendo sonido para capa '{self.nombre}'")
 
-    def fade_in(self):
+    def pasos_fade(self, ahora):
+        # Unidades de alfa que corresponden al tiempo transcurrido; la fracción
+        # sobrante queda en marca_fade para el próximo frame
+        if self.marca_fade is None:
+            self.marca_fade = ahora
+            return 0
+        pasos = int((ahora - self.marca_fade) * 255 / self.duracion_fade_ms)
+        self.marca_fade += pasos * self.duracion_fade_ms / 255
+        return pasos
+
+    def pausar_fade(self):
+        # El fade no avanza este frame y al retomar no recupera el tiempo perdido
+        self.marca_fade = None
+
+    def fade_in(self, ahora):
         if self.alpha < self.max_alpha:
-            self.alpha = min(self.alpha + self.velocidad_fade, self.max_alpha)
+            self.alpha = min(self.alpha + self.pasos_fade(ahora), self.max_alpha)
             if self.alpha == self.max_alpha:
+                self.marca_fade = None
                 logger.info(f"Capa '{self.nombre}' completamente visible")
                 self.reproducir_sonido()
 
-    def fade_out(self):
+    def fade_out(self, ahora):
         if self.alpha > 0:
-            self.alpha = max(self.alpha - self.velocidad_fade, 0)
+            self.alpha = max(self.alpha - self.pasos_fade(ahora), 0)
             if self.alpha == 0:
+                self.marca_fade = None
                 logger.info(f"Capa '{self.nombre}' completamente oculta")
                 self.detener_sonido()
 
     def dibujar(self, pantalla):
         if self.frames:
-            self.actualizar_animacion()
-            frame = self.frames[self.frame_actual]
-            frame.set_alpha(self.alpha)
-            pantalla.blit(frame, (0, 0))
+            frame = self.frames[0]
+            if frame.get_alpha() != self.alpha:
+                # Sin RLEACCEL, set_alpha desactivaría la codificación RLE del colorkey
+                banderas = pygame.RLEACCEL if frame.get_flags() & pygame.RLEACCELOK else 0
+                # Las teselas comparten el alfa: frame es la primera de ellas
+                for superficie in self.frames:
+                    superficie.set_alpha(self.alpha, banderas)
+            if self.teselas:
+                pantalla.blits(self.teselas, doreturn=False)
+            else:
+                pantalla.blit(frame, (0, 0))
 
 # ===============================================================================
 # CONFIGURACIÓN DE CAPAS CON ASIGNACIÓN PERSONALIZADA
 # ===============================================================================
-ruta_imagenes = r"C:\IMAGENES"
-
-# Lista de acciones con asignación específica de jugador y botón
-acciones_y_rutas = [
-    # JUGADOR 1
-    {"nombre": "Fuentes termales", "jugador": 1, "boton": 0, "color": "#00edff", "archivo": "TERMALES.gif", "titulo_leyenda": "Fuentes termales", "leyenda": [{"nombre": "Fuentes termales", "color": "#00edff", "simbolo": "circulo_doble_punteado"}]},
-    {"nombre": "Volcanes activos", "jugador": 1, "boton": 1, "color": "#ffffff", "archivo": "VOLC.gif", "titulo_leyenda": "Volcanes activos", "leyenda": [{"nombre": "Volcanes activos", "color": "#ff7f00", "simbolo": "circulo_20_relleno"}]},
-    {"nombre": "Peligro volcánico", "jugador": 1, "boton": 3, "color": "#ff7f00", "archivo": "PELIGRO.png", "titulo_leyenda": "Peligro volcánico", "leyenda": [{"nombre": "Peligro Alto", "color": "#e31a1c", "simbolo": "cuadrado_relleno"}, {"nombre": "Peligro Medio", "color": "#ff7f00", "simbolo": "cuadrado_relleno"}, {"nombre": "Peligro Bajo", "color": "#ffff00", "simbolo": "cuadrado_relleno"}]},
-    {"nombre": "Distribución araucaria-alerce", "jugador": 1, "boton": 4, "color": "#ffffff", "archivo": "ARALERCE.png", "titulo_leyenda": "Distribución Araucaria y Alerce", "leyenda": [{"nombre": "Araucaria", "color": "#b8ff70", "simbolo": "cuadrado_relleno"}, {"nombre": "Alerce", "color": "#fca3a3", "simbolo": "cuadrado_relleno"}]},
-    {"nombre": "Cuencas/subcuencas/subsubcuencas", "jugador": 1, "boton": 5, "color": "#ffffff", "archivo": "CUENCAS.png", "titulo_leyenda": "Cuencas", "leyenda": [{"nombre": "Subcuencas", "color": "#ffffff", "simbolo": "linea_solida"}, {"nombre": "Sub-subcuencas", "color": "#ffffff", "simbolo": "linea_punteada"}]},
-    {"nombre": "Patrimonio geológico", "jugador": 1, "boton": 6, "color": "#ffd97a", "archivo": "PATRIMONIO.png", "titulo_leyenda": "Patrimonio geológico", "leyenda": [{"nombre": "patrimonio geológico", "color": "#ffd97a", "simbolo": "circulo_doble_borde"}]},
-    {"nombre": "Sistema falla liquiñe ofqui", "jugador": 1, "boton": 7, "color": "#ffffff", "archivo": "FALLAS.gif", "titulo_leyenda": "Dinámica Geológica", "leyenda": [{"nombre": "Sistema de fallas tectónicas", "color": "#ffffff", "simbolo": "linea_punteada"}]},
-    {"nombre": "Bosque nativo", "jugador": 1, "boton": 8, "color": "#668a63", "archivo": "NATIVO.png", "titulo_leyenda": "Bosque nativo", "leyenda": [{"nombre": "Bosque nativo", "color": "#668a63"}]},
-    {"nombre": "Red hidrográfica y masas lacustres", "jugador": 1, "boton": 9, "color": "#a6cee3", "archivo": "HIDRO.png", "titulo_leyenda": "Red hidrográfica y masas lacustres", "leyenda": [{"nombre": "Cuerpos de Agua", "color": "#a6cee3", "simbolo": "cuadrado_relleno"}, {"nombre": "Red hidrográfica", "color": "#a6cee3", "simbolo": "linea_solida"}]},
-    {"nombre": "Tipos forestales", "jugador": 1, "boton": 10, "archivo": "TIPOS_FORES.png", "titulo_leyenda": "Tipos Forestales", "leyenda": [
-        {"nombre": "Alerce", "color": "#7daa46"},
-        {"nombre": "Ciprés de la Cordillera", "color": "#b68d4c"},
-        {"nombre": "Ciprés de las Guaitécas", "color": "#8d6e4e"},
-        {"nombre": "Coihue de Magallanes", "color": "#2e5a3d"},
-        {"nombre": "Coihue/Raulí/tepa", "color": "#3d6b3d"},
-        {"nombre": "Esclerófilo", "color": "#d4b04b"},
-        {"nombre": "Lenga", "color": "#e67e35"},
-        {"nombre": "Roble/Raulí/Coihue", "color": "#85b66f"},
-        {"nombre": "Siempreverde", "color": "#3c793c"},
-        {"nombre": "Araucaria", "color": "#8c9d5b"}
-    ]},
-    {"nombre": "Zonas geológicas", "jugador": 1, "boton": 11, "color": "#ffffff", "archivo": "GEOLOGIA.png", "titulo_leyenda": "Composición Geológica", "leyenda": [{"nombre": "Rocas intrusivas", "color": "#e86363"}, {"nombre": "Rocas metamórficas", "color": "#9c9c9c"}, {"nombre": "Rocas estratificadas", "color": "#a47158"}, {"nombre": "Rocas volcánicas", "color": "#8142d3"}, {"nombre": "Sedimentos no consolidados", "color": "#fffe5d"}]},
-    
-    # JUGADOR 2
-    {"nombre": "Dinámica Atmosférica", "jugador": 2, "boton": 2, "archivo": "PRECIPITACION.gif", "color": "#ffffff", "max_alpha": 153, "titulo_leyenda": "Promedio precipitación anual (1980-2020)", "leyenda": [{"nombre": "Baja", "color": "#edfac2", "simbolo": "cuadrado_relleno"}, {"nombre": "Media", "color": "#0570b0", "simbolo": "cuadrado_relleno"}, {"nombre": "Alta", "color": "#6a2c5a", "simbolo": "cuadrado_relleno"}]},
-    # REINICIO AHORA EN BOTÓN 3 DEL JUGADOR 2
-    {"nombre": "Pantalla de reinicio", "jugador": 2, "boton": 3, "archivo": "INICIO.png", "es_reinicio": True},
-    {"nombre": "Espacios productivos", "jugador": 2, "boton": 4, "color": "#ffffff", "archivo": "PRODUCTIVO.png", "titulo_leyenda": "Usos productivos", "leyenda": [{"nombre": "Agrícola", "color": "#f7ebbf"}, {"nombre": "Forestal", "color": "#7a5900"}, {"nombre": "Acuícola", "color": "#ff2323"}]},
-    {"nombre": "Topografía", "jugador": 2, "boton": 5, "color": "#ffffff", "archivo": "DEM.png", "max_alpha": 153, "titulo_leyenda": "Elevación", "leyenda": [{"nombre": "Baja (0-750 m.s.n.m)", "color": "#180f3e", "simbolo": "cuadrado_relleno"}, {"nombre": "Media (751-1500 m.s.n.m)", "color": "#cd3f71", "simbolo": "cuadrado_relleno"}, {"nombre": "Alta (>1500 m.s.n.m)", "color": "#fec98d", "simbolo": "cuadrado_relleno"}]},
-    {"nombre": "Red vial", "jugador": 2, "boton": 6, "archivo": "REDVIAL.png", "titulo_leyenda": "Red vial", "leyenda": [{"nombre": "Carreteras", "color": "#ffff00", "simbolo": "linea_solida"}, {"nombre": "Calles y Caminos", "color": "#ffff00", "simbolo": "linea_solida"}]},
-    {"nombre": "Límites comunales, regionales, comunas ANDES", "jugador": 2, "boton": 7, "color": "#ffffff", "archivo": "COMUNAS.png", "titulo_leyenda": "Límites administrativos", "leyenda": [{"nombre": "Límites comunales", "color": "#ffffff", "simbolo": "linea_solida"}, {"nombre": "Comunas Andes del Sur", "color": "#b7484b", "simbolo": "cuadrado_relleno"}]},
-    {"nombre": "Satelital", "jugador": 2, "boton": 8, "color": "#ffffff", "archivo": "SATELITAL.png", "titulo_leyenda": "Imagen Satelital", "leyenda": [{"nombre": "Imagen Satelital", "color": "#ffffff"}]},
-    {"nombre": "Usos de suelo 2022", "jugador": 2, "boton": 11, "archivo": "USOS_2020.png", "leyenda_compartida": "usos_suelo", "titulo_leyenda": "Usos de suelo 2022"},
-    {"nombre": "Usos de suelo 2002", "jugador": 2, "boton": 10, "archivo": "USOS_2000.png", "leyenda_compartida": "usos_suelo", "titulo_leyenda": "Usos de suelo 2002"},
-    
-    # JUGADOR 3
-    {"nombre": "Comunidades indígenas", "jugador": 3, "boton": 0, "color": "#1f78b4", "archivo": "COMUNIDADES.png", "titulo_leyenda": "Comunidades indígenas", "leyenda": [{"nombre": "Comunidades indígenas", "color": "#1f78b4", "simbolo": "circulo_doble_relleno"}]},
-    # SOLO ÁREAS POBLADAS EN BOTÓN 3 DEL JUGADOR 3
-    {"nombre": "Áreas pobladas y viviendas rurales", "jugador": 3, "boton": 3, "color": "#ffffff", "archivo": "VIVIENDAS_2.png", "titulo_leyenda": "Áreas pobladas", "leyenda": [{"nombre": "Áreas pobladas", "color": "#ffffff"}]},
-    {"nombre": "SEIA 1994-2004", "jugador": 3, "boton": 4, "color": "#ffffff", "archivo": "SEA94.png", "leyenda_compartida": "seia", "titulo_leyenda": "Tamaño de inversión (SEIA)"},
-    {"nombre": "Establecimientos educacionales y salud", "jugador": 3, "boton": 5, "color": "#ffffff", "archivo": "SALUD.png", "titulo_leyenda": "Establecimientos", "leyenda": [{"nombre": "Educacionales", "color": "#ff0000", "simbolo": "triangulo_8"}, {"nombre": "Salud", "color": "#ff0000", "simbolo": "cruz_con_circulo"}]},
-    {"nombre": "SEIA 2015-2024", "jugador": 3, "boton": 6, "color": "#ffffff", "archivo": "SEA14.png", "leyenda_compartida": "seia", "titulo_leyenda": "Tamaño de inversión (SEIA)"},
-    {"nombre": "SEIA 2005-2014", "jugador": 3, "boton": 7, "color": "#ffffff", "archivo": "SEA24.png", "leyenda_compartida": "seia", "titulo_leyenda": "Tamaño de inversión (SEIA)"},
-    {"nombre": "Incendios forestales", "jugador": 3, "boton": 8, "archivo": "INCENDIOS.png", "titulo_leyenda": "Incendios forestales 2014-2024", "leyenda": [{"nombre": "Incendios 2014-2024", "color": "#ff7f00", "simbolo": "incendio"}]},
-    {"nombre": "Dinámica Atmosférica", "jugador": 3, "boton": 10, "archivo": "TIEMPO.gif", "titulo_leyenda": "Dinámica Atmosférica", "leyenda": [{"nombre": "Dinámica atmosférica", "color": "#ffffff", "simbolo": "cuadrado_relleno"}]},
-    {"nombre": "Conservación privada y SNASPE", "jugador": 3, "boton": 11, "archivo": "SNASPE.png", "titulo_leyenda": "Conservación y SNASPE", "leyenda": [{"nombre": "Conservación privada", "color": "#ffff3c", "simbolo": "diagonal_x"}, {"nombre": "Áreas protegidas del Estado", "color": "#e18ee6", "simbolo": "diagonal_x"}, {"nombre": "Áreas marino-costeras protegidas (EMCPO)", "color": "#19e1ff", "simbolo": "diagonal_x"}]}
-]
+ruta_imagenes = ruta_imagenes_benchmark or r"C:\IMAGENES"
+
+# Capas, botones y leyendas se definen en capas.json (ver AURORA_CAPAS.py)
+ruta_configuracion_capas = os.path.join(os.path.dirname(os.path.abspath(__file__)), AURORA_CAPAS.NOMBRE_CONFIGURACION)
+
+class RegistroCapas:
+    # Índices compilados a partir de la configuración, para no recorrer la
+    # lista de capas en cada pulsación
+    def __init__(self, configuracion, capas):
+        self.configuracion = configuracion
+        self.capas = capas
+        self.por_boton = {}
+        self.por_leyenda_compartida = {}
+        self.por_archivo = {}
+        self.por_identidad = {}
+        self.reinicio = None
+        for capa in capas:
+            self.por_boton.setdefault((capa.jugador, capa.boton), []).append(capa)
+            if capa.leyenda_compartida:
+                self.por_leyenda_compartida.setdefault(capa.leyenda_compartida, []).append(capa)
+            if capa.archivo:
+                self.por_archivo.setdefault(capa.archivo, []).append(capa)
+            self.por_identidad[capa.identidad] = capa
+            if capa.es_reinicio and self.reinicio is None:
+                self.reinicio = capa
+
+def compilar_registro_capas(configuracion, anterior=None):
+    # Las capas cuya configuración no cambió se reutilizan tal cual; las que
+    # cambiaron se recrean heredando frames y estado de la capa anterior
+    capas = []
+    for config in configuracion['capas']:
+        previa = anterior.por_identidad.get(AURORA_CAPAS.identidad_capa(config)) if anterior else None
+        if previa is not None and previa.config == config:
+            capas.append(previa)
+            continue
+        capa = ImagenConFade(config)
+        if previa is not None:
+            capa.adoptar_estado(previa)
+        capas.append(capa)
+    return RegistroCapas(configuracion, capas)
+
+try:
+    registro_capas = compilar_registro_capas(AURORA_CAPAS.cargar_configuracion(ruta_configuracion_capas))
+except ValueError as e:
+    logger.error(str(e))
+    pygame.quit()
+    sys.exit(1)
+logger.info(f"Configuración de capas cargada: {len(registro_capas.capas)} capas, "
+            f"{len(registro_capas.por_boton)} botones")
+registrar_fase_arranque("configuración de capas")
+
+imagenes_con_fade = registro_capas.capas
+# (jugador, boton) -> lista de capas
+mapeo_capas = registro_capas.por_boton
+imagen_reinicio = registro_capas.reinicio
 
-# Crear objetos de imagen
-imagenes_con_fade = [ImagenConFade(config) for config in acciones_y_rutas]
-
-# Crear mapeo (jugador, boton) -> lista de capas
-mapeo_capas = {}
-for config in acciones_y_rutas:
-    clave = (config['jugador'], config['boton'])
-    # Buscar el objeto ImagenConFade correspondiente a esta config
-    capa_obj = next((c for c in imagenes_con_fade if c.nombre == config['nombre'] and c.archivo == config.get('archivo', '')), None)
-    if capa_obj:
-        if clave not in mapeo_capas:
-            mapeo_capas[clave] = []
-        mapeo_capas[clave].append(capa_obj)
-
-# Asignar imagen de reinicio
-imagen_reinicio = None
-for capa in imagenes_con_fade:
-    if capa.es_reinicio:
-        imagen_reinicio = capa
-        break
+# ===============================================================================
+# GESTOR DE RECURSOS DE CAPAS (CARGA BAJO DEMANDA CON PRESUPUESTO DE MEMORIA)
+# ===============================================================================
+# Memoria máxima para frames de capas inactivas antes de expulsarlas (LRU)
+presupuesto_memoria_capas_mb = 2048
+# Archivos de capa que nunca se expulsan de memoria
+capas_fijas = ["INICIO.png"]
+# Capas más usadas según logs/botones_events_*.csv que se cargan al inicio
+precargar_capas_mas_usadas = 6
+# Si es True, esas capas más usadas además quedan fijas en memoria
+fijar_capas_mas_usadas = False
+
+class GestorRecursosCapas:
+    def __init__(self, presupuesto_bytes):
+        self.presupuesto_bytes = presupuesto_bytes
+        # capa -> bytes ocupados, de la usada hace más tiempo a la más reciente
+        self.capas_cargadas = OrderedDict()
+        self.bytes_usados = 0
+        self.fijas = set()
+
+    def fijar(self, capa):
+        self.fijas.add(capa)
+
+    def asegurar_cargada(self, capa, frames=None):
+        if capa in self.capas_cargadas:
+            self.capas_cargadas.move_to_end(capa)
+            return
+        if not capa.ruta_completa:
+            return
+        capa.cargar_frames(frames)
+        tam = capa.bytes_en_memoria()
+        self.capas_cargadas[capa] = tam
+        self.bytes_usados += tam
+        logger.info(f"Capa '{capa.nombre}' cargada en memoria ({tam / 1048576:.1f} MB, "
+                    f"total {self.bytes_usados / 1048576:.1f} MB)")
+        self.expulsar_sobrantes(conservar=capa)
+
+    def precargar(self, capa, frames=None):
+        # Carga anticipada que nunca desplaza otras capas; False si no cupo
+        if capa in self.capas_cargadas:
+            return True
+        capa.cargar_frames(frames)
+        tam = capa.bytes_en_memoria()
+        if self.bytes_usados + tam > self.presupuesto_bytes and capa not in self.fijas:
+            capa.liberar_frames()
+            return False
+        self.capas_cargadas[capa] = tam
+        self.bytes_usados += tam
+        return True
+
+    def expulsar_sobrantes(self, conservar=None):
+        for capa in list(self.capas_cargadas):
+            if self.bytes_usados <= self.presupuesto_bytes:
+                break
+            # Solo se expulsan capas fuera de pantalla y no fijadas
+            if capa is conservar or capa in self.fijas or capa.activa or capa.alpha > 0:
+                continue
+            self.bytes_usados -= self.capas_cargadas.pop(capa)
+            capa.liberar_frames()
+            logger.info(f"Capa '{capa.nombre}' expulsada de memoria")
+
+    def actualizar_tamano(self, capa):
+        # La capa cambió de frames (archivo modificado en disco)
+        if capa in self.capas_cargadas:
+            tam = capa.bytes_en_memoria()
+            self.bytes_usados += tam - self.capas_cargadas[capa]
+            self.capas_cargadas[capa] = tam
+            self.expulsar_sobrantes(conservar=capa)
+
+    def reemplazar(self, anterior, nueva):
+        # La capa recreada por una recarga de configuración ocupa el lugar de la anterior
+        if anterior in self.fijas:
+            self.fijas.discard(anterior)
+            self.fijas.add(nueva)
+        if anterior in self.capas_cargadas:
+            self.capas_cargadas = OrderedDict(
+                (nueva if capa is anterior else capa, tam) for capa, tam in self.capas_cargadas.items())
+
+    def olvidar(self, capa):
+        # Capa quitada de la configuración
+        self.fijas.discard(capa)
+        if capa in self.capas_cargadas:
+            self.bytes_usados -= self.capas_cargadas.pop(capa)
+        capa.liberar_frames()
+
+def contar_activaciones_historicas(directorio=directorio_logs):
+    # Activaciones por capa (ver AURORA_ANALISIS.clave_capa) según el índice
+    # incremental de la analítica: al arrancar solo se leen las filas nuevas
+    inicio = time.perf_counter()
+    try:
+        conteo = AURORA_ANALISIS.popularidad_capas(directorio)
+    except Exception as e:
+        logger.error(f"Error al leer historial de activaciones: {e}")
+        return {}
+    logger.info(f"Historial de activaciones leído en {(time.perf_counter() - inicio) * 1000:.0f} ms")
+    return conteo
+
+gestor_capas = GestorRecursosCapas(presupuesto_memoria_capas_mb * 1024 * 1024)
 
-# Cargar imagen base solo para los primeros dos monitores (3840x1080)
+# ===============================================================================
+# CARGA DE CAPAS EN SEGUNDO PLANO (ARRANQUE PROGRESIVO)
+# ===============================================================================
+# Evento con el que el pool de carga avisa que una capa ya se decodificó
+evento_capa_decodificada = pygame.event.custom_type()
+
+class CargadorCapas:
+    # Decodifica capas en hilos, de a hilos_carga a la vez y en orden de
+    # prioridad; las que un visitante ya pidió pasan al frente de la cola. La
+    # conversión a superficies se hace en el bucle principal al llegar el evento
+    def __init__(self, hilos):
+        self.hilos = hilos
+        self.pool = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="CargaCapas")
+        self.cola = deque()
+        # capa -> futuro de las decodificaciones en curso
+        self.en_curso = {}
+        self.precargadas = []
+        self.precarga_terminada = False
+        # Hasta que llegue el historial de activaciones se precarga en el orden de capas.json
+        self.esperando_historial = True
+
+    def pedir(self, capa, urgente=False):
+        if capa in self.en_curso:
+            return
+        if capa in self.cola:
+            if not urgente:
+                return
+            self.cola.remove(capa)
+        if urgente:
+            # Detrás de las otras pedidas por visitantes, en el orden en que se pidieron
+            self.cola.insert(sum(1 for c in self.cola if c.cargando), capa)
+        else:
+            self.cola.append(capa)
+        self.despachar()
+
+    def despachar(self):
+        while self.cola and len(self.en_curso) < self.hilos:
+            capa = self.cola.popleft()
+            if capa.frames:
+                continue
+            futuro = self.pool.submit(obtener_datos_imagen, capa.ruta_completa, 3840, 1080)
+            self.en_curso[capa] = futuro
+            futuro.add_done_callback(lambda terminado, capa=capa: pygame.event.post(pygame.event.Event(
+                evento_capa_decodificada, capa=capa, futuro=terminado)))
+
+    def aplicar(self, evento):
+        self.en_curso.pop(evento.capa, None)
+        # Si la configuración se recargó mientras tanto, la capa vigente es otra
+        capa = registro_capas.por_identidad.get(evento.capa.identidad)
+        if capa is not None and not capa.frames:
+            frames = cargar_imagen_escalada(capa.ruta_completa, 3840, 1080, evento.futuro)
+            if capa.cargando:
+                # Un visitante la activó mientras se cargaba: el fade empieza ahora
+                gestor_capas.asegurar_cargada(capa, frames)
+                capa.cargando = False
+                logger.info(f"Capa '{capa.nombre}' lista; se aplica su activación en cola")
+            elif gestor_capas.precargar(capa, frames):
+                self.precargadas.append(capa)
+            else:
+                # Sin presupuesto para más: se descarta el resto de la precarga
+                self.cola = deque(c for c in self.cola if c.cargando)
+        self.despachar()
+        self.comprobar_fin_precarga()
+
+    def reordenar_precarga(self, capas):
+        # Las pedidas por visitantes y las fijas quedan al frente; el resto de
+        # la precarga pendiente se reemplaza por capas, en ese orden
+        self.esperando_historial = False
+        primeras = [c for c in self.cola if c.cargando or c in gestor_capas.fijas]
+        self.cola = deque(primeras + [c for c in capas if c not in primeras
+                                      and c not in self.en_curso and not c.frames])
+        self.despachar()
+        self.comprobar_fin_precarga()
+
+    def comprobar_fin_precarga(self):
+        if self.precarga_terminada or self.esperando_historial:
+            return
+        if not self.cola and not self.en_curso:
+            self.precarga_terminada = True
+            registrar_fase_arranque(f"{len(self.precargadas)} capas precargadas en segundo plano")
+            if self.precargadas:
+                logger.info("Capas precargadas: " + ", ".join(c.nombre for c in self.precargadas))
+
+cargador_capas = CargadorCapas(hilos_carga)
+
+# Evento con el que el pool de carga entrega el historial de activaciones
+evento_historial_leido = pygame.event.custom_type()
+
+def leer_historial_en_segundo_plano():
+    # El índice de la analítica puede tardar con muchos CSV nuevos: se actualiza
+    # en el pool de carga y el bucle principal reordena la precarga al recibirlo
+    futuro = cargador_capas.pool.submit(contar_activaciones_historicas)
+    futuro.add_done_callback(lambda terminado: pygame.event.post(pygame.event.Event(
+        evento_historial_leido, futuro=terminado)))
+
+def capas_candidatas_precarga():
+    return [c for c in imagenes_con_fade if c.ruta_completa and c.archivo not in capas_fijas]
+
+def aplicar_historial_activaciones(evento):
+    # Las más usadas según el historial o, sin historial, las primeras de capas.json
+    activaciones = evento.futuro.result()
+    candidatas = capas_candidatas_precarga()
+    if activaciones:
+        conteo = {c: AURORA_ANALISIS.activaciones_capa(activaciones, c.nombre, c.archivo) for c in candidatas}
+        candidatas = sorted((c for c in candidatas if conteo[c]), key=conteo.get, reverse=True)
+    capas_mas_usadas = candidatas[:precargar_capas_mas_usadas]
+    if fijar_capas_mas_usadas:
+        for capa in capas_mas_usadas:
+            gestor_capas.fijar(capa)
+    cargador_capas.reordenar_precarga(capas_mas_usadas)
+
+def preparar_activacion(capa):
+    # Capa ya en memoria: se marca como recién usada. Si no, su activación
+    # queda en cola hasta que el cargador la entregue, sin detener el bucle
+    if capa.sonido:
+        # El sonido se decodifica mientras dura el fade de entrada
+        capa.sonido.preparar()
+    if capa.frames or not capa.ruta_completa:
+        gestor_capas.asegurar_cargada(capa)
+        return
+    capa.cargando = True
+    cargador_capas.pedir(capa, urgente=True)
+    logger.info(f"Capa '{capa.nombre}' aún no está cargada; activación en cola")
+
+# Solo la imagen base (primeros dos monitores, 3840x1080) se carga antes de
+# aceptar pulsaciones; las capas llegan después, por orden de prioridad
 imagen_base = cargar_imagen_escalada(os.path.join(ruta_imagenes, "BASE.png"), 3840, 1080)[0]
 
 # ===============================================================================
 # FINALIZAR CARGA - OCULTAR SPLASH SCREEN
 # ===============================================================================
-# Después de cargar todos los recursos, quitamos el splash screen
+# Con la imagen base lista, el mapa reemplaza al splash screen
 if splash_visible:
     screen.fill((0, 0, 0))
     screen.blit(imagen_base, (0, 0))
     pygame.display.flip()
-    logger.info("Recursos cargados - Pantalla de carga ocultada")
-
-# Leyendas comunes
-leyenda_comun = [
-    {"nombre": "Bosque", "color": "#334632"},
-    {"nombre": "Plantación forestal", "color": "#7a5900"},
-    {"nombre": "Formación natural no boscosa", "color": "#d5ccad"},
-    {"nombre": "Humedales", "color": "#519799"},
-    {"nombre": "Pradera", "color": "#d5ccad"},
-    {"nombre": "Mosaico de agricultura", "color": "#f7ebbf"},
-    {"nombre": "Infraestructura", "color": "#d4271e"},
-    {"nombre": "Hielo y nieves", "color": "#ffffff"},
-    {"nombre": "Matorral", "color": "#a89358"}
-]
+    logger.info("Imagen base cargada - Pantalla de carga ocultada")
+registrar_fase_arranque("imagen base en pantalla")
 
-leyenda_comun_seia = [
-    {"nombre": "Inversión pequeña", "color": "#d7b4b3", "simbolo": "circulo_5"},
-    {"nombre": "Inversión media", "color": "#d7b4b3", "simbolo": "circulo_15"},
-    {"nombre": "Inversión grande", "color": "#d7b4b3", "simbolo": "circulo_20"}
-]
+# Prioridad de precarga: capas fijas, luego las primeras de capas.json hasta
+# que el historial de activaciones diga cuáles son las más usadas
+leer_historial_en_segundo_plano()
+for capa in imagenes_con_fade:
+    if capa.archivo in capas_fijas and capa.ruta_completa:
+        gestor_capas.fijar(capa)
+        cargador_capas.pedir(capa)
+for capa in capas_candidatas_precarga()[:precargar_capas_mas_usadas]:
+    cargador_capas.pedir(capa)
 
 # ===============================================================================
 # CONFIGURACIÓN DE LEYENDA PARA TERCER MONITOR (1920x1080)
@@ -539,13 +1455,207 @@ leyenda_alto_px = 1080
 leyenda_x = 3840
 leyenda_y = 0
 
+# ===============================================================================
+# CACHÉ DE FUENTES Y DE LEYENDAS COMPUESTAS
+# ===============================================================================
+# Presupuesto máximo de memoria para leyendas ya compuestas (cada una ~8 MB)
+cache_leyendas_presupuesto_bytes = 64 * 1024 * 1024
+
+fuentes_cache = {}
+
+def obtener_fuente(tam, negrita=False):
+    clave = (tam, negrita)
+    if clave not in fuentes_cache:
+        fuentes_cache[clave] = pygame.font.SysFont("Arial", tam, bold=negrita)
+    return fuentes_cache[clave]
+
+class CacheLeyendas:
+    # La usa el hilo de leyendas; el bucle principal solo consulta resumen()
+    def __init__(self, presupuesto_bytes):
+        self.presupuesto_bytes = presupuesto_bytes
+        self.candado = threading.Lock()
+        self.entradas = OrderedDict()
+        self.bytes_usados = 0
+        self.aciertos = 0
+        self.fallos = 0
+
+    @staticmethod
+    def clave(imagenes_activas):
+        # La leyenda depende solo de qué capas están activas, en qué orden,
+        # y de los grupos de leyenda compartida que aportan
+        capas = tuple((capa.nombre, capa.archivo) for capa in imagenes_activas)
+        grupos = tuple(sorted({capa.leyenda_compartida for capa in imagenes_activas
+                               if capa.leyenda_compartida}))
+        return (capas, grupos)
+
+    def obtener(self, clave):
+        with self.candado:
+            superficie = self.entradas.get(clave)
+            if superficie is None:
+                self.fallos += 1
+                return None
+            self.entradas.move_to_end(clave)
+            self.aciertos += 1
+            return superficie
+
+    def guardar(self, clave, superficie):
+        tam = superficie.get_pitch() * superficie.get_height()
+        if tam > self.presupuesto_bytes:
+            return
+        with self.candado:
+            if clave in self.entradas:
+                self.bytes_usados -= self._tam(self.entradas.pop(clave))
+            # Expulsar las leyendas usadas hace más tiempo hasta respetar el presupuesto
+            while self.entradas and self.bytes_usados + tam > self.presupuesto_bytes:
+                _, expulsada = self.entradas.popitem(last=False)
+                self.bytes_usados -= self._tam(expulsada)
+            self.entradas[clave] = superficie
+            self.bytes_usados += tam
+
+    def vaciar(self):
+        with self.candado:
+            self.entradas.clear()
+            self.bytes_usados = 0
+
+    def resumen(self):
+        # (leyendas guardadas, bytes) leídos de una vez
+        with self.candado:
+            return len(self.entradas), self.bytes_usados
+
+    @staticmethod
+    def _tam(superficie):
+        return superficie.get_pitch() * superficie.get_height()
+
+cache_leyendas = CacheLeyendas(cache_leyendas_presupuesto_bytes)
+
+# ===============================================================================
+# ATLAS DE SÍMBOLOS Y TEXTOS DE LEYENDA (CONSTRUIDO AL INICIO)
+# ===============================================================================
+# Tamaños de fuente candidatos para la leyenda, de mayor a menor
+tam_fuentes_leyenda = [16, 14, 12]
+
+class AtlasLeyenda:
+    ancho_hoja = 2048
+    # Margen para símbolos que sobresalen del cuadro (p. ej. circulo_20)
+    margen = 32
+
+    def __init__(self, tam_fuentes):
+        self.tam_fuentes = tam_fuentes
+        self.hojas = {}
+        # (tam_fuente, clave_elemento) -> (superficie, area, desplazamiento); el hilo
+        # de leyendas agrega regiones, así que se lee y se escribe con el candado
+        self.regiones = {}
+        self.candado = threading.Lock()
+
+    @staticmethod
+    def clave_elemento(elemento):
+        if elemento['tipo'] == 'titulo':
+            return ('titulo', elemento['texto'])
+        return ('item', elemento['texto'], tuple(pygame.Color(elemento['color'])),
+                elemento.get('simbolo', None))
+
+    def renderizar(self, tam, elemento):
+        # Dibuja el elemento sobre una superficie holgada y la recorta a su contenido.
+        # El desplazamiento es relativo a la esquina (x_col, y_actual) de la leyenda.
+        m = self.margen
+        if elemento['tipo'] == 'titulo':
+            texto = obtener_fuente(tam, negrita=True).render(elemento['texto'], True, (255, 255, 255))
+            superficie = pygame.Surface((texto.get_width() + 2 * m, texto.get_height() + 2 * m), pygame.SRCALPHA)
+            superficie.blit(texto, (m, m))
+        else:
+            texto = obtener_fuente(tam).render(elemento['texto'], True, (255, 255, 255))
+            superficie = pygame.Surface((tam + 5 + texto.get_width() + 2 * m,
+                                         max(tam, texto.get_height()) + 2 * m), pygame.SRCALPHA)
+            rect_simbolo = (m, m, tam, tam)
+            centro = (m + tam//2, m + tam//2)
+            funcion = resolver_simbolo(elemento.get('simbolo', None))
+            funcion(superficie, pygame.Color(elemento['color']), rect_simbolo, centro)
+            texto_y = m + (tam - texto.get_height()) // 2
+            superficie.blit(texto, (m + tam + 5, texto_y))
+        recorte = superficie.get_bounding_rect()
+        return superficie.subsurface(recorte).copy(), (recorte.x - m, recorte.y - m)
+
+    def construir(self, elementos):
+        for tam in self.tam_fuentes:
+            piezas = []
+            vistas = set()
+            for elemento in elementos:
+                clave = self.clave_elemento(elemento)
+                if clave in vistas:
+                    continue
+                vistas.add(clave)
+                superficie, desplazamiento = self.renderizar(tam, elemento)
+                piezas.append((clave, superficie, desplazamiento))
+
+            # Empaquetado por estantes: piezas ordenadas por altura, filas de ancho fijo
+            piezas.sort(key=lambda p: p[1].get_height(), reverse=True)
+            posiciones = []
+            x = y = alto_fila = 0
+            for clave, superficie, desplazamiento in piezas:
+                w, h = superficie.get_size()
+                if x + w > self.ancho_hoja:
+                    x = 0
+                    y += alto_fila
+                    alto_fila = 0
+                posiciones.append((clave, superficie, desplazamiento, pygame.Rect(x, y, w, h)))
+                x += w
+                alto_fila = max(alto_fila, h)
+
+            hoja = pygame.Surface((self.ancho_hoja, max(1, y + alto_fila)), pygame.SRCALPHA)
+            hoja.blits([(superficie, area) for _, superficie, _, area in posiciones], doreturn=False)
+            with self.candado:
+                self.hojas[tam] = hoja
+                for clave, _, desplazamiento, area in posiciones:
+                    self.regiones[(tam, clave)] = (hoja, area, desplazamiento)
+
+    def obtener(self, tam, elemento):
+        clave = (tam, self.clave_elemento(elemento))
+        with self.candado:
+            region = self.regiones.get(clave)
+        if region is None:
+            # Elemento no previsto al inicio (p. ej. títulos combinados): se agrega aparte
+            superficie, desplazamiento = self.renderizar(tam, elemento)
+            with self.candado:
+                region = self.regiones.setdefault(clave, (superficie, superficie.get_rect(), desplazamiento))
+        return region
+
+    def superficies(self):
+        # Copia de las superficies distintas (hojas y elementos agregados aparte)
+        with self.candado:
+            return list({id(superficie): superficie for superficie, _, _ in self.regiones.values()}.values())
+
+def elementos_para_atlas(configuracion):
+    elementos = []
+    leyendas = [config.get('leyenda', []) for config in configuracion['capas']]
+    for compartida in configuracion['leyendas_compartidas'].values():
+        if compartida.get('titulo'):
+            elementos.append({'tipo': 'titulo', 'texto': compartida['titulo']})
+        leyendas.append(compartida.get('elementos', []))
+    for config in configuracion['capas']:
+        if config.get('titulo_leyenda'):
+            elementos.append({'tipo': 'titulo', 'texto': config['titulo_leyenda']})
+    for leyenda in leyendas:
+        for elem in leyenda:
+            elementos.append({'tipo': 'item', 'texto': elem['nombre'], 'color': elem['color'],
+                              'simbolo': elem.get('simbolo', None)})
+    return elementos
+
+inicio_atlas = pygame.time.get_ticks()
+atlas_leyenda = AtlasLeyenda(tam_fuentes_leyenda)
+atlas_leyenda.construir(elementos_para_atlas(registro_capas.configuracion))
+logger.info(f"Atlas de leyenda construido: {len(atlas_leyenda.regiones)} elementos "
+            f"en {pygame.time.get_ticks() - inicio_atlas} ms")
+registrar_fase_arranque("atlas de leyenda")
+
 # ===============================================================================
 # FUNCIÓN DE DIBUJO DE LEYENDA MEJORADA (ESTÁTICA, SIN PAGINACIÓN)
 # ===============================================================================
-def dibujar_leyenda_tercer_monitor(pantalla, imagenes_activas):
-    if not imagenes_activas:
-        return
+def dibujar_leyenda_tercer_monitor(pantalla, leyenda_surface):
+    # Dibujar la última leyenda terminada por el hilo de leyendas
+    if leyenda_surface is not None:
+        pantalla.blit(leyenda_surface, (leyenda_x, leyenda_y))
 
+def componer_leyenda(imagenes_activas):
     # Crear superficie para la leyenda
     leyenda_surface = pygame.Surface((leyenda_ancho_px, leyenda_alto_px), pygame.SRCALPHA)
     
@@ -567,34 +1677,21 @@ def dibujar_leyenda_tercer_monitor(pantalla, imagenes_activas):
     elementos = []
     leyendas_ya_agregadas = set()
 
-    # Procesar usos de suelo
-    usos_activos = [capa for capa in imagenes_activas 
-                   if hasattr(capa, 'leyenda_compartida') 
-                   and capa.leyenda_compartida == "usos_suelo"]
-    if usos_activos:
-        titulo = " & ".join(capa.titulo_leyenda for capa in usos_activos)
+    # Leyendas compartidas, en el orden en que las define capas.json
+    for grupo, compartida in registro_capas.configuracion['leyendas_compartidas'].items():
+        activos = [capa for capa in imagenes_activas if capa.leyenda_compartida == grupo]
+        if not activos:
+            continue
+        # Sin título fijo se usan los títulos de las capas activas del grupo
+        titulo = compartida.get('titulo') or " & ".join(capa.titulo_leyenda for capa in activos)
         elementos.append({'tipo': 'titulo', 'texto': titulo})
         elementos.extend([{
             'tipo': 'item',
             'texto': elem['nombre'],
             'color': elem['color'],
-            'simbolo': None
-        } for elem in leyenda_comun])
-        leyendas_ya_agregadas.add("usos_suelo")
-
-    # Procesar SEIA
-    seia_activos = [capa for capa in imagenes_activas 
-                   if hasattr(capa, 'leyenda_compartida') 
-                   and capa.leyenda_compartida == "seia"]
-    if seia_activos:
-        elementos.append({'tipo': 'titulo', 'texto': "Tamaño de inversión (SEIA)"})
-        elementos.extend([{
-            'tipo': 'item',
-            'texto': elem['nombre'],
-            'color': elem['color'],
-            'simbolo': elem['simbolo']
-        } for elem in leyenda_comun_seia])
-        leyendas_ya_agregadas.add("seia")
+            'simbolo': elem.get('simbolo', None)
+        } for elem in compartida.get('elementos', [])])
+        leyendas_ya_agregadas.add(grupo)
 
     # Otras capas
     for capa in imagenes_activas:
@@ -619,25 +1716,18 @@ def dibujar_leyenda_tercer_monitor(pantalla, imagenes_activas):
             })
 
     # Determinar el mejor tamaño de fuente y número de columnas
-    tam_fuentes = [16, 14, 12]  # Tamaños de fuente a probar
     separacion_entre_columnas = 30
     tam_fuente = 16
     num_columnas = 1
     esp_linea = 20
-    tam_simbolo = 16
     
     # Calcular altura máxima permitida
     altura_maxima_permitida = contenido_alto
     
     # Intentar con diferentes tamaños de fuente
-    for tam_fuente_intento in tam_fuentes:
-        # Configurar fuentes con este tamaño
-        fuente = pygame.font.SysFont("Arial", tam_fuente_intento)
-        fuente_titulo = pygame.font.SysFont("Arial", tam_fuente_intento, bold=True)
-        
+    for tam_fuente_intento in tam_fuentes_leyenda:
         # Calcular espacio por línea y tamaño de símbolo proporcional
         esp_linea_intento = int(tam_fuente_intento * 1.25)
-        tam_simbolo_intento = tam_fuente_intento
         
         # Función para dividir elementos en columnas según la altura disponible
         def dividir_en_columnas(elementos, max_altura, max_cols=3):
@@ -679,7 +1769,6 @@ def dibujar_leyenda_tercer_monitor(pantalla, imagenes_activas):
                 if altura_maxima_columna <= altura_maxima_permitida:
                     tam_fuente = tam_fuente_intento
                     esp_linea = esp_linea_intento
-                    tam_simbolo = tam_simbolo_intento
                     num_columnas = len(columnas)
                     break
             if num_columnas > 1:
@@ -688,10 +1777,6 @@ def dibujar_leyenda_tercer_monitor(pantalla, imagenes_activas):
             continue
         break
     
-    # Configurar fuentes con el tamaño seleccionado
-    fuente = pygame.font.SysFont("Arial", tam_fuente)
-    fuente_titulo = pygame.font.SysFont("Arial", tam_fuente, bold=True)
-    
     # Volver a dividir elementos con los parámetros seleccionados
     def dividir_en_columnas_final(elementos, max_altura, max_cols=3):
         columnas = [[]]
@@ -718,90 +1803,1006 @@ def dibujar_leyenda_tercer_monitor(pantalla, imagenes_activas):
     # Calcular ancho de columna
     ancho_col = (contenido_ancho - separacion_entre_columnas * (num_columnas - 1)) // num_columnas if num_columnas > 0 else contenido_ancho
     
-    # Dibujar cada columna
+    # Dibujar cada columna como un lote de blits desde el atlas
+    lotes = []
     y_inicial = margen_vertical_px + 15
     for idx_col, columna in enumerate(columnas):
         x_col = margen_lateral_px + idx_col * (ancho_col + separacion_entre_columnas)
         y_actual = y_inicial
         
         for elemento in columna:
+            superficie, area, (dx, dy) = atlas_leyenda.obtener(tam_fuente, elemento)
+            lotes.append((superficie, (x_col + dx, y_actual + dy), area))
             if elemento['tipo'] == 'titulo':
-                texto = fuente_titulo.render(elemento['texto'], True, (255, 255, 255))
-                leyenda_surface.blit(texto, (x_col, y_actual))
                 y_actual += int(esp_linea * 1.4)
             else:
-                rect_simbolo = (x_col, y_actual, tam_simbolo, tam_simbolo)
-                color = pygame.Color(elemento['color'])
-                simbolo = elemento.get('simbolo', None)
-                centro = (x_col + tam_simbolo//2, y_actual + tam_simbolo//2)
-                
-                # Dibujar símbolo según el tipo
-                if simbolo == "circulo_5":
-                    pygame.draw.circle(leyenda_surface, color, centro, 5, 1)
-                elif simbolo == "circulo_15":
-                    pygame.draw.circle(leyenda_surface, color, centro, 15, 1)
-                elif simbolo == "circulo_20":
-                    pygame.draw.circle(leyenda_surface, color, centro, 20, 1)
-                elif simbolo == "circulo_20_relleno":
-                    pygame.draw.circle(leyenda_surface, color, centro, 20)
-                elif simbolo == "circulo_fijo_15_borde":
-                    pygame.draw.circle(leyenda_surface, color, centro, 15, 2)
-                elif simbolo == "circulo_doble_punteado":
-                    dibujar_circulo_punteado(leyenda_surface, color, centro, 15, 2)
-                    pygame.draw.circle(leyenda_surface, color, centro, 6)
-                elif simbolo == "diagonal_x":
-                    dibujar_simbolo_diagonal(leyenda_surface, color, rect_simbolo)
-                elif simbolo == "diamond_red_dot":
-                    dibujar_simbolo_diamante(leyenda_surface, color, rect_simbolo)
-                elif simbolo == "linea_solida":
-                    dibujar_linea_solida(leyenda_surface, color, rect_simbolo)
-                elif simbolo == "linea_punteada":
-                    dibujar_linea_punteada(leyenda_surface, color, rect_simbolo)
-                elif simbolo == "punto_circulo":
-                    dibujar_punto_circulo(leyenda_surface, color, rect_simbolo)
-                elif simbolo == "limite_predial":
-                    dibujar_limite_predial(leyenda_surface, color, rect_simbolo)
-                elif simbolo == "incendio":
-                    dibujar_simbolo_incendios(leyenda_surface, color, rect_simbolo)
-                elif simbolo == "cuadrado_relleno":
-                    pygame.draw.rect(leyenda_surface, color, rect_simbolo)
-                elif simbolo == "triangulo_8":
-                    dibujar_triangulo(leyenda_surface, color, rect_simbolo)
-                elif simbolo == "cruz":
-                    dibujar_cruz(leyenda_surface, color, rect_simbolo)
-                elif simbolo == "cruz_con_circulo":
-                    dibujar_cruz_con_circulo(leyenda_surface, color, rect_simbolo)
-                elif simbolo == "circulo_doble":
-                    dibujar_circulo_doble(leyenda_surface, color, rect_simbolo)
-                elif simbolo == "linea_2px":
-                    dibujar_linea_2px(leyenda_surface, color, rect_simbolo)
-                elif simbolo == "circulo_doble_relleno":
-                    dibujar_circulo_doble_relleno(leyenda_surface, color, rect_simbolo)
-                # Nuevo símbolo para patrimonio geológico
-                elif simbolo == "circulo_doble_borde":
-                    dibujar_circulo_doble_borde(leyenda_surface, color, rect_simbolo)
-                elif simbolo and simbolo.startswith("circulo_"):
-                    if "_relleno" in simbolo:
-                        partes = simbolo.split("_")
-                        radio = int(partes[1])
-                        pygame.draw.circle(leyenda_surface, color, centro, radio)
-                    else:
-                        try:
-                            radio = int(simbolo.split("_")[1])
-                            pygame.draw.circle(leyenda_surface, color, centro, radio, 1)
-                        except ValueError:
-                            pygame.draw.rect(leyenda_surface, color, rect_simbolo)
-                else:
-                    pygame.draw.rect(leyenda_surface, color, rect_simbolo)
-
-                # Dibujar texto
-                texto = fuente.render(elemento['texto'], True, (255, 255, 255))
-                texto_y = y_actual + (tam_simbolo - texto.get_height()) // 2
-                leyenda_surface.blit(texto, (x_col + tam_simbolo + 5, texto_y))
                 y_actual += esp_linea
 
-    # Dibujar la superficie de la leyenda
-    pantalla.blit(leyenda_surface, (leyenda_x, leyenda_y))
+    leyenda_surface.blits(lotes, doreturn=False)
+
+    return leyenda_surface
+
+# ===============================================================================
+# HILO DE LEYENDAS (COMPOSICIÓN FUERA DEL BUCLE PRINCIPAL)
+# ===============================================================================
+# Evento con el que el hilo avisa al bucle que hay una leyenda nueva lista
+evento_leyenda_lista = pygame.event.custom_type()
+
+class RenderizadorLeyendas:
+    # El bucle pide la leyenda de las capas activas y sigue mostrando la
+    # anterior hasta que el hilo la termina; la caché de leyendas es solo del hilo
+    def __init__(self):
+        self.condicion = threading.Condition()
+        self.pedido = None
+        self.clave_pedida = None
+        self.vaciar_cache = False
+        # Tiempo mínimo entre dos leyendas distintas (lo ajusta el gobernador de calidad)
+        self.intervalo_minimo_ms = 0
+        self.ultima_solicitud = -self.intervalo_minimo_ms
+        # (clave, superficie) de la leyenda a mostrar; se reemplaza de una vez
+        self.lista = (None, None)
+        self.hilo = threading.Thread(target=self.ejecutar, name="RenderizadorLeyendas", daemon=True)
+        self.hilo.start()
+
+    def solicitar(self, clave, capas):
+        # Devuelve False si el pedido se pospuso por el intervalo mínimo
+        if clave == self.clave_pedida:
+            return True
+        ahora = pygame.time.get_ticks()
+        if clave is not None and ahora - self.ultima_solicitud < self.intervalo_minimo_ms:
+            return False
+        self.ultima_solicitud = ahora
+        with self.condicion:
+            self.clave_pedida = clave
+            if clave is None:
+                # Ocultar la leyenda no requiere trabajo
+                self.pedido = None
+                self.lista = (None, None)
+                return True
+            self.pedido = (clave, list(capas))
+            self.condicion.notify()
+        return True
+
+    def invalidar(self):
+        # Cambió la configuración: las leyendas guardadas ya no sirven y la
+        # próxima solicitud se vuelve a componer aunque la clave sea la misma
+        with self.condicion:
+            self.vaciar_cache = True
+            self.clave_pedida = None
+
+    def ejecutar(self):
+        while True:
+            with self.condicion:
+                while self.pedido is None:
+                    self.condicion.wait()
+                clave, capas = self.pedido
+                self.pedido = None
+                vaciar_cache, self.vaciar_cache = self.vaciar_cache, False
+            if vaciar_cache:
+                cache_leyendas.vaciar()
+            try:
+                superficie = cache_leyendas.obtener(clave)
+                if superficie is None:
+                    inicio = time.perf_counter()
+                    superficie = componer_leyenda(capas)
+                    cache_leyendas.guardar(clave, superficie)
+                    logger.info(f"Leyenda compuesta en segundo plano en {(time.perf_counter() - inicio) * 1000:.0f} ms")
+            except Exception as e:
+                logger.error(f"Error al componer leyenda: {e}")
+                continue
+            with self.condicion:
+                # Descartar si mientras tanto se pidió otra leyenda
+                if clave != self.clave_pedida:
+                    continue
+                self.lista = (clave, superficie)
+            pygame.event.post(pygame.event.Event(evento_leyenda_lista))
+
+renderizador_leyendas = RenderizadorLeyendas()
+
+# ===============================================================================
+# INDICADOR DE CARGA EN EL ÁREA DE LEYENDA
+# ===============================================================================
+# Se dibuja en el tercio inferior libre del tercer monitor
+alto_indicador_carga = 48
+
+class IndicadorCarga:
+    def __init__(self):
+        self.rect = pygame.Rect(leyenda_x + 25, leyenda_y + leyenda_alto_px - 360 + 25,
+                                leyenda_ancho_px - 50, alto_indicador_carga)
+        self.superficie = None
+        self.texto = None
+        # Fuente propia: las de obtener_fuente las usa también el hilo de leyendas
+        self.fuente = pygame.font.SysFont("Arial", 22)
+
+    def actualizar(self, capas):
+        # Devuelve True si cambió lo que hay que mostrar
+        if not capas:
+            texto = None
+        else:
+            puntos = "." * (pygame.time.get_ticks() // 400 % 4)
+            texto = "Cargando " + ", ".join(capa.nombre for capa in capas) + puntos
+        if texto == self.texto:
+            return False
+        self.texto = texto
+        self.superficie = None
+        if texto is not None:
+            self.superficie = pygame.Surface(self.rect.size, pygame.SRCALPHA)
+            pygame.draw.rect(self.superficie, (0, 0, 0, 200), self.superficie.get_rect(), 0, 10)
+            render = self.fuente.render(texto, True, (255, 255, 255))
+            self.superficie.blit(render, (15, (self.rect.height - render.get_height()) // 2))
+        return True
+
+indicador_carga = IndicadorCarga()
+
+# ===============================================================================
+# RENDERIZADO POR REGIONES MODIFICADAS (DIRTY RECTANGLES)
+# ===============================================================================
+# Si las regiones a redibujar superan esta fracción de la ventana se hace flip completo
+fraccion_maxima_regiones = 0.5
+max_regiones_por_frame = 24
+
+area_leyenda = pygame.Rect(leyenda_x, leyenda_y, leyenda_ancho_px, leyenda_alto_px)
+
+def fusionar_regiones(regiones):
+    fusionadas = []
+    for region in regiones:
+        if region.width <= 0 or region.height <= 0:
+            continue
+        region = region.copy()
+        indice = region.collidelist(fusionadas)
+        while indice != -1:
+            region.union_ip(fusionadas.pop(indice))
+            indice = region.collidelist(fusionadas)
+        fusionadas.append(region)
+    return fusionadas
+
+class RenderizadorPorRegiones:
+    def __init__(self, pantalla):
+        self.pantalla = pantalla
+        self.area_total = pantalla.get_rect()
+        self.regiones = []
+        self.redibujo_completo = True
+        # capa -> (alpha, frame_actual, orden) presentado en el último frame
+        self.estados_capas = {}
+        self.leyenda = None
+
+    def marcar(self, rect):
+        if rect is not None:
+            self.regiones.append(pygame.Rect(rect).clip(self.area_total))
+
+    def marcar_todo(self):
+        self.redibujo_completo = True
+
+    def registrar_estado(self, capas, leyenda):
+        # Marca la región de cada capa cuyo aspecto cambió desde el último frame
+        estados = {}
+        for capa in capas:
+            if capa.alpha > 0:
+                estados[capa] = (capa.alpha, capa.frame_actual, capa.orden)
+        for capa in set(estados) | set(self.estados_capas):
+            nuevo = estados.get(capa)
+            previo = self.estados_capas.get(capa)
+            if nuevo == previo:
+                continue
+            if nuevo and previo and (nuevo[0], nuevo[2]) == (previo[0], previo[2]):
+                # Solo avanzó la animación: basta con redibujar lo que cambió del lienzo
+                self.marcar(capa.rect_animacion)
+            else:
+                self.marcar(capa.rect_contenido)
+        for capa in capas:
+            capa.rect_animacion = None
+        self.estados_capas = estados
+
+        # Se compara la superficie y no la clave: tras recargar la configuración
+        # la misma clave puede traer una leyenda distinta
+        if leyenda is not self.leyenda:
+            self.marcar(area_leyenda)
+            self.leyenda = leyenda
+
+    def presentar(self, dibujar_region):
+        regiones = fusionar_regiones(self.regiones)
+        self.regiones = []
+        if not self.redibujo_completo:
+            area = sum(r.width * r.height for r in regiones)
+            total = self.area_total.width * self.area_total.height
+            if area > total * fraccion_maxima_regiones:
+                self.redibujo_completo = True
+            elif len(regiones) > max_regiones_por_frame:
+                regiones = [regiones[0].unionall(regiones[1:])]
+
+        if self.redibujo_completo:
+            self.redibujo_completo = False
+            dibujar_region(self.area_total)
+            pygame.display.flip()
+            return True
+
+        if not regiones:
+            return False
+        for region in regiones:
+            self.pantalla.set_clip(region)
+            dibujar_region(region)
+        self.pantalla.set_clip(None)
+        pygame.display.update(regiones)
+        return True
+
+renderizador = RenderizadorPorRegiones(screen)
+
+# ===============================================================================
+# COMPOSICIÓN EN CACHÉ DE CAPAS ESTÁTICAS ASENTADAS
+# ===============================================================================
+# Cada nivel guarda una superficie opaca de 3840x1080 (~16 MB)
+max_capas_compuestas = 8
+
+class CompositorCapas:
+    def __init__(self, base):
+        # Superficie opaca con el fondo negro y la imagen base ya mezclados
+        self.fondo = pygame.Surface(base.get_size()).convert()
+        self.fondo.fill((0, 0, 0))
+        self.fondo.blit(base, (0, 0))
+        # pila[i] identifica la capa mezclada en niveles[i]
+        self.pila = []
+        self.niveles = []
+
+    @staticmethod
+    def asentada(capa):
+        return (capa.activa and capa.alpha == capa.max_alpha
+                and not capa.es_animada())
+
+    def actualizar(self, capas):
+        # Devuelve la superficie compuesta y las capas que aún deben mezclarse encima
+        prefijo = []
+        for capa in capas:
+            if len(prefijo) >= max_capas_compuestas or not self.asentada(capa):
+                break
+            prefijo.append((capa, capa.alpha, capa.frames[0] if capa.frames else None))
+
+        # Reconstruir solo desde la primera posición que cambió
+        primer_cambio = 0
+        while (primer_cambio < len(prefijo) and primer_cambio < len(self.pila)
+               and prefijo[primer_cambio] == self.pila[primer_cambio]):
+            primer_cambio += 1
+        if primer_cambio < len(self.pila) or primer_cambio < len(prefijo):
+            del self.niveles[primer_cambio:]
+            for capa, _, _ in prefijo[primer_cambio:]:
+                anterior = self.niveles[-1] if self.niveles else self.fondo
+                nivel = anterior.copy()
+                capa.dibujar(nivel)
+                self.niveles.append(nivel)
+            self.pila = prefijo
+            logger.info(f"Composición de capas reconstruida desde nivel {primer_cambio} "
+                        f"({len(prefijo)} capas asentadas)")
+
+        compuesta = self.niveles[-1] if self.niveles else self.fondo
+        return compuesta, capas[len(prefijo):]
+
+compositor = CompositorCapas(imagen_base)
+
+def dibujar_escena(region, compuesta, capas_encima, leyenda_surface):
+    # Con el recorte activo en la pantalla, cada blit solo toca la región pedida
+    screen.fill((0, 0, 0), region)
+    screen.blit(compuesta, (0, 0))
+    for capa in capas_encima:
+        if capa.rect_contenido is not None and capa.rect_contenido.colliderect(region):
+            capa.dibujar(screen)
+    instrumentacion.marcar(etapa_capas)
+    if leyenda_surface is not None and region.colliderect(area_leyenda):
+        dibujar_leyenda_tercer_monitor(screen, leyenda_surface)
+    if indicador_carga.superficie is not None and region.colliderect(indicador_carga.rect):
+        screen.blit(indicador_carga.superficie, indicador_carga.rect)
+    instrumentacion.marcar(etapa_leyenda)
+    if instrumentacion.superficie_overlay and region.colliderect(instrumentacion.rect_overlay):
+        screen.blit(instrumentacion.superficie_overlay, instrumentacion.rect_overlay)
+        instrumentacion.marcar(etapa_overlay)
+
+# ===============================================================================
+# PLANIFICADOR DE FRAMES (ESPERA EVENTOS CUANDO LA ESCENA ESTÁ QUIETA)
+# ===============================================================================
+# Frecuencia durante fades, y frecuencia mínima de despertar con la escena quieta
+# (0 = bloquear hasta el próximo evento)
+fps_objetivo = 30
+fps_reposo = 1
+
+class PlanificadorFrames:
+    def __init__(self, fps_objetivo, fps_reposo):
+        self.reloj = pygame.time.Clock()
+        self.fps_objetivo = fps_objetivo
+        self.intervalo_reposo = 1000 // fps_reposo if fps_reposo > 0 else None
+        self.frame_pendiente = True
+        # Tiempo mínimo entre dos redibujos de una animación (lo ajusta el gobernador de calidad)
+        self.intervalo_minimo_animacion = 0
+
+    def solicitar_frame(self):
+        self.frame_pendiente = True
+
+    def proximo_plazo(self, capas):
+        # None = sin trabajo pendiente; 0 = dibujar al ritmo objetivo
+        plazo = None
+        for capa in capas:
+            if not (capa.activa or capa.alpha > 0):
+                continue
+            if capa.en_transicion():
+                return 0
+            if capa.es_animada():
+                siguiente = capa.proximo_frame_ms(self.intervalo_minimo_animacion)
+                plazo = siguiente if plazo is None else min(plazo, siguiente)
+        return plazo
+
+    def esperar_eventos(self, capas):
+        plazo = self.proximo_plazo(capas)
+        if self.frame_pendiente or plazo == 0:
+            # Hay fades en curso: mantener el ritmo objetivo sin girar en vacío
+            self.frame_pendiente = False
+            self.reloj.tick(self.fps_objetivo)
+            return pygame.event.get()
+
+        if plazo is None:
+            espera = self.intervalo_reposo
+        else:
+            espera = max(1, plazo - pygame.time.get_ticks())
+            if self.intervalo_reposo is not None:
+                espera = min(espera, self.intervalo_reposo)
+
+        # Bloquea sin consumir CPU hasta el próximo evento o el plazo calculado
+        evento = pygame.event.wait(espera) if espera is not None else pygame.event.wait()
+        self.reloj.tick()
+        eventos = [] if evento.type == pygame.NOEVENT else [evento]
+        return eventos + pygame.event.get()
+
+# En benchmark el guion decide el límite (0 = medir sin límite)
+planificador = PlanificadorFrames(sesion_benchmark.fps_objetivo if sesion_benchmark else fps_objetivo, fps_reposo)
+
+# ===============================================================================
+# INSTRUMENTACIÓN POR ETAPAS DEL BUCLE PRINCIPAL
+# ===============================================================================
+# Con False solo se mide mientras el overlay está visible
+instrumentacion_siempre = False
+frames_historial_etapas = 600
+intervalo_resumen_etapas_s = 60
+# Shift + esta tecla muestra/oculta el overlay de tiempos
+tecla_overlay_etapas = pygame.K_F3
+
+etapas_frame = ("eventos", "fades", "capas", "leyenda", "presentar", "overlay")
+etapa_eventos, etapa_fades, etapa_capas, etapa_leyenda, etapa_presentar, etapa_overlay = range(len(etapas_frame))
+
+class InstrumentacionEtapas:
+    def __init__(self, etapas, frames_historial, medir_siempre):
+        self.etapas = etapas
+        self.frames_historial = frames_historial
+        self.medir_siempre = medir_siempre
+        # Buffer circular plano: una fila de duraciones (ms) por frame presentado
+        self.historial = array('d', bytes(8 * frames_historial * len(etapas)))
+        self.frames_registrados = 0
+        self.frames_ultimo_resumen = 0
+        self.actual = [0.0] * len(etapas)
+        self.marca = time.perf_counter()
+        self.ultimo_resumen = self.marca
+        escritor_registros.registrar_destino('etapas', ArchivoRotativo(
+            'etapas', 'csv', encabezado=['timestamp', 'frames']
+            + [f"{etapa}_prom_ms" for etapa in etapas]
+            + [f"{etapa}_max_ms" for etapa in etapas]
+            + ['peor_frame_ms']))
+        self.overlay_visible = False
+        self.superficie_overlay = None
+        self.ultimo_overlay = 0.0
+        # Fuente propia: las de obtener_fuente las usa también el hilo de leyendas
+        self.fuente = pygame.font.SysFont("Arial", 16)
+        self.alto_linea = self.fuente.get_linesize()
+        self.rect_overlay = pygame.Rect(10, 10, 420, self.alto_linea * (len(etapas) + 4) + 16)
+        self.activar(medir_siempre)
+
+    def activar(self, activa):
+        # Deshabilitada, cada punto de medición es una llamada vacía
+        self.activa = activa
+        self.comenzar_frame = self._comenzar_frame if activa else self._ignorar
+        self.marcar = self._marcar if activa else self._ignorar
+        self.terminar_frame = self._terminar_frame if activa else self._ignorar
+        self._comenzar_frame()
+
+    def _ignorar(self, *argumentos):
+        pass
+
+    def _comenzar_frame(self):
+        self.actual = [0.0] * len(self.etapas)
+        self.marca = time.perf_counter()
+
+    def _marcar(self, etapa):
+        # Asigna a la etapa el tiempo transcurrido desde la marca anterior
+        ahora = time.perf_counter()
+        self.actual[etapa] += (ahora - self.marca) * 1000
+        self.marca = ahora
+
+    def _terminar_frame(self, presentado):
+        if not presentado:
+            return
+        ancho = len(self.etapas)
+        fila = self.frames_registrados % self.frames_historial
+        self.historial[fila * ancho:(fila + 1) * ancho] = array('d', self.actual)
+        self.frames_registrados += 1
+
+        ahora = time.perf_counter()
+        if self.overlay_visible and ahora - self.ultimo_overlay >= 0.25:
+            self.superficie_overlay = self.renderizar_overlay()
+            self.ultimo_overlay = ahora
+        if ahora - self.ultimo_resumen >= intervalo_resumen_etapas_s:
+            self.escribir_resumen()
+            self.ultimo_resumen = ahora
+
+    def estadisticas(self, cantidad):
+        # (frames, promedios, máximos, peor frame) de los últimos frames registrados
+        ancho = len(self.etapas)
+        cantidad = min(cantidad, self.frames_registrados, self.frames_historial)
+        if cantidad == 0:
+            return None
+        filas = []
+        for atras in range(cantidad):
+            fila = (self.frames_registrados - 1 - atras) % self.frames_historial
+            filas.append(self.historial[fila * ancho:(fila + 1) * ancho])
+        columnas = list(zip(*filas))
+        promedios = [sum(columna) / cantidad for columna in columnas]
+        maximos = [max(columna) for columna in columnas]
+        return cantidad, promedios, maximos, max(filas, key=sum)
+
+    def alternar_overlay(self):
+        self.overlay_visible = not self.overlay_visible
+        self.superficie_overlay = None
+        self.ultimo_overlay = 0.0
+        self.activar(self.overlay_visible or self.medir_siempre)
+        logger.info(f"Overlay de tiempos por etapa {'visible' if self.overlay_visible else 'oculto'}")
+
+    def renderizar_overlay(self):
+        superficie = pygame.Surface(self.rect_overlay.size, pygame.SRCALPHA)
+        superficie.fill((0, 0, 0, 180))
+        fuente = self.fuente
+        resumen = self.estadisticas(self.frames_historial)
+        if resumen is None:
+            return superficie
+        frames, promedios, maximos, peor = resumen
+        columnas = (8, 200, 310)
+
+        def linea(y, textos, color=(255, 255, 255)):
+            for x, texto in zip(columnas, textos):
+                superficie.blit(fuente.render(texto, True, color), (x, y))
+
+        y = 8
+        linea(y, (f"Etapa ({frames} frames)", "prom ms", "máx ms"), (255, 220, 120))
+        for nombre, promedio, maximo in zip(self.etapas, promedios, maximos):
+            y += self.alto_linea
+            linea(y, (nombre, f"{promedio:.2f}", f"{maximo:.2f}"))
+        y += self.alto_linea
+        linea(y, ("total", f"{sum(promedios):.2f}", f"{sum(peor):.2f}"), (255, 220, 120))
+        y += self.alto_linea * 2
+        dominante = max(range(len(peor)), key=lambda i: peor[i])
+        linea(y, (f"Peor frame: {sum(peor):.1f} ms ({self.etapas[dominante]} {peor[dominante]:.1f} ms)",))
+        return superficie
+
+    def escribir_resumen(self):
+        # Una fila por intervalo con promedio y máximo de cada etapa
+        resumen = self.estadisticas(self.frames_registrados - self.frames_ultimo_resumen)
+        self.frames_ultimo_resumen = self.frames_registrados
+        if resumen is None:
+            return
+        frames, promedios, maximos, peor = resumen
+        escritor_registros.escribir('etapas', [datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), frames]
+                                    + [f"{valor:.3f}" for valor in promedios]
+                                    + [f"{valor:.3f}" for valor in maximos]
+                                    + [f"{sum(peor):.3f}"])
+
+instrumentacion = InstrumentacionEtapas(etapas_frame, frames_historial_etapas, instrumentacion_siempre)
+
+# ===============================================================================
+# GOBERNADOR DE CALIDAD (DEGRADACIÓN GRADUAL CUANDO NO ALCANZA EL TIEMPO)
+# ===============================================================================
+# Presupuesto de trabajo por frame (sin contar la espera de eventos) como fracción
+# del intervalo de fps_objetivo, evaluado en ventanas de frames presentados
+gobernador_calidad_activo = True
+fraccion_presupuesto_frame = 0.9
+frames_ventana_calidad = 30
+# Se recupera un nivel tras estas ventanas seguidas bajo esta fracción del presupuesto
+fraccion_holgura_calidad = 0.6
+ventanas_para_restaurar = 3
+
+niveles_calidad = [
+    {'nombre': 'completa', 'intervalo_animacion_ms': 0, 'intervalo_leyenda_ms': 0, 'max_fades_simultaneos': None},
+    {'nombre': 'reducida', 'intervalo_animacion_ms': 100, 'intervalo_leyenda_ms': 500, 'max_fades_simultaneos': 4},
+    {'nombre': 'mínima', 'intervalo_animacion_ms': 250, 'intervalo_leyenda_ms': 1500, 'max_fades_simultaneos': 2},
+]
+
+class GobernadorCalidad:
+    # Baja un nivel cuando el promedio de una ventana supera el presupuesto y
+    # sube uno cuando vuelve a haber holgura; cada nivel ajusta el planificador,
+    # el renderizador de leyendas y el tope de fades del bucle principal
+    def __init__(self, fps_objetivo, niveles, activo):
+        self.presupuesto_ms = 1000 * fraccion_presupuesto_frame / fps_objetivo if fps_objetivo > 0 else None
+        self.niveles = niveles
+        self.activo = activo and self.presupuesto_ms is not None
+        self.indice = 0
+        self.nivel = niveles[0]
+        self.tiempos = []
+        self.ventanas_con_holgura = 0
+        self.inicio_frame = time.perf_counter()
+
+    def comenzar_frame(self):
+        self.inicio_frame = time.perf_counter()
+
+    def terminar_frame(self, presentado):
+        if not (self.activo and presentado):
+            return
+        self.tiempos.append((time.perf_counter() - self.inicio_frame) * 1000)
+        if len(self.tiempos) < frames_ventana_calidad:
+            return
+        promedio = sum(self.tiempos) / len(self.tiempos)
+        self.tiempos = []
+        if promedio > self.presupuesto_ms:
+            self.ventanas_con_holgura = 0
+            if self.indice + 1 < len(self.niveles):
+                self.cambiar_nivel(self.indice + 1, promedio)
+        elif promedio < self.presupuesto_ms * fraccion_holgura_calidad and self.indice > 0:
+            self.ventanas_con_holgura += 1
+            if self.ventanas_con_holgura >= ventanas_para_restaurar:
+                self.ventanas_con_holgura = 0
+                self.cambiar_nivel(self.indice - 1, promedio)
+        else:
+            self.ventanas_con_holgura = 0
+
+    def cambiar_nivel(self, indice, promedio):
+        accion = "baja" if indice > self.indice else "sube"
+        self.indice = indice
+        self.nivel = self.niveles[indice]
+        planificador.intervalo_minimo_animacion = self.nivel['intervalo_animacion_ms']
+        renderizador_leyendas.intervalo_minimo_ms = self.nivel['intervalo_leyenda_ms']
+        max_fades = self.nivel['max_fades_simultaneos']
+        logger.info(f"Calidad {accion} a '{self.nivel['nombre']}': frame promedio {promedio:.1f} ms "
+                    f"(presupuesto {self.presupuesto_ms:.1f} ms); "
+                    f"animaciones cada {self.nivel['intervalo_animacion_ms']} ms, "
+                    f"leyenda cada {self.nivel['intervalo_leyenda_ms']} ms, "
+                    f"fades simultáneos {'sin tope' if max_fades is None else max_fades}")
+
+# En benchmark se mide siempre con calidad completa
+gobernador = GobernadorCalidad(planificador.fps_objetivo, niveles_calidad,
+                               gobernador_calidad_activo and not sesion_benchmark)
+
+# ===============================================================================
+# CONTABILIDAD DE MEMORIA (SUPERFICIES, ANIMACIONES Y SONIDOS)
+# ===============================================================================
+# Informe por activo al terminar la precarga, con Shift + tecla y cada intervalo
+intervalo_informe_memoria_s = 600
+tecla_informe_memoria = pygame.K_F4
+# Aviso si la memoria residente crece más que esto desde el informe de arranque
+# (se repite por cada umbral adicional); se revisa cada intervalo_revision_rss_s
+umbral_crecimiento_rss_mb = 512
+intervalo_revision_rss_s = 30
+
+def bytes_superficie(superficie):
+    return superficie.get_pitch() * superficie.get_height()
+
+def memoria_residente_bytes():
+    # Memoria residente del proceso; None si no se puede leer
+    return AURORA_MEMORIA.memoria_proceso()[0]
+
+class ContabilidadMemoria:
+    def __init__(self):
+        self.informe_arranque = False
+        self.rss_referencia = None
+        self.proximo_aviso_rss = None
+        self.ultimo_informe = time.perf_counter()
+        self.ultima_revision_rss = self.ultimo_informe
+
+    @staticmethod
+    def partidas():
+        # (categoría, activo, bytes) de todo lo que retiene memoria de imagen o audio
+        partidas = [('fondo', 'BASE.png', bytes_superficie(imagen_base))]
+        for capa in registro_capas.capas:
+            if capa.frames:
+                categoria = 'gif' if capa.animacion else 'teselas' if capa.teselas else 'capa'
+                partidas.append((categoria, capa.nombre, capa.bytes_en_memoria()))
+        partidas.append(('composición', f"{len(compositor.niveles)} niveles + fondo",
+                         sum(bytes_superficie(nivel) for nivel in [compositor.fondo] + compositor.niveles)))
+        for ruta, (_, tam) in gestor_audio.sonidos.items():
+            partidas.append(('sonido', os.path.basename(ruta), tam))
+        for ruta, pcm in gestor_audio.fuentes_stream.items():
+            partidas.append(('streaming', os.path.basename(ruta), len(pcm)))
+        # El hilo de leyendas modifica la caché y el atlas: solo se leen copias
+        leyendas_guardadas, bytes_leyendas = cache_leyendas.resumen()
+        partidas.append(('leyenda', f"caché ({leyendas_guardadas} leyendas)", bytes_leyendas))
+        superficies_atlas = atlas_leyenda.superficies()
+        partidas.append(('leyenda', f"atlas ({len(superficies_atlas)} superficies)",
+                         sum(bytes_superficie(superficie) for superficie in superficies_atlas)))
+        return [partida for partida in partidas if partida[2] > 0]
+
+    def informar(self, motivo):
+        self.ultimo_informe = time.perf_counter()
+        partidas = self.partidas()
+        totales = {}
+        for categoria, _, tam in partidas:
+            totales[categoria] = totales.get(categoria, 0) + tam
+        rss = memoria_residente_bytes()
+        texto_rss = f"; proceso {rss / 1048576:.0f} MB residentes" if rss is not None else ""
+        logger.info(f"Memoria ({motivo}): {sum(totales.values()) / 1048576:.1f} MB en activos{texto_rss} - "
+                    + ", ".join(f"{categoria} {tam / 1048576:.1f} MB"
+                                for categoria, tam in sorted(totales.items(), key=lambda t: -t[1])))
+        for categoria, nombre, tam in sorted(partidas, key=lambda partida: -partida[2]):
+            logger.info(f"  {categoria:<12} {tam / 1048576:7.1f} MB  {nombre}")
+        self.revisar_rss(rss)
+
+    def revisar_rss(self, rss):
+        self.ultima_revision_rss = time.perf_counter()
+        if rss is None or not self.informe_arranque:
+            return
+        if self.rss_referencia is None:
+            self.rss_referencia = rss
+            self.proximo_aviso_rss = rss + umbral_crecimiento_rss_mb * 1048576
+        elif rss >= self.proximo_aviso_rss:
+            logger.warning(f"La memoria residente creció {(rss - self.rss_referencia) / 1048576:.0f} MB "
+                           f"desde el arranque ({rss / 1048576:.0f} MB en total)")
+            while self.proximo_aviso_rss <= rss:
+                self.proximo_aviso_rss += umbral_crecimiento_rss_mb * 1048576
+
+    def revisar(self):
+        # Una vez por vuelta del bucle principal
+        ahora = time.perf_counter()
+        if not self.informe_arranque and cargador_capas.precarga_terminada:
+            self.informe_arranque = True
+            self.informar("arranque")
+        elif ahora - self.ultimo_informe >= intervalo_informe_memoria_s:
+            self.informar("periódico")
+        elif ahora - self.ultima_revision_rss >= intervalo_revision_rss_s:
+            self.revisar_rss(memoria_residente_bytes())
+
+contabilidad_memoria = ContabilidadMemoria()
+
+# ===============================================================================
+# MÉTRICAS PARA PROMETHEUS (ENDPOINT HTTP LOCAL OPCIONAL)
+# ===============================================================================
+# Puerto del endpoint /metrics (None lo desactiva); se revisa con
+# python AURORA_METRICAS.py leer --url http://127.0.0.1:9108/metrics
+puerto_metricas = None
+direccion_metricas = '127.0.0.1'
+# Límites (s) de las cubetas del histograma de trabajo por frame
+limites_histograma_frame_s = [0.005, 0.010, 0.016, 0.025, 0.033, 0.050, 0.100, 0.250, 0.500, 1.0]
+
+class MetricasAplicacion:
+    # El bucle principal anota bajo el candado y el servidor arma el texto en
+    # su propio hilo con una copia tomada bajo el mismo candado
+    def __init__(self, limites_frame):
+        self.candado = threading.Lock()
+        self.limites_frame = limites_frame
+        self.cuentas_frame = [0] * (len(limites_frame) + 1)
+        self.suma_frame = 0.0
+        self.frames_presentados = 0
+        self.fps = 0.0
+        self.inicio_ventana_fps = time.perf_counter()
+        self.frames_ventana_fps = 0
+        self.inicio_frame = self.inicio_ventana_fps
+        self.capas_activas = 0
+        self.capas_en_fade = 0
+        self.activaciones_capa = {}
+        self.activaciones_jugador = {}
+        self.reinicios = 0
+        self.servidor = None
+
+    def iniciar_servidor(self, direccion, puerto):
+        self.servidor = AURORA_METRICAS.ServidorMetricas(direccion, puerto, self.familias)
+        logger.info(f"Métricas disponibles en http://{direccion}:{puerto}/metrics")
+
+    def comenzar_frame(self):
+        self.inicio_frame = time.perf_counter()
+
+    def terminar_frame(self, presentado, capas):
+        ahora = time.perf_counter()
+        activas = sum(1 for capa in capas if capa.activa)
+        en_fade = sum(1 for capa in capas if capa.en_transicion())
+        with self.candado:
+            self.capas_activas = activas
+            self.capas_en_fade = en_fade
+            if presentado:
+                duracion = ahora - self.inicio_frame
+                self.cuentas_frame[bisect.bisect_left(self.limites_frame, duracion)] += 1
+                self.suma_frame += duracion
+                self.frames_presentados += 1
+                self.frames_ventana_fps += 1
+            if ahora - self.inicio_ventana_fps >= 1.0:
+                self.fps = self.frames_ventana_fps / (ahora - self.inicio_ventana_fps)
+                self.frames_ventana_fps = 0
+                self.inicio_ventana_fps = ahora
+
+    def registrar_activacion(self, jugador, clave_capa):
+        with self.candado:
+            self.activaciones_capa[clave_capa] = self.activaciones_capa.get(clave_capa, 0) + 1
+            self.activaciones_jugador[jugador] = self.activaciones_jugador.get(jugador, 0) + 1
+
+    def registrar_reinicio(self):
+        with self.candado:
+            self.reinicios += 1
+
+    def familias(self):
+        # En el hilo del servidor: solo lee copias y valores sueltos
+        with self.candado:
+            cuentas_frame = list(self.cuentas_frame)
+            suma_frame = self.suma_frame
+            frames_presentados = self.frames_presentados
+            fps = self.fps
+            capas_activas = self.capas_activas
+            capas_en_fade = self.capas_en_fade
+            activaciones_capa = dict(self.activaciones_capa)
+            activaciones_jugador = dict(self.activaciones_jugador)
+            reinicios = self.reinicios
+        familias = [
+            ('aurora_fps', 'gauge', "Frames presentados por segundo en el último segundo", [('', {}, fps)]),
+            ('aurora_frames_presentados_total', 'counter', "Frames presentados desde el inicio",
+             [('', {}, frames_presentados)]),
+            ('aurora_trabajo_frame_segundos', 'histogram',
+             "Trabajo del bucle por frame presentado, sin la espera de eventos",
+             AURORA_METRICAS.muestras_histograma(self.limites_frame, cuentas_frame, suma_frame)),
+            ('aurora_capas_activas', 'gauge', "Capas activadas por los visitantes", [('', {}, capas_activas)]),
+            ('aurora_capas_en_fade', 'gauge', "Capas con un fade en curso", [('', {}, capas_en_fade)]),
+            ('aurora_activaciones_capa_total', 'counter', "Activaciones por capa",
+             [('', {'capa': nombre}, cuenta) for nombre, cuenta in sorted(activaciones_capa.items())]),
+            ('aurora_activaciones_jugador_total', 'counter', "Activaciones por jugador",
+             [('', {'jugador': jugador}, cuenta) for jugador, cuenta in sorted(activaciones_jugador.items())]),
+            ('aurora_reinicios_total', 'counter', "Pulsaciones del botón de reinicio", [('', {}, reinicios)]),
+            ('aurora_lineas_registro_pendientes', 'gauge', "Líneas de registro encoladas sin escribir",
+             [('', {}, escritor_registros.cola.qsize())]),
+            ('aurora_nivel_calidad', 'gauge', "Nivel del gobernador de calidad (0 = completa)",
+             [('', {}, gobernador.indice)]),
+            ('aurora_memoria_capas_bytes', 'gauge', "Bytes de frames de capas cargadas",
+             [('', {}, gestor_capas.bytes_usados)]),
+            ('aurora_memoria_sonidos_bytes', 'gauge', "Bytes de sonidos decodificados en memoria",
+             [('', {}, gestor_audio.bytes_usados)]),
+        ]
+        rss = memoria_residente_bytes()
+        if rss is not None:
+            familias.append(('aurora_memoria_residente_bytes', 'gauge', "Memoria residente del proceso",
+                             [('', {}, rss)]))
+        return familias
+
+metricas = None
+if puerto_metricas is not None:
+    metricas = MetricasAplicacion(limites_histograma_frame_s)
+    try:
+        metricas.iniciar_servidor(direccion_metricas, puerto_metricas)
+    except OSError as e:
+        logger.error(f"No se pudo abrir el endpoint de métricas en el puerto {puerto_metricas}: {e}")
+        metricas = None
+
+# ===============================================================================
+# RECARGA EN CALIENTE DE CONFIGURACIÓN, IMÁGENES Y SONIDOS
+# ===============================================================================
+# Cada cuánto se revisan los archivos vigilados, y cuánto debe quedar quieto un
+# archivo antes de recargarlo (los editores suelen guardar en varias escrituras)
+intervalo_vigilancia_s = 1.0
+espera_estabilidad_s = 1.0
+extensiones_imagenes = ('.png', '.gif', '.jpg', '.jpeg')
+extensiones_sonidos = ('.mp3', '.wav', '.ogg')
+
+# Evento con el que el vigilante avisa al bucle que un archivo cambió, apareció
+# o desapareció (atributos ruta y directorio, None si se vigila el archivo solo)
+evento_archivo_modificado = pygame.event.custom_type()
+
+class VigilanteArchivos:
+    # Revisa por sondeo la fecha y el tamaño de cada archivo registrado y de
+    # los archivos de cada directorio registrado; la recarga ocurre siempre en
+    # el bucle principal, nunca en este hilo
+    def __init__(self, intervalo, espera):
+        self.intervalo = intervalo
+        self.espera = espera
+        self.cerrojo = threading.Lock()
+        # ruta -> firma ya notificada (None = el archivo no existe)
+        self.firmas = {}
+        # directorio -> extensiones de los archivos a vigilar en él
+        self.directorios = {}
+        # ruta -> directorio vigilado al que pertenece
+        self.origen = {}
+        # ruta -> (firma nueva, instante en que se vio por primera vez)
+        self.pendientes = {}
+        self.hilo = threading.Thread(target=self.ejecutar, name="VigilanteArchivos", daemon=True)
+        self.hilo.start()
+
+    @staticmethod
+    def firma(ruta):
+        try:
+            estado = os.stat(ruta)
+        except OSError:
+            return None
+        return (estado.st_mtime_ns, estado.st_size)
+
+    @staticmethod
+    def listar(directorio, extensiones):
+        # ruta -> firma; en Windows scandir ya trae el stat sin otra llamada al sistema
+        firmas = {}
+        try:
+            with os.scandir(directorio) as entradas:
+                for entrada in entradas:
+                    if not entrada.name.lower().endswith(extensiones):
+                        continue
+                    try:
+                        if entrada.is_file():
+                            estado = entrada.stat()
+                            firmas[entrada.path] = (estado.st_mtime_ns, estado.st_size)
+                    except OSError:
+                        continue
+        except OSError:
+            pass
+        return firmas
+
+    def vigilar(self, ruta):
+        with self.cerrojo:
+            self.firmas[ruta] = self.firma(ruta)
+
+    def vigilar_directorio(self, directorio, extensiones):
+        firmas = self.listar(directorio, extensiones)
+        with self.cerrojo:
+            self.directorios[directorio] = extensiones
+            for ruta, firma in firmas.items():
+                self.firmas[ruta] = firma
+                self.origen[ruta] = directorio
+
+    def ejecutar(self):
+        while True:
+            time.sleep(self.intervalo)
+            with self.cerrojo:
+                conocidas = dict(self.firmas)
+                directorios = list(self.directorios.items())
+            actuales = {}
+            for directorio, extensiones in directorios:
+                for ruta, firma in self.listar(directorio, extensiones).items():
+                    actuales[ruta] = firma
+                    self.origen.setdefault(ruta, directorio)
+            ahora = time.monotonic()
+            for ruta in set(conocidas) | set(actuales):
+                firma = actuales[ruta] if ruta in actuales else self.firma(ruta)
+                if firma == conocidas.get(ruta):
+                    self.pendientes.pop(ruta, None)
+                    continue
+                pendiente = self.pendientes.get(ruta)
+                if pendiente is None or pendiente[0] != firma:
+                    self.pendientes[ruta] = (firma, ahora)
+                elif ahora - pendiente[1] >= self.espera:
+                    del self.pendientes[ruta]
+                    with self.cerrojo:
+                        self.firmas[ruta] = firma
+                    pygame.event.post(pygame.event.Event(
+                        evento_archivo_modificado, ruta=ruta, directorio=self.origen.get(ruta)))
+
+# Evento con el que el hilo de recarga avisa que una imagen ya se decodificó
+evento_activo_decodificado = pygame.event.custom_type()
+
+class RecargadorActivos:
+    # Decodifica en un hilo aparte solo las imágenes que cambiaron; el cambio
+    # de frames se hace en el bucle principal, entre dos frames, y no toca el
+    # fade, la activación ni el orden de las capas. Los sonidos los recarga
+    # gestor_audio, que ya los decodifica bajo demanda
+    def __init__(self):
+        self.pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="RecargaActivos")
+        # ruta -> último pedido; el resultado de un pedido más viejo se descarta
+        self.pedidos = {}
+
+    def pedir(self, ruta):
+        futuro = self.pool.submit(obtener_datos_imagen, ruta, 3840, 1080)
+        self.pedidos[ruta] = futuro
+        futuro.add_done_callback(lambda terminado: pygame.event.post(pygame.event.Event(
+            evento_activo_decodificado, ruta=ruta, futuro=terminado)))
+
+    def imagen_modificada(self, ruta):
+        archivo = os.path.basename(ruta)
+        if not any(capa.frames for capa in registro_capas.por_archivo.get(archivo, [])):
+            # Sin capas en memoria que la usen: se leerá del disco al activarse
+            logger.info(f"Imagen modificada en disco: {archivo} (ninguna capa cargada la usa)")
+            return
+        if not os.path.exists(ruta):
+            logger.warning(f"Imagen eliminada del disco: {archivo}; se mantiene la versión en memoria")
+            return
+        logger.info(f"Imagen modificada en disco: {archivo}; recargando")
+        self.pedir(ruta)
+
+    def aplicar(self, evento):
+        if self.pedidos.get(evento.ruta) is not evento.futuro:
+            return
+        del self.pedidos[evento.ruta]
+        error = evento.futuro.exception()
+        if error is not None:
+            logger.error(f"Error al recargar {evento.ruta}: {error}; se mantiene la versión en memoria")
+            return
+        self.aplicar_imagen(evento.ruta, evento.futuro)
+
+    def aplicar_imagen(self, ruta, futuro):
+        # Cada capa recibe sus propias superficies (el lienzo de un GIF se modifica al avanzar)
+        for capa in registro_capas.por_archivo.get(os.path.basename(ruta), []):
+            if not capa.frames:
+                continue
+            rect_anterior = capa.rect_contenido
+            capa.reemplazar_frames(cargar_imagen_escalada(ruta, 3840, 1080, futuro))
+            gestor_capas.actualizar_tamano(capa)
+            renderizador.marcar(rect_anterior)
+            renderizador.marcar(capa.rect_contenido)
+            logger.info(f"Capa '{capa.nombre}' actualizada con la nueva versión de {os.path.basename(ruta)}")
+
+def recargar_configuracion_capas():
+    # Solo se recrean las capas cuya configuración cambió; las que siguen con
+    # el mismo archivo conservan sus frames y su estado en pantalla
+    global registro_capas, imagenes_con_fade, mapeo_capas, imagen_reinicio
+    try:
+        configuracion = AURORA_CAPAS.cargar_configuracion(ruta_configuracion_capas)
+    except ValueError as e:
+        logger.error(f"{e}\nSe mantiene la configuración anterior")
+        return
+    anterior = registro_capas
+    nuevo = compilar_registro_capas(configuracion, anterior)
+    conservadas = set(nuevo.capas)
+    recreadas = eliminadas = 0
+    for capa in anterior.capas:
+        if capa in conservadas:
+            continue
+        reemplazo = nuevo.por_identidad.get(capa.identidad)
+        if reemplazo is not None:
+            gestor_capas.reemplazar(capa, reemplazo)
+            recreadas += 1
+        else:
+            capa.detener_sonido()
+            gestor_capas.olvidar(capa)
+            eliminadas += 1
+    nuevas = sum(1 for capa in nuevo.capas if capa.identidad not in anterior.por_identidad)
+
+    registro_capas = nuevo
+    imagenes_con_fade = nuevo.capas
+    mapeo_capas = nuevo.por_boton
+    imagen_reinicio = nuevo.reinicio
+    renderizador_leyendas.invalidar()
+    renderizador.marcar_todo()
+    logger.info(f"Configuración de capas recargada: {len(nuevo.capas)} capas "
+                f"({recreadas} modificadas, {nuevas} nuevas, {eliminadas} eliminadas)")
+
+vigilante_archivos = VigilanteArchivos(intervalo_vigilancia_s, espera_estabilidad_s)
+vigilante_archivos.vigilar(ruta_configuracion_capas)
+vigilante_archivos.vigilar_directorio(ruta_imagenes, extensiones_imagenes)
+vigilante_archivos.vigilar_directorio(ruta_sonidos, extensiones_sonidos)
+vigilante_archivos.vigilar_directorio(ruta_voz_off, extensiones_sonidos)
+recargador_activos = RecargadorActivos()
+
+# ===============================================================================
+# ENTRADA DE BOTONES POR RED LOCAL (TABLETAS Y MANTENIMIENTO)
+# ===============================================================================
+# Puerto UDP de las pulsaciones remotas (None lo desactiva; AURORA_RED.py usa 9109
+# por omisión). Fuera de 127.0.0.1 se exige clave_entrada_red, y los mensajes
+# sin esa clave se descartan sin respuesta
+puerto_entrada_red = None
+direccion_entrada_red = '0.0.0.0'
+clave_entrada_red = None
+
+def recibir_pulsacion_red(mensaje, origen, recibido):
+    # En el hilo de red: la misma pulsación sintética que usa el benchmark, con
+    # los datos para confirmarla y medir la latencia
+    pygame.event.post(pygame.event.Event(
+        pygame.JOYBUTTONDOWN, instance_id=-1, joy=-1, button=mensaje['boton'], jugador=mensaje['jugador'],
+        secuencia=mensaje['secuencia'], enviado=mensaje.get('enviado'), recibido=recibido, origen=origen))
+
+def rechazar_pulsacion_red(origen, motivo):
+    logger.warning(f"Mensaje de red rechazado de {origen[0]}: {motivo}")
+
+def confirmar_pulsacion_red(evento, asignada):
+    # En el bucle principal, recién aplicada la pulsación
+    ahora = time.time()
+    espera_ms = (ahora - evento.recibido) * 1000
+    servidor_entrada_red.responder(evento.origen, {
+        'secuencia': evento.secuencia, 'resultado': 'aplicado' if asignada else 'sin asignar',
+        'espera_ms': round(espera_ms, 2)})
+    # Desde el envío solo es comparable si los relojes de ambos equipos están sincronizados
+    desde_envio = f", {(ahora - evento.enviado) * 1000:.1f} ms desde el envío" if evento.enviado else ""
+    logger.info(f"Pulsación por red de {evento.origen[0]} #{evento.secuencia}: jugador {evento.jugador} "
+                f"botón {evento.button} ({espera_ms:.1f} ms en cola{desde_envio})")
+
+servidor_entrada_red = None
+if puerto_entrada_red is not None and clave_entrada_red is None and not direccion_entrada_red.startswith('127.'):
+    # Cualquier equipo de la red podría activar capas en el kiosco
+    logger.error(f"Entrada por red desactivada: escuchar en {direccion_entrada_red}:{puerto_entrada_red} "
+                 f"exige clave_entrada_red (sin clave solo se admite 127.0.0.1)")
+elif puerto_entrada_red is not None:
+    try:
+        servidor_entrada_red = AURORA_RED.ServidorEntradaRed(
+            direccion_entrada_red, puerto_entrada_red, recibir_pulsacion_red,
+            clave_entrada_red, rechazar_pulsacion_red)
+        logger.info(f"Entrada por red escuchando en UDP {direccion_entrada_red}:{puerto_entrada_red}")
+    except OSError as e:
+        logger.error(f"No se pudo abrir la entrada por red en el puerto {puerto_entrada_red}: {e}")
 
 # ===============================================================================
 # BUCLE PRINCIPAL
@@ -813,9 +2814,27 @@ running = True
 estado_sonidos_teclas = {tecla: False for tecla in teclas_sonidos.keys()}
 
 logger.info("Inicio de sesión")
+registrar_fase_arranque("listo para recibir pulsaciones")
+# Con la escena ya visible, dejar en la caché de audio los clips que aún no estén
+gestor_audio.calentar(sorted({clip.ruta for clip in gestor_audio.clips.values() if os.path.exists(clip.ruta)}))
+
+if sesion_benchmark:
+    sesion_benchmark.iniciar(
+        lambda jugador, boton: pygame.event.post(pygame.event.Event(
+            pygame.JOYBUTTONDOWN, instance_id=-1, joy=-1, button=boton, jugador=jugador)),
+        lambda: pygame.event.post(pygame.event.Event(pygame.QUIT))
+    )
 
 while running:
-    for event in pygame.event.get():
+    eventos = planificador.esperar_eventos(imagenes_con_fade)
+    if sesion_benchmark:
+        sesion_benchmark.comenzar_frame()
+    instrumentacion.comenzar_frame()
+    gobernador.comenzar_frame()
+    if metricas:
+        metricas.comenzar_frame()
+
+    for event in eventos:
         if event.type == pygame.QUIT:
             logger.info("Fin de sesión")
             running = False
@@ -825,13 +2844,12 @@ while running:
             joystick_id = event.instance_id
             button = event.button
             
-            # Buscar el joystick que generó el evento
-            for i, joy in enumerate(joysticks):
-                if joy.get_instance_id() == joystick_id:
-                    jugador = i + 1  # Jugadores 1,2,3
-                    break
-            else:
-                continue
+            # Los eventos sintéticos del benchmark ya indican el jugador
+            jugador = getattr(event, 'jugador', None)
+            if jugador is None:
+                jugador = jugador_por_instancia.get(joystick_id)
+                if jugador is None:
+                    continue
                 
             # Calcular clave
             clave = (jugador, button)
@@ -843,44 +2861,63 @@ while running:
                     # Manejo especial para reinicio
                     if capa.es_reinicio:
                         logger.info(f"Jugador {jugador} botón {button}: REINICIO")
-                        log_evento_csv(jugador, button, "reinicio", capa.nombre)
+                        log_evento_csv(jugador, button, "reinicio", capa)
+                        if metricas:
+                            metricas.registrar_reinicio()
                         
                         # Desactivar todas las capas excepto reinicio
                         for c in imagenes_con_fade:
                             if not c.es_reinicio and c.activa:
-                                log_evento_csv(jugador, button, "desactivar", c.nombre)
+                                log_evento_csv(jugador, button, "desactivar", c)
                                 c.activa = False
                         # Activar capa de reinicio
                         if not capa.activa:
-                            log_evento_csv(jugador, button, "activar", capa.nombre)
+                            log_evento_csv(jugador, button, "activar", capa)
+                        preparar_activacion(capa)
                         capa.activa = True
                         capa.orden = orden_activacion + 1
                     else:
                         # Desactivar pantalla de reinicio si se activa otra capa
                         if imagen_reinicio and imagen_reinicio.activa:
                             logger.info("Desactivando pantalla de reinicio")
-                            log_evento_csv(jugador, button, "desactivar", imagen_reinicio.nombre)
+                            log_evento_csv(jugador, button, "desactivar", imagen_reinicio)
                             imagen_reinicio.activa = False
                             
                         # Toggle de la capa normal
                         if not capa.activa:
+                            preparar_activacion(capa)
                             orden_activacion += 1
                             capa.orden = orden_activacion
                             logger.info(f"Jugador {jugador} botón {button}: ACTIVAR {capa.nombre}")
-                            log_evento_csv(jugador, button, "activar", capa.nombre)
+                            log_evento_csv(jugador, button, "activar", capa)
+                            if metricas:
+                                metricas.registrar_activacion(jugador, AURORA_ANALISIS.clave_capa(capa.nombre, capa.archivo))
                         else:
                             logger.info(f"Jugador {jugador} botón {button}: DESACTIVAR {capa.nombre}")
-                            log_evento_csv(jugador, button, "desactivar", capa.nombre)
+                            log_evento_csv(jugador, button, "desactivar", capa)
                         capa.activa = not capa.activa
             else:
                 logger.warning(f"Botón no asignado: Jugador {jugador}, Botón {button}")
 
+            # Pulsación llegada por red: confirmar al remitente
+            if getattr(event, 'secuencia', None) is not None and servidor_entrada_red:
+                confirmar_pulsacion_red(event, clave in mapeo_capas)
+
         # Manejo de teclado para sonidos
         elif event.type == pygame.KEYDOWN:
             # Salir con Shift+ESC
             if event.key == pygame.K_ESCAPE and pygame.key.get_mods() & pygame.KMOD_SHIFT:
                 logger.info("Fin de sesión (Shift+ESC)")
                 running = False
+
+            # Mostrar/ocultar el overlay de tiempos por etapa
+            elif event.key == tecla_overlay_etapas and pygame.key.get_mods() & pygame.KMOD_SHIFT:
+                instrumentacion.alternar_overlay()
+                renderizador.marcar(instrumentacion.rect_overlay)
+
+            # Informe de memoria por activo en el registro
+            elif event.key == tecla_informe_memoria and pygame.key.get_mods() & pygame.KMOD_SHIFT:
+                contabilidad_memoria.informar("a pedido")
             
             # Reproducir/detener sonidos de teclas
             elif event.key in sonidos_teclas and sonidos_teclas[event.key]:
@@ -895,34 +2932,105 @@ while running:
                     estado_sonidos_teclas[event.key] = True
                     logger.info(f"Reproduciendo sonido de tecla: {event.key}")
 
-    # Limpiar pantalla
-    screen.fill((0, 0, 0))
-    
-    # Dibujar imagen base
-    screen.blit(imagen_base, (0, 0))
+        # La ventana fue cubierta o restaurada: redibujar todo
+        elif event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+            renderizador.marcar_todo()
+
+        # Un archivo vigilado cambió en disco
+        elif event.type == evento_archivo_modificado:
+            if event.ruta == ruta_configuracion_capas:
+                recargar_configuracion_capas()
+            elif event.directorio == ruta_imagenes:
+                recargador_activos.imagen_modificada(event.ruta)
+            elif event.directorio in (ruta_sonidos, ruta_voz_off):
+                gestor_audio.archivo_modificado(event.ruta)
+
+        # El cargador de capas entregó una capa decodificada
+        elif event.type == evento_capa_decodificada:
+            cargador_capas.aplicar(event)
+
+        # El historial de activaciones ya se leyó: se reordena la precarga
+        elif event.type == evento_historial_leido:
+            aplicar_historial_activaciones(event)
+
+        # Terminó de decodificarse una imagen modificada
+        elif event.type == evento_activo_decodificado:
+            recargador_activos.aplicar(event)
+
+        # Audio: clip decodificado, o fragmento terminado en un canal en streaming
+        elif event.type == evento_audio_decodificado:
+            gestor_audio.aplicar(event)
+        elif event.type == evento_fragmento_terminado:
+            gestor_audio.alimentar_streams()
 
-    # Obtener capas activas
+    instrumentacion.marcar(etapa_eventos)
+
+    # Obtener capas activas (las que aún se están cargando esperan fuera de la escena)
     imagenes_activas = sorted(
-        [capa for capa in imagenes_con_fade if (capa.activa or capa.alpha > 0)],
+        [capa for capa in imagenes_con_fade if (capa.activa or capa.alpha > 0) and not capa.cargando],
         key=lambda x: x.orden
     )
 
-    # Actualizar y dibujar capas
+    # Actualizar fades y animaciones según el tiempo transcurrido
+    ahora = pygame.time.get_ticks()
+    fades_libres = gobernador.nivel['max_fades_simultaneos']
     for capa in imagenes_activas:
-        if capa.activa:
-            capa.fade_in()
+        if fades_libres == 0 and capa.en_transicion():
+            # Tope del gobernador de calidad: este fade espera a que termine otro
+            capa.pausar_fade()
         else:
-            capa.fade_out()
-        capa.dibujar(screen)
+            if fades_libres is not None and capa.en_transicion():
+                fades_libres -= 1
+            if capa.activa:
+                capa.fade_in(ahora)
+            else:
+                capa.fade_out(ahora)
+        capa.actualizar_animacion(ahora, gobernador.nivel['intervalo_animacion_ms'])
 
-    # Dibujar leyenda en el tercer monitor
-    if not (imagen_reinicio and imagen_reinicio.activa):
-        dibujar_leyenda_tercer_monitor(screen, [c for c in imagenes_activas if not c.es_reinicio])
+    instrumentacion.marcar(etapa_fades)
 
-    pygame.display.flip()
-    pygame.time.delay(30)
+    # Leyenda en el tercer monitor
+    capas_leyenda = []
+    if not (imagen_reinicio and imagen_reinicio.activa):
+        capas_leyenda = [c for c in imagenes_activas if not c.es_reinicio]
+    clave_leyenda = CacheLeyendas.clave(capas_leyenda) if capas_leyenda else None
+    if not renderizador_leyendas.solicitar(clave_leyenda, capas_leyenda):
+        # Pospuesta por el gobernador de calidad: reintentar en el próximo frame
+        planificador.solicitar_frame()
+    # Una sola lectura por frame: el hilo puede reemplazarla en cualquier momento
+    _, leyenda_surface = renderizador_leyendas.lista
+
+    # Aviso de capas pedidas que todavía se están cargando
+    if indicador_carga.actualizar([c for c in imagenes_con_fade if c.cargando and c.activa]):
+        renderizador.marcar(indicador_carga.rect)
+
+    # Redibujar solo las regiones que cambiaron
+    renderizador.registrar_estado(imagenes_con_fade, leyenda_surface)
+    compuesta, capas_encima = compositor.actualizar(imagenes_activas)
+    if instrumentacion.overlay_visible:
+        renderizador.marcar(instrumentacion.rect_overlay)
+    instrumentacion.marcar(etapa_capas)
+    presentado = renderizador.presentar(lambda region: dibujar_escena(region, compuesta, capas_encima, leyenda_surface))
+    instrumentacion.marcar(etapa_presentar)
+    instrumentacion.terminar_frame(presentado)
+    gobernador.terminar_frame(presentado)
+    contabilidad_memoria.revisar()
+    if metricas:
+        metricas.terminar_frame(presentado, imagenes_con_fade)
+    if sesion_benchmark:
+        sesion_benchmark.terminar_frame(presentado)
 
 # Finalización
+if instrumentacion.activa:
+    instrumentacion.escribir_resumen()
+if metricas:
+    metricas.servidor.cerrar()
+if servidor_entrada_red:
+    servidor_entrada_red.cerrar()
+if sesion_benchmark:
+    sesion_benchmark.guardar()
+    logger.info(f"Resultados del benchmark guardados en {sesion_benchmark.guion['salida']}")
 logger.info("Sesión finalizada")
+escritor_registros.cerrar()
 pygame.quit()
 sys.exit()
\ No newline at end of file